@@ -1,7 +1,9 @@
 import os
+from .services.startup import report, warm_up, WARMUP
 from flask import Flask, jsonify
 from flask_cors import CORS
-from .extensions import mail, bcrypt, mongo
+from .extensions import mail, mongo
+from .services import mongo_ops
 
 
 def create_app():
@@ -15,9 +17,13 @@ def create_app():
     origins = {frontend_origin}
     # Add common localhost variants for Vite
     origins.update({'http://localhost:5173', 'http://127.0.0.1:5173', 'http://localhost:3000', 'http://127.0.0.1:3000'})
+    # The frontend revalidates analytics POSTs itself (If-None-Match) and reads the export
+    # row count, validators and ranges from responses
     CORS(app,
          supports_credentials=True,
-         resources={r"/api/*": {"origins": list(origins), "allow_headers": ["Content-Type", "Authorization"]}})
+         resources={r"/api/*": {"origins": list(origins),
+                                "allow_headers": ["Content-Type", "Authorization", "If-None-Match"],
+                                "expose_headers": ["X-Row-Count", "ETag", "Content-Range"]}})
 
     # Mail
     app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
@@ -31,20 +37,51 @@ def create_app():
     app.config['MONGO_URI'] = os.getenv('MONGO_URI', 'mongodb://localhost:27017/esg_analytics')
 
     # Init extensions
-    mail.init_app(app)
-    bcrypt.init_app(app)
-    mongo.init_app(app)
+    with report.phase('extensions'):
+        mail.init_app(app)
+        mongo.init_app(app, event_listeners=[mongo_ops.listener])
+        mongo_ops.init_app(app)
 
     # Blueprints
-    from .auth.routes import auth_bp
-    from .analytics.routes import analytics_bp
+    with report.phase('blueprints'):
+        from .auth.routes import auth_bp
+        from .analytics.routes import analytics_bp
+        from .jobs.routes import jobs_bp
 
-    app.register_blueprint(auth_bp, url_prefix='/api/auth')
-    app.register_blueprint(analytics_bp, url_prefix='/api')
+        app.register_blueprint(auth_bp, url_prefix='/api/auth')
+        app.register_blueprint(analytics_bp, url_prefix='/api')
+        app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
+
+    # Background job workers (started lazily in each worker process)
+    from .services import jobs
+    jobs.init_app(app)
+
+    # Background email delivery from the mail_outbox collection
+    from .services import mail_outbox
+    mail_outbox.init_app(app)
+
+    # Indexes and data migrations: `flask --app app migrate`, or a background thread
+    from .services import migrations
+    migrations.init_app(app)
+
+    # Prime the bundled dataset, scoring model etc. before the first request
+    if WARMUP:
+        with report.phase('warmup'):
+            warm_up(app)
+    report.mark_ready()
+    app.logger.info('Startup report: %s', report.as_dict())
+
+    @app.before_request
+    def _first_request():
+        report.mark_request()
 
     # Health
     @app.get('/api/health')
     def health():
         return jsonify({'status': 'healthy'}), 200
 
+    @app.get('/api/health/startup')
+    def startup_report():
+        return jsonify(report.as_dict()), 200
+
     return app
@@ -1,137 +1,121 @@
-from flask import Blueprint, request, jsonify
+from functools import wraps
+from flask import Blueprint, Response, request, jsonify, make_response
 from ..services.tokens import auth_required
 from ..extensions import mongo
-import pandas as pd
-import numpy as np
+from ..services.dataset_cache import dataset_cache, dataset_version, invalidate_user
+from ..services.pagination import paginate
+from ..services.result_cache import result_cache
+from ..services.prediction_cache import prediction_cache
+from ..services import streaming, model_client, jobs, scoring, prediction_search, users
 from datetime import datetime
 import os
+import time
+from itertools import islice
 from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
 
 analytics_bp = Blueprint('analytics', __name__)
 
 
-# Load dataset (in-memory cache)
-_df = None
+def cached_result(f):
+    """Serve an analytics response from the result cache, with ETag / If-None-Match support.
 
-
-def load_data():
-    global _df
-    if _df is not None:
-        return _df
-    # Try to load from data/ folder (repo root relative)
-    # Inside container: /app/app/analytics/... -> repo root is three parents up (/app)
-    repo_root_from_container = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-    # Local dev (working inside backend/): repo root is one level above backend/
-    repo_root_from_backend = os.path.abspath(os.path.join(repo_root_from_container, '..'))
-    candidates = [
-        os.path.join(repo_root_from_container, 'data', 'esg_financial_dataset.csv'),
-        os.path.join(repo_root_from_backend, 'data', 'esg_financial_dataset.csv'),
-    ]
-    try:
-        for p in candidates:
-            if os.path.exists(p):
-                _df = pd.read_csv(p)
-                break
-        if _df is None:
-            raise FileNotFoundError('dataset not found')
-    except Exception:
-        # Sample data fallback
-        np.random.seed(42)
-        companies = [f"Company_{i}" for i in range(1, 51)]
-        industries = ["Retail", "Technology", "Healthcare", "Finance", "Energy"]
-        regions = ["North America", "Europe", "Asia", "Latin America"]
-        years = range(2015, 2026)
-        data = []
-        for company in companies:
-            for year in years:
-                data.append({
-                    "CompanyID": int(company.split("_")[1]),
-                    "CompanyName": company,
-                    "Industry": np.random.choice(industries),
-                    "Region": np.random.choice(regions),
-                    "Year": year,
-                    "Revenue": np.random.uniform(100, 5000),
-                    "ProfitMargin": np.random.uniform(-5, 15),
-                    "MarketCap": np.random.uniform(100, 20000),
-                    "GrowthRate": np.random.uniform(-20, 30),
-                    "ESG_Overall": np.random.uniform(40, 80),
-                    "ESG_Environmental": np.random.uniform(30, 80),
-                    "ESG_Social": np.random.uniform(20, 90),
-                    "ESG_Governance": np.random.uniform(30, 85),
-                    "CarbonEmissions": np.random.uniform(10000, 300000),
-                    "WaterUsage": np.random.uniform(5000, 150000),
-                    "EnergyConsumption": np.random.uniform(20000, 600000),
-                })
-        _df = pd.DataFrame(data)
-    return _df
-
-
-def get_user_dataframe(user_id: str):
-    """Return user's active dataset.
-    If none exists, return default data only for a seeded test user; for other users return an empty DataFrame with the same schema.
+    The key (and ETag) is derived from endpoint, user, dataset version and the
+    canonicalized JSON body, so it is known before any data is loaded: a matching
+    If-None-Match is answered with 304 without touching the dataset at all.
     """
-    # Active dataset
-    doc = mongo.db.active_datasets.find_one({'user_id': user_id})
-    if doc and doc.get('data'):
-        try:
-            return pd.DataFrame(doc['data'])
-        except Exception:
-            pass
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        from ..services.datasets import current_dataset_version
+        if not result_cache.enabled:
+            return f(*args, **kwargs)
+        user_id = request.user['user_id']
+        payload = request.get_json(silent=True) if request.method == 'POST' else dict(request.args)
+        key = result_cache.make_key(request.endpoint, user_id, current_dataset_version(user_id), payload or {})
+        if key in request.if_none_match:
+            result_cache.not_modified += 1
+            resp = make_response('', 304)
+        else:
+            body = result_cache.get(key)
+            if body is not None:
+                resp = make_response(body)
+                resp.mimetype = 'application/json'
+                resp.headers['X-Cache'] = 'HIT'
+            else:
+                resp = make_response(f(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+                result_cache.set(key, resp.get_data())
+                resp.headers['X-Cache'] = 'MISS'
+        resp.set_etag(key)
+        resp.headers['Cache-Control'] = 'private, no-cache'
+        return resp
+    return wrapper
 
-    # Identify user to decide fallback
-    user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
-    test_email = os.getenv('SEED_TEST_EMAIL', 'test@esg.local').lower()
-    if user and (user.get('email', '').lower() == test_email):
-        return load_data()
 
-    # Empty dataset with same columns for new users
+def apply_filters(df, filters):
+    # Frames from get_user_dataframe are already typed; no per-request copy or coercion.
+    # Predicates run against the frame's cached sort/bitmap indexes and rows are taken once.
+    from ..services.dataset_schema import ensure_normalized
+    from ..services.filter_engine import filter_frame
+    return filter_frame(ensure_normalized(df), filters)
+
+
+def get_user_rollup(user_id: str):
+    """Rollup cube of the user's active dataset (None when the dataset can't be represented as one)."""
+    from ..services.rollup import Rollup, rollup_cache
+    from ..services.datasets import get_user_dataframe, current_dataset_version
+    version = current_dataset_version(user_id)
+    cube = rollup_cache.get(user_id, version)
+    if cube is None:
+        cube = rollup_cache.put(user_id, version, Rollup.build(get_user_dataframe(user_id)) or False)
+    return cube or None
+
+
+def summary_view(user_id: str, filters, filtered_df=None):
+    """What industry / regional / trends payloads are computed from.
+
+    Year/Industry/Region-only filters select cells of the dataset's cube; the
+    selection falls back to the filtered rows for any answer it can't give exactly.
+    Threshold filters (or a dataset no cube fits) are aggregated from the filtered
+    frame directly: a cube built for a single answer costs more than the groupby.
+    """
+    from ..services.rollup import cube_answers
+    from ..services.datasets import get_user_dataframe
+    def rows():
+        nonlocal filtered_df
+        if filtered_df is None:
+            filtered_df = apply_filters(get_user_dataframe(user_id), filters)
+        return filtered_df
+
+    if cube_answers(filters):
+        cube = get_user_rollup(user_id)
+        if cube is not None:
+            return cube.select(filters, rows=rows)
+    return rows()
+
+
+def _warm_rollup(user_id: str):
+    """Build the cube of a freshly activated dataset so the first dashboard load is served from it."""
     try:
-        cols = list(load_data().columns)
+        get_user_rollup(user_id)
     except Exception:
-        cols = []
-    return pd.DataFrame(columns=cols)
-
-
-def _coerce_types(df: pd.DataFrame) -> pd.DataFrame:
-    if df is None or df.empty:
-        return df
-    numeric_cols = [
-        'Year', 'Revenue', 'ProfitMargin', 'MarketCap', 'GrowthRate',
-        'ESG_Overall', 'ESG_Environmental', 'ESG_Social', 'ESG_Governance',
-        'CarbonEmissions', 'WaterUsage', 'EnergyConsumption'
-    ]
-    for c in numeric_cols:
-        if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors='coerce')
-    # Drop rows with NaN in critical columns minimally
-    return df
+        pass
 
 
-def apply_filters(df, filters):
-    filtered = _coerce_types(df.copy())
-    if 'yearRange' in filters:
-        year_range = filters['yearRange']
-        filtered = filtered[(filtered['Year'] >= year_range[0]) & (filtered['Year'] <= year_range[1])]
-    if 'industries' in filters and filters['industries']:
-        filtered = filtered[filtered['Industry'].isin(filters['industries'])]
-    if 'regions' in filters and filters['regions']:
-        filtered = filtered[filtered['Region'].isin(filters['regions'])]
-    if 'minESGScore' in filters:
-        filtered = filtered[filtered['ESG_Overall'] >= filters['minESGScore']]
-    if 'minRevenue' in filters:
-        filtered = filtered[filtered['Revenue'] >= filters['minRevenue']]
-    if 'maxCarbonEmissions' in filters:
-        filtered = filtered[filtered['CarbonEmissions'] <= filters['maxCarbonEmissions']]
-    if 'maxEnergyConsumption' in filters:
-        filtered = filtered[filtered['EnergyConsumption'] <= filters['maxEnergyConsumption']]
-    if 'minGrowthRate' in filters:
-        filtered = filtered[filtered['GrowthRate'] >= filters['minGrowthRate']]
-    return filtered
+def _release_active_blob(user_id: str):
+    """Delete the blob behind the current active dataset when it is not shared with an upload."""
+    from ..services.dataset_store import delete_blob
+    prev = mongo.db.active_datasets.find_one({'user_id': user_id}, {'storage': 1, 'upload_id': 1})
+    if prev and prev.get('storage') and not prev.get('upload_id'):
+        delete_blob(prev['storage'])
 
 
 @analytics_bp.get('/filters')
 @auth_required
+@cached_result
 def get_filters():
+    from ..services.datasets import get_user_dataframe
     df = get_user_dataframe(request.user['user_id'])
     if df.empty:
         return jsonify({
@@ -150,24 +134,23 @@ def get_filters():
     })
 
 
-@analytics_bp.post('/overview')
-@auth_required
-def overview():
-    df = get_user_dataframe(request.user['user_id'])
-    filters = request.json or {}
-    filtered_df = apply_filters(df, filters)
+EMPTY_OVERVIEW = {
+    "totalCompanies": 0,
+    "avgESGScore": 0.0,
+    "avgRevenue": 0.0,
+    "avgGrowthRate": 0.0,
+    "totalCarbonEmissions": 0.0,
+    "avgEnvironmentalScore": 0.0,
+    "avgSocialScore": 0.0,
+    "avgGovernanceScore": 0.0,
+}
+
+
+def _overview_payload(filtered_df):
+    # Unrounded means: always from the rows (see services/rollup.py)
     if filtered_df.empty:
-        return jsonify({
-            "totalCompanies": 0,
-            "avgESGScore": 0.0,
-            "avgRevenue": 0.0,
-            "avgGrowthRate": 0.0,
-            "totalCarbonEmissions": 0.0,
-            "avgEnvironmentalScore": 0.0,
-            "avgSocialScore": 0.0,
-            "avgGovernanceScore": 0.0,
-        })
-    metrics = {
+        return dict(EMPTY_OVERVIEW)
+    return {
         "totalCompanies": int(filtered_df["CompanyName"].nunique()),
         "avgESGScore": float(filtered_df["ESG_Overall"].mean()),
         "avgRevenue": float(filtered_df["Revenue"].mean()),
@@ -177,21 +160,13 @@ def overview():
         "avgSocialScore": float(filtered_df["ESG_Social"].mean()),
         "avgGovernanceScore": float(filtered_df["ESG_Governance"].mean()),
     }
-    return jsonify(metrics)
 
 
-@analytics_bp.post('/top-performers')
-@auth_required
-def top_performers():
-    df = get_user_dataframe(request.user['user_id'])
-    filters = request.json or {}
-    category = filters.get('category', 'overall')
-    limit = filters.get('limit', 10)
-    filtered_df = apply_filters(df, filters)
+def _top_performers_payload(filtered_df, category='overall', limit=10):
     if filtered_df.empty:
-        return jsonify([])
+        return []
     grouped = (
-        filtered_df.groupby("CompanyName").agg({
+        filtered_df.groupby("CompanyName", observed=True).agg({
             "ESG_Overall": "mean",
             "ESG_Environmental": "mean",
             "ESG_Social": "mean",
@@ -208,19 +183,21 @@ def top_performers():
     }
     sort_column = column_map.get(category, 'ESG_Overall')
     top = grouped.nlargest(limit, sort_column).reset_index()
-    return jsonify(top.to_dict(orient='records'))
-
-
-@analytics_bp.post('/industry-analysis')
-@auth_required
-def industry_analysis():
-    df = get_user_dataframe(request.user['user_id'])
-    filters = request.json or {}
-    filtered_df = apply_filters(df, filters)
-    if filtered_df.empty:
-        return jsonify([])
+    return top.to_dict(orient='records')
+
+
+def _dimension_payload(view, dimension):
+    """Per-Industry / per-Region means with distinct company counts."""
+    from ..services.rollup import Selection
+    if isinstance(view, Selection):
+        records = view.by_dimension(dimension)
+        if records is not None:
+            return records
+        view = view.rows()
+    if view.empty:
+        return []
     stats = (
-        filtered_df.groupby("Industry").agg({
+        view.groupby(dimension, observed=True).agg({
             "ESG_Overall": "mean",
             "ESG_Environmental": "mean",
             "ESG_Social": "mean",
@@ -231,78 +208,167 @@ def industry_analysis():
         }).round(2).reset_index()
     )
     stats.rename(columns={"CompanyName": "CompanyCount"}, inplace=True)
-    return jsonify(stats.to_dict(orient='records'))
-
-
-@analytics_bp.post('/regional-insights')
-@auth_required
-def regional_insights():
-    df = get_user_dataframe(request.user['user_id'])
-    filters = request.json or {}
-    filtered_df = apply_filters(df, filters)
-    if filtered_df.empty:
-        return jsonify([])
-    stats = (
-        filtered_df.groupby("Region").agg({
+    return stats.to_dict(orient='records')
+
+
+def _trends_payload(view):
+    from ..services.rollup import Selection
+    if isinstance(view, Selection):
+        records = view.trends()
+        if records is not None:
+            return records
+        view = view.rows()
+    if view.empty:
+        return []
+    tr = (
+        view.groupby("Year", observed=True).agg({
             "ESG_Overall": "mean",
             "ESG_Environmental": "mean",
             "ESG_Social": "mean",
             "ESG_Governance": "mean",
             "Revenue": "mean",
             "CarbonEmissions": "mean",
-            "CompanyName": "nunique",
+            "GrowthRate": "mean",
         }).round(2).reset_index()
     )
-    stats.rename(columns={"CompanyName": "CompanyCount"}, inplace=True)
-    return jsonify(stats.to_dict(orient='records'))
+    return tr.to_dict(orient='records')
 
 
-@analytics_bp.post('/trends')
+def _correlations_payload(filtered_df):
+    if filtered_df.empty:
+        return {}
+    cols = ['ESG_Overall', 'Revenue', 'ProfitMargin', 'GrowthRate', 'CarbonEmissions']
+    corr = filtered_df[cols].corr().round(3)
+    return corr.to_dict()
+
+
+# Dashboard panel name (same as the standalone endpoint path) -> payload builder.
+# Summary panels are built from summary_view(), the rest from the filtered rows.
+SUMMARY_PANELS = {'industry-analysis', 'regional-insights', 'trends'}
+DASHBOARD_PANELS = {
+    'overview': lambda df, body: _overview_payload(df),
+    'top-performers': lambda df, body: _top_performers_payload(df, body.get('category', 'overall'), body.get('limit', 10)),
+    'industry-analysis': lambda df, body: _dimension_payload(df, 'Industry'),
+    'regional-insights': lambda df, body: _dimension_payload(df, 'Region'),
+    'trends': lambda df, body: _trends_payload(df),
+    'correlations': lambda df, body: _correlations_payload(df),
+}
+
+
+@analytics_bp.post('/overview')
 @auth_required
-def trends():
+@cached_result
+def overview():
+    from ..services.datasets import get_user_dataframe
+    filters = request.json or {}
+    filtered_df = apply_filters(get_user_dataframe(request.user['user_id']), filters)
+    return jsonify(_overview_payload(filtered_df))
+
+
+@analytics_bp.post('/top-performers')
+@auth_required
+@cached_result
+def top_performers():
+    from ..services.datasets import get_user_dataframe
     df = get_user_dataframe(request.user['user_id'])
     filters = request.json or {}
+    category = filters.get('category', 'overall')
+    limit = filters.get('limit', 10)
     filtered_df = apply_filters(df, filters)
-    if filtered_df.empty:
-        return jsonify([])
-    tr = (
-        filtered_df.groupby("Year").agg({
-            "ESG_Overall": "mean",
-            "ESG_Environmental": "mean",
-            "ESG_Social": "mean",
-            "ESG_Governance": "mean",
-            "Revenue": "mean",
-            "CarbonEmissions": "mean",
-            "GrowthRate": "mean",
-        }).round(2).reset_index()
-    )
-    return jsonify(tr.to_dict(orient='records'))
+    return jsonify(_top_performers_payload(filtered_df, category, limit))
+
+
+@analytics_bp.post('/industry-analysis')
+@auth_required
+@cached_result
+def industry_analysis():
+    filters = request.json or {}
+    view = summary_view(request.user['user_id'], filters)
+    return jsonify(_dimension_payload(view, 'Industry'))
+
+
+@analytics_bp.post('/regional-insights')
+@auth_required
+@cached_result
+def regional_insights():
+    filters = request.json or {}
+    view = summary_view(request.user['user_id'], filters)
+    return jsonify(_dimension_payload(view, 'Region'))
+
+
+@analytics_bp.post('/trends')
+@auth_required
+@cached_result
+def trends():
+    filters = request.json or {}
+    view = summary_view(request.user['user_id'], filters)
+    return jsonify(_trends_payload(view))
 
 
 @analytics_bp.post('/correlations')
 @auth_required
+@cached_result
 def correlations():
+    from ..services.datasets import get_user_dataframe
     df = get_user_dataframe(request.user['user_id'])
     filters = request.json or {}
     filtered_df = apply_filters(df, filters)
-    if filtered_df.empty:
-        return jsonify({})
-    cols = ['ESG_Overall', 'Revenue', 'ProfitMargin', 'GrowthRate', 'CarbonEmissions']
-    corr = filtered_df[cols].corr().round(3)
-    return jsonify(corr.to_dict())
+    return jsonify(_correlations_payload(filtered_df))
+
+
+@analytics_bp.post('/dashboard')
+@auth_required
+@cached_result
+def dashboard():
+    """Filter once and build several panels from the shared filtered frame.
+
+    Body: the usual filter payload (plus category/limit for top-performers) and an
+    optional 'panels' list; each panel matches its standalone endpoint's response.
+    """
+    from ..services.datasets import get_user_dataframe
+    body = request.json or {}
+    panels = body.get('panels') or list(DASHBOARD_PANELS)
+    unknown = [p for p in panels if p not in DASHBOARD_PANELS]
+    if unknown:
+        return jsonify({'error': 'Unknown panels', 'unknown': unknown}), 400
+    user_id = request.user['user_id']
+    needs_rows = any(p not in SUMMARY_PANELS for p in panels)
+    filtered_df = apply_filters(get_user_dataframe(user_id), body) if needs_rows else None
+    view = summary_view(user_id, body, filtered_df) if any(p in SUMMARY_PANELS for p in panels) else None
+    return jsonify({p: DASHBOARD_PANELS[p](view if p in SUMMARY_PANELS else filtered_df, body) for p in panels})
 
 
 @analytics_bp.post('/export')
 @auth_required
 def export_data():
+    """Stream the filtered rows as json (default, {'data': [...], 'count': n}), csv or ndjson."""
+    from ..services.datasets import get_user_dataframe
     df = get_user_dataframe(request.user['user_id'])
     filters = request.json or {}
+    fmt = (request.args.get('format') or filters.get('format') or 'json').lower()
+    if fmt not in streaming.MIMETYPES:
+        return jsonify({'error': 'Unsupported format', 'supported': list(streaming.MIMETYPES)}), 400
     filtered_df = apply_filters(df, filters)
-    if filtered_df.empty:
-        return jsonify({'data': [], 'count': 0})
+    count = len(filtered_df)
+    resp = Response(streaming.encode(fmt, streaming.frame_chunks(filtered_df), count), mimetype=streaming.MIMETYPES[fmt])
+    resp.headers['X-Row-Count'] = str(count)
+    if fmt != 'json':
+        resp.headers['Content-Disposition'] = f'attachment; filename=esg_export.{fmt}'
+    return resp
+
+
+@analytics_bp.get('/cache-stats')
+@auth_required
+def cache_stats():
+    from ..services.rollup import rollup_cache
+    from ..services.shared_frames import shared_frames
     return jsonify({
-        'data': filtered_df.to_dict(orient='records'),
-        'count': len(filtered_df)
+        'datasets': dataset_cache.stats(),
+        'results': result_cache.stats(),
+        'predictions': prediction_cache.stats(),
+        'rollups': rollup_cache.stats(),
+        'shared': shared_frames.stats(),
+        'profiles': users.profile_cache.stats(),
     })
 
 
@@ -322,6 +388,7 @@ def save_prediction():
         'tags': body.get('tags', []),
         'created_at': datetime.utcnow(),
     }
+    doc.update(prediction_search.search_fields(doc['model'], doc['tags']))
     mongo.db.predictions.insert_one(doc)
     doc['id'] = str(doc.pop('_id', ''))
     return jsonify({'message': 'Prediction saved', 'prediction': doc}), 201
@@ -335,31 +402,28 @@ def list_predictions():
     search = request.args.get('search', '').strip()
     tag = request.args.get('tag')
     model = request.args.get('model')
-    try:
-        page = max(1, int(request.args.get('page', 1)))
-        limit = max(1, min(100, int(request.args.get('limit', 10))))
-    except Exception:
-        page, limit = 1, 10
+    mode = request.args.get('mode', 'prefix')
+    if mode not in prediction_search.SEARCH_MODES:
+        return jsonify({'error': f"mode must be one of: {', '.join(prediction_search.SEARCH_MODES)}"}), 400
     query = {'user_id': user_id}
     if search:
-        query['$or'] = [
-            {'model': {'$regex': search, '$options': 'i'}},
-            {'tags': {'$elemMatch': {'$regex': search, '$options': 'i'}}},
-        ]
+        query.update(prediction_search.search_query(search, mode))
     if tag:
-        query['tags'] = {'$elemMatch': {'$regex': f'^{tag}$', '$options': 'i'}}
+        query.update(prediction_search.tag_query(tag))
     if model:
-        query['model'] = {'$regex': model, '$options': 'i'}
-    total = mongo.db.predictions.count_documents(query)
-    cursor = mongo.db.predictions.find(query).sort('created_at', -1).skip((page-1)*limit).limit(limit)
+        query.update(prediction_search.model_query(model))
+    try:
+        docs, meta = paginate(mongo.db.predictions, query, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     items = []
-    for d in cursor:
+    for d in docs:
         d['id'] = str(d.pop('_id'))
         ca = d.get('created_at')
         if isinstance(ca, datetime):
             d['created_at'] = ca.isoformat()
         items.append(d)
-    return jsonify({'items': items, 'total': total, 'page': page, 'limit': limit, 'pages': (total + limit - 1)//limit})
+    return jsonify({'items': items, **meta})
 
 
 @analytics_bp.delete('/predictions/<pid>')
@@ -386,7 +450,12 @@ def update_prediction(pid):
     if not update:
         return jsonify({'error': 'Nothing to update'}), 400
     try:
-        mongo.db.predictions.update_one({'_id': ObjectId(pid), 'user_id': user_id}, {'$set': update})
+        selector = {'_id': ObjectId(pid), 'user_id': user_id}
+        if 'tags' in update:
+            current = mongo.db.predictions.find_one(selector, {'model': 1})
+            if current:
+                update.update(prediction_search.search_fields(current.get('model'), update['tags']))
+        mongo.db.predictions.update_one(selector, {'$set': update})
     except Exception:
         return jsonify({'error': 'Invalid prediction id'}), 400
     return jsonify({'message': 'Prediction updated'})
@@ -396,20 +465,70 @@ def update_prediction(pid):
 @auth_required
 def get_model_status():
     """Check if model is configured in backend"""
-    model_url = os.getenv('WATSONX_MODEL_URL', '').strip()
-    model_name = os.getenv('WATSONX_MODEL_NAME', 'WatsonX ESG Predictor')
+    from ..services import local_model
+    engine = scoring.active_engine()
     
-    if not model_url:
+    if engine is None:
         return jsonify({
             'configured': False,
+            'engine': 'remote',
             'message': 'Model endpoint not configured. Please set WATSONX_MODEL_URL in backend environment.'
         })
     
-    return jsonify({
+    status = {
         'configured': True,
-        'model_name': model_name,
+        'engine': engine,
+        'model_name': scoring.engine_model_name(engine),
         'message': 'Model ready for predictions'
-    })
+    }
+    if engine == 'local':
+        status['local_model'] = local_model.model_for_user(request.user['user_id']).describe()
+    return jsonify(status)
+
+
+# Every benchmark row is a live call to the remote model, so keep samples small
+BENCHMARK_MAX_ROWS = int(os.getenv('MODEL_BENCHMARK_MAX_ROWS', 50))
+
+
+@analytics_bp.post('/model-benchmark')
+@auth_required
+def model_benchmark():
+    """Time the local engine against the remote endpoint on sample rows from the dataset.
+
+    Remote calls bypass the prediction cache so the timing reflects the model itself.
+    """
+    from ..services.dataset_store import frame_records
+    from ..services.datasets import load_data
+    from ..services import local_model
+    body = request.get_json() or {}
+    try:
+        n = max(1, min(int(body.get('rows', BENCHMARK_MAX_ROWS)), BENCHMARK_MAX_ROWS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'rows must be an integer'}), 400
+    sample = load_data()[local_model.FEATURES].head(n)
+    rows = frame_records(sample)
+
+    model = local_model.model_for_user(request.user['user_id'])
+    started = time.perf_counter()
+    local_model.score_rows(model, rows)
+    local_seconds = time.perf_counter() - started
+    report = {'rows': len(rows), 'local': _timing(len(rows), local_seconds), 'remote': None}
+
+    if scoring.remote_url():
+        started = time.perf_counter()
+        outcomes = model_client.predict_many(scoring.remote_url(), rows)
+        remote_seconds = time.perf_counter() - started
+        report['remote'] = _timing(len(rows), remote_seconds)
+        report['remote']['errors'] = sum(1 for _, err in outcomes if err)
+        report['speedup'] = round(remote_seconds / local_seconds, 1) if local_seconds else None
+    return jsonify(report)
+
+
+def _timing(rows, seconds):
+    return {
+        'seconds': round(seconds, 6),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None,
+    }
 
 
 @analytics_bp.post('/predict')
@@ -423,25 +542,16 @@ def make_prediction():
     if not inputs:
         return jsonify({'error': 'Input features are required'}), 400
     
-    # Get model URL from environment
-    model_url = os.getenv('WATSONX_MODEL_URL', '').strip()
-    model_name = os.getenv('WATSONX_MODEL_NAME', 'WatsonX ESG Predictor')
+    engine = scoring.active_engine()
+    model_name = scoring.engine_model_name(engine)
     
-    if not model_url:
+    if engine is None:
         return jsonify({'error': 'Model not configured on server. Contact administrator.'}), 503
     
     try:
-        # Call external model API
-        response = requests.post(
-            model_url,
-            json={'inputs': inputs},
-            headers={'Content-Type': 'application/json'},
-            timeout=30
-        )
-        response.raise_for_status()
-        result = response.json()
-        
-        prediction_value = result.get('prediction', result.get('output', None))
+        # Local engine, or the external model API (pooled session, retried on transient errors) unless cached
+        result, cached = scoring.score_one(engine, user_id, inputs)
+        prediction_value = model_client.prediction_value(result)
         
         # Save prediction to DB
         pred_doc = {
@@ -451,7 +561,8 @@ def make_prediction():
             'output': prediction_value,
             'raw_response': result,
             'tags': ['auto'],
-            'created_at': datetime.utcnow()
+            'created_at': datetime.utcnow(),
+            **prediction_search.search_fields(model_name, ['auto']),
         }
         res = mongo.db.predictions.insert_one(pred_doc)
         pred_doc['id'] = str(res.inserted_id)
@@ -460,6 +571,8 @@ def make_prediction():
             'message': 'Prediction successful',
             'prediction': prediction_value,
             'details': result,
+            'cached': cached,
+            'engine': engine,
             'saved_id': pred_doc['id']
         })
     except requests.exceptions.RequestException as e:
@@ -468,11 +581,114 @@ def make_prediction():
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
 
 
+INSERT_BATCH_SIZE = 500
+
+
+def _insert_buffered(collection, docs, batch_size=INSERT_BATCH_SIZE):
+    """insert_many in fixed-size batches; returns {position: error} for documents not written."""
+    failed = {}
+    for start in range(0, len(docs), batch_size):
+        batch = docs[start:start + batch_size]
+        try:
+            collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get('writeErrors', []):
+                failed[start + err['index']] = err.get('errmsg', 'Insert failed')
+        except Exception as e:
+            for i in range(len(batch)):
+                failed[start + i] = str(e)
+    return failed
+
+
+def _score_rows(user_id, engine, model_name, rows, offset=0, extra=None):
+    """Score rows with the given engine and store the successful predictions.
+
+    Returns (results, errors) with row numbers counted from offset, both in row order.
+    extra: fields added to every stored prediction document.
+    """
+    results = []
+    errors = []
+    search = prediction_search.search_fields(model_name, ['batch'])
+
+    # Local: one vectorized pass. Remote: cache misses scored concurrently. Outcomes come back in input order
+    outcomes = scoring.score_many(engine, user_id, rows)
+    docs, doc_rows = [], []
+    for idx, (result, error, cached) in enumerate(outcomes, start=offset):
+        if error is None:
+            try:
+                prediction_value = model_client.prediction_value(result)
+            except Exception as e:
+                error = str(e)
+        if error is not None:
+            errors.append({'row': idx, 'error': error})
+            continue
+        doc = {
+            'user_id': user_id,
+            'model': model_name,
+            'inputs': rows[idx - offset],
+            'output': prediction_value,
+            'raw_response': result,
+            'tags': ['batch'],
+            'created_at': datetime.utcnow(),
+            **search,
+        }
+        if extra:
+            doc.update(extra, row=idx)
+        docs.append(doc)
+        doc_rows.append((idx, prediction_value, cached))
+
+    failed = _insert_buffered(mongo.db.predictions, docs)
+    for pos, (idx, prediction_value, cached) in enumerate(doc_rows):
+        if pos in failed:
+            errors.append({'row': idx, 'error': failed[pos]})
+        else:
+            results.append({'row': idx, 'prediction': prediction_value, 'id': str(docs[pos]['_id']), 'cached': cached})
+    errors.sort(key=lambda e: e['row'])
+    return results, errors
+
+
+PREDICT_JOB_CHUNK_ROWS = int(os.getenv('PREDICT_JOB_CHUNK_ROWS', 100))
+
+
+def _predict_batch_results(job, offset, limit):
+    cursor = mongo.db.predictions.find(
+        {'job_id': str(job['_id']), 'user_id': job['user_id']},
+        {'row': 1, 'output': 1},
+    ).sort('row', 1).skip(offset).limit(limit)
+    return [{'row': d['row'], 'prediction': d.get('output'), 'id': str(d['_id'])} for d in cursor]
+
+
+@jobs.register_job('predict_batch', results=_predict_batch_results)
+def _run_predict_batch(job, ctx):
+    """Background /predict-batch: scores the rows chunk by chunk, checking for cancellation."""
+    params = job['params']
+    total = jobs.input_count(job)
+    job_id = str(job['_id'])
+    engine = params.get('engine', 'remote')
+    if engine == 'remote' and not scoring.remote_url():
+        raise RuntimeError('Model not configured on server')
+    # Resume after a lost lease: drop anything written past the last reported chunk
+    start = (job.get('progress') or {}).get('done') or 0
+    mongo.db.predictions.delete_many({'job_id': job_id, 'row': {'$gte': start}})
+    rows = jobs.iter_inputs(job, start)
+    for chunk_start in range(start, total, PREDICT_JOB_CHUNK_ROWS):
+        if ctx.cancelled():
+            return
+        chunk = list(islice(rows, PREDICT_JOB_CHUNK_ROWS))
+        results, errors = _score_rows(job['user_id'], engine, params['model_name'], chunk,
+                                      offset=chunk_start, extra={'job_id': job_id})
+        ctx.push_errors(errors)
+        ctx.report(chunk_start + len(chunk), total)
+
+
 @analytics_bp.post('/predict-batch')
 @auth_required
 def predict_batch():
-    """Batch prediction from uploaded CSV/XLSX"""
-    import requests
+    """Batch prediction from uploaded CSV/XLSX.
+
+    With {"async": true} (or ?async=1) the batch is queued as a background job and
+    the response is 202 with the job id to poll at /api/jobs/<id>.
+    """
     user_id = request.user['user_id']
     body = request.get_json() or {}
     data = body.get('data', [])
@@ -480,65 +696,107 @@ def predict_batch():
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
-    # Get model URL from environment
-    model_url = os.getenv('WATSONX_MODEL_URL', '').strip()
-    model_name = os.getenv('WATSONX_MODEL_NAME', 'WatsonX ESG Predictor')
+    engine = scoring.active_engine()
+    model_name = scoring.engine_model_name(engine)
     
-    if not model_url:
+    if engine is None:
         return jsonify({'error': 'Model not configured on server. Contact administrator.'}), 503
-    
-    results = []
-    errors = []
-    
-    for idx, row in enumerate(data):
-        try:
-            # Call external model API
-            response = requests.post(
-                model_url,
-                json={'inputs': row},
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
-            response.raise_for_status()
-            result = response.json()
-            prediction_value = result.get('prediction', result.get('output', None))
-            
-            # Save prediction to DB
-            pred_doc = {
-                'user_id': user_id,
-                'model': model_name,
-                'inputs': row,
-                'output': prediction_value,
-                'raw_response': result,
-                'tags': ['batch'],
-                'created_at': datetime.utcnow()
-            }
-            res = mongo.db.predictions.insert_one(pred_doc)
-            
-            results.append({
-                'row': idx,
-                'prediction': prediction_value,
-                'id': str(res.inserted_id)
-            })
-        except Exception as e:
-            errors.append({'row': idx, 'error': str(e)})
-    
+
+    if body.get('async') or request.args.get('async') in ('1', 'true'):
+        job_id = jobs.submit('predict_batch', user_id, {'model_name': model_name, 'engine': engine},
+                             total=len(data), inputs=data)
+        return jsonify({
+            'message': 'Batch prediction queued',
+            'job_id': str(job_id),
+            'status_url': f'/api/jobs/{job_id}',
+        }), 202
+
+    results, errors = _score_rows(user_id, engine, model_name, data)
     return jsonify({
         'message': f'Batch prediction complete. {len(results)} succeeded, {len(errors)} failed.',
         'results': results,
-        'errors': errors
+        'errors': errors,
+        'cache_hits': sum(1 for r in results if r['cached']),
+        'engine': engine,
     })
 
 
+OUTPUT_BINS = 5
+
+
+def _output_bin_expr(value, lo, step):
+    """Index of the np.histogram bin holding value: the number of interior edges <= value.
+
+    Edges are computed as in np.linspace (i * step + lo) so boundary values land in the same bin.
+    """
+    return {'$add': [
+        {'$cond': [{'$gte': [value, {'$add': [{'$multiply': [i, step]}, lo]}]}, 1, 0]}
+        for i in range(1, OUTPUT_BINS)
+    ]}
+
+
+def _predictions_analytics_pipeline(user_id):
+    """One aggregation for the whole analytics payload; raw_response and inputs never leave the server."""
+    return [
+        {'$match': {'user_id': user_id}},
+        {'$project': {'model': 1, 'output': 1, 'created_at': 1}},
+        {'$facet': {
+            'total': [{'$count': 'n'}],
+            'models': [
+                {'$group': {
+                    '_id': {'$cond': [{'$eq': [{'$type': '$model'}, 'missing']}, 'Unknown', '$model']},
+                    'count': {'$sum': 1},
+                    'first': {'$min': '$_id'},
+                }},
+                {'$sort': {'first': 1}},
+            ],
+            'over_time': [
+                {'$project': {'date': {'$switch': {
+                    'branches': [
+                        {'case': {'$eq': [{'$type': '$created_at'}, 'date']},
+                         'then': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}}},
+                        {'case': {'$eq': [{'$type': '$created_at'}, 'string']},
+                         'then': {'$substrCP': ['$created_at', 0, 10]}},
+                    ],
+                    'default': None,
+                }}}},
+                {'$match': {'date': {'$nin': [None, '']}}},
+                {'$group': {'_id': '$date', 'count': {'$sum': 1}}},
+                {'$sort': {'_id': 1}},
+            ],
+            'distribution': [
+                {'$project': {'value': {'$convert': {'input': '$output', 'to': 'double', 'onError': None, 'onNull': None}}}},
+                {'$match': {'value': {'$ne': None}}},
+                {'$setWindowFields': {'output': {'lo': {'$min': '$value'}, 'hi': {'$max': '$value'}}}},
+                {'$match': {'$expr': {'$lt': ['$lo', '$hi']}}},
+                {'$group': {
+                    '_id': {'$let': {
+                        'vars': {'step': {'$divide': [{'$subtract': ['$hi', '$lo']}, OUTPUT_BINS]}},
+                        'in': _output_bin_expr('$value', '$lo', '$$step'),
+                    }},
+                    'count': {'$sum': 1},
+                    'lo': {'$first': '$lo'},
+                    'hi': {'$first': '$hi'},
+                }},
+            ],
+            'recent': [
+                {'$sort': {'created_at': -1, '_id': -1}},
+                {'$limit': 10},
+            ],
+        }},
+    ]
+
+
 @analytics_bp.get('/predictions/analytics')
 @auth_required
 def predictions_analytics():
+    import numpy as np
     user_id = request.user['user_id']
     
-    # Get all predictions for this user
-    preds = list(mongo.db.predictions.find({'user_id': user_id}))
+    facets = next(mongo.db.predictions.aggregate(_predictions_analytics_pipeline(user_id)), {})
+    total = facets['total'][0]['n'] if facets.get('total') else 0
     
-    if not preds:
+    if not total:
         return jsonify({
             'total_predictions': 0,
             'models_used': [],
@@ -547,52 +805,25 @@ def predictions_analytics():
             'recent_predictions': []
         })
     
-    # Total count
-    total = len(preds)
-    
-    # Models used
-    models = {}
-    for p in preds:
-        m = p.get('model', 'Unknown')
-        models[m] = models.get(m, 0) + 1
-    models_list = [{'model': k, 'count': v} for k, v in models.items()]
-    
-    # Predictions over time (group by date)
-    time_series = {}
-    for p in preds:
-        created = p.get('created_at')
-        if created:
-            date_key = created.strftime('%Y-%m-%d') if isinstance(created, datetime) else str(created)[:10]
-            time_series[date_key] = time_series.get(date_key, 0) + 1
-    time_list = sorted([{'date': k, 'count': v} for k, v in time_series.items()], key=lambda x: x['date'])
-    
-    # Output distribution (if numeric)
-    outputs = []
-    for p in preds:
-        out = p.get('output')
-        if out is not None:
-            try:
-                outputs.append(float(out))
-            except (ValueError, TypeError):
-                pass
+    models_list = [{'model': m['_id'], 'count': m['count']} for m in facets['models']]
+    time_list = [{'date': t['_id'], 'count': t['count']} for t in facets['over_time']]
     
+    # Output distribution: equal-width bins between the min and max numeric output
     output_dist = []
-    if outputs:
-        # Create bins
-        min_val, max_val = min(outputs), max(outputs)
-        if min_val < max_val:
-            bins = np.linspace(min_val, max_val, 6)
-            hist, edges = np.histogram(outputs, bins=bins)
-            for i in range(len(hist)):
-                output_dist.append({
-                    'range': f'{edges[i]:.1f}-{edges[i+1]:.1f}',
-                    'count': int(hist[i])
-                })
+    bins = facets['distribution']
+    if bins:
+        counts = [0] * OUTPUT_BINS
+        for b in bins:
+            counts[int(b['_id'])] = b['count']
+        edges = np.linspace(bins[0]['lo'], bins[0]['hi'], OUTPUT_BINS + 1)
+        for i in range(OUTPUT_BINS):
+            output_dist.append({
+                'range': f'{edges[i]:.1f}-{edges[i+1]:.1f}',
+                'count': counts[i]
+            })
     
-    # Recent predictions
-    recent = sorted(preds, key=lambda x: x.get('created_at', datetime.min), reverse=True)[:10]
     recent_list = []
-    for p in recent:
+    for p in facets['recent']:
         recent_list.append({
             'id': str(p['_id']),
             'model': p.get('model'),
@@ -633,26 +864,24 @@ def save_upload_metadata():
 def list_uploads():
     user_id = request.user['user_id']
     search = (request.args.get('search') or '').strip()
-    try:
-        page = max(1, int(request.args.get('page', 1)))
-        limit = max(1, min(100, int(request.args.get('limit', 10))))
-    except Exception:
-        page, limit = 1, 10
     query = {'user_id': user_id}
     if search:
         query['filename'] = {'$regex': search, '$options': 'i'}
-    total = mongo.db.uploads.count_documents(query)
-    cursor = mongo.db.uploads.find(query).sort('created_at', -1).skip((page-1)*limit).limit(limit)
+    try:
+        docs, meta = paginate(mongo.db.uploads, query, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     items = []
-    for d in cursor:
+    for d in docs:
         d['id'] = str(d.pop('_id'))
         items.append(d)
-    return jsonify({'items': items, 'total': total, 'page': page, 'limit': limit, 'pages': (total + limit - 1)//limit})
+    return jsonify({'items': items, **meta})
 
 
 @analytics_bp.get('/uploads/<uid>/preview')
 @auth_required
 def preview_upload(uid):
+    from ..services.dataset_store import read_dataset, frame_records
     user_id = request.user['user_id']
     try:
         oid = ObjectId(uid)
@@ -661,12 +890,12 @@ def preview_upload(uid):
     meta = mongo.db.uploads.find_one({'_id': oid, 'user_id': user_id})
     if not meta:
         return jsonify({'error': 'Not found'}), 404
-    ds = mongo.db.user_datasets.find_one({'upload_id': oid, 'user_id': user_id}, {'data': 1, 'columns': 1})
+    ds = mongo.db.user_datasets.find_one({'upload_id': oid, 'user_id': user_id}, {'storage': 1, 'data': {'$slice': 10}, 'columns': 1})
     sample = []
     columns = meta.get('columns', [])
-    if ds and ds.get('data'):
+    if ds and (ds.get('storage') or ds.get('data')):
         columns = ds.get('columns') or columns
-        sample = (ds.get('data') or [])[:10]
+        sample = frame_records(read_dataset(ds, rows=(0, 10)))
     return jsonify({
         'upload': {
             'id': uid,
@@ -688,121 +917,408 @@ def analyze_upload(uid):
         oid = ObjectId(uid)
     except Exception:
         return jsonify({'error': 'Invalid upload id'}), 400
-    ds = mongo.db.user_datasets.find_one({'upload_id': oid, 'user_id': user_id})
+    # Only the first data row (if any) is fetched: activation never reads or copies the dataset
+    ds = mongo.db.user_datasets.find_one({'upload_id': oid, 'user_id': user_id},
+                                         {'columns': 1, 'filename': 1, 'storage.ref': 1, 'data': {'$slice': 1}})
     if not ds:
         return jsonify({'error': 'Dataset not found for this upload'}), 404
     columns = ds.get('columns') or []
-    data = ds.get('data') or []
-    if not data or not columns:
+    if not columns or not (ds.get('storage') or ds.get('data')):
         return jsonify({'error': 'Invalid dataset'}), 400
-    mongo.db.active_datasets.update_one(
-        {'user_id': user_id},
-        {'$set': {'data': data, 'columns': columns, 'filename': ds.get('filename'), 'upload_id': oid, 'updated_at': datetime.utcnow()}},
-        upsert=True,
+    _release_active_blob(user_id)
+    mongo.db.active_datasets.update_one({'user_id': user_id}, {
+        '$set': {'upload_id': oid, 'columns': columns, 'filename': ds.get('filename'), 'updated_at': datetime.utcnow()},
+        '$unset': {'storage': '', 'data': ''},
+    }, upsert=True)
+    invalidate_user(user_id)
+    _warm_rollup(user_id)
+    if os.getenv('ACTIVE_DATASET_CSV', 'false').lower() == 'true':
+        jobs.submit('active_dataset_csv', user_id, {'upload_id': str(oid)})
+    return jsonify({'message': 'Active dataset set'})
+
+
+@jobs.register_job('active_dataset_csv')
+def _write_active_csv(job, ctx):
+    """Opt-in (ACTIVE_DATASET_CSV=true) reference copy of the active dataset at data/active_dataset.csv."""
+    from ..services.dataset_store import iter_dataset
+    repo_root_from_container = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    repo_root_from_backend = os.path.abspath(os.path.join(repo_root_from_container, '..'))
+    data_dir = os.path.join(repo_root_from_container, 'data') if os.path.isdir(os.path.join(repo_root_from_container, 'data')) else os.path.join(repo_root_from_backend, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    ds = mongo.db.user_datasets.find_one({'upload_id': ObjectId(job['params']['upload_id']), 'user_id': job['user_id']},
+                                         {'storage': 1, 'data': 1})
+    if not ds:
+        return
+    out_path = os.path.join(data_dir, 'active_dataset.csv')
+    tmp_path = f'{out_path}.{job["_id"]}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as out:
+        for chunk in streaming.iter_csv(iter_dataset(ds)):
+            out.write(chunk)
+    os.replace(tmp_path, out_path)
+
+
+def _patch_dataset(user_id, upload_id):
+    """Append or upsert rows into an upload, or into the active dataset when upload_id is None.
+
+    Body: {"rows": [...], "mode": "append" | "upsert"}; upsert matches on (CompanyID, Year).
+    Only the new rows are written (as a delta segment of the stored dataset). The active
+    dataset shares storage with its upload, so both are patched together, and the cached
+    frame and rollup cube of an active dataset are patched in place rather than rebuilt.
+    """
+    from ..services.dataset_store import (
+        write_frame, read_dataset, delete_blob, apply_delta, add_delta, DELTA_MODES, UPSERT_KEY,
     )
-    # Also materialize to a local CSV for reference (data/active_dataset.csv)
+    from ..services.dataset_schema import normalize_frame, ensure_normalized
+    from ..services.rollup import rollup_cache
+    from ..services.shared_frames import shared_frames
+    import pandas as pd
+    body = request.get_json() or {}
+    rows = body.get('rows') or []
+    mode = body.get('mode', 'append')
+    if mode not in DELTA_MODES:
+        return jsonify({'error': f"mode must be one of: {', '.join(DELTA_MODES)}"}), 400
+    if not isinstance(rows, list) or not rows:
+        return jsonify({'error': 'No rows provided'}), 400
+    delta, report = normalize_frame(pd.DataFrame(rows))
+    if mode == 'upsert':
+        missing = [c for c in UPSERT_KEY if c not in delta.columns]
+        if missing:
+            return jsonify({'error': 'Missing key columns', 'missing': missing}), 400
+        if delta[UPSERT_KEY].isna().any().any():
+            return jsonify({'error': 'Every row needs CompanyID and Year for upsert'}), 400
+
+    active = mongo.db.active_datasets.find_one({'user_id': user_id}, {'storage': 1, 'data': 1, 'upload_id': 1, 'updated_at': 1})
+    if upload_id is None:
+        if not active:
+            return jsonify({'error': 'No active dataset'}), 404
+        upload_id = active.get('upload_id')
+    ds = None
+    if upload_id is not None:
+        ds = mongo.db.user_datasets.find_one({'upload_id': upload_id, 'user_id': user_id}, {'storage': 1, 'data': 1, 'renditions': 1})
+        if not ds:
+            return jsonify({'error': 'Dataset not found for this upload'}), 404
+    patches_active = active is not None and active.get('upload_id') == upload_id
+    source = ds or active
+    if not (source.get('storage') or source.get('data')):
+        return jsonify({'error': 'Invalid dataset'}), 400
+    pointer = source.get('storage') or write_frame(read_dataset(source), user_id)  # legacy inline rows
+    if mode == 'upsert' and any(c not in (pointer.get('columns') or []) for c in UPSERT_KEY):
+        return jsonify({'error': 'Dataset has no CompanyID/Year columns to upsert on'}), 400
+
+    old_version = dataset_version(active) if patches_active else None
+    current = dataset_cache.get(user_id, old_version) if patches_active else None
+    patched = replaced = inserted_rows = None
+    if current is not None:
+        patched, replaced, inserted_rows = apply_delta(current, delta, mode)
+        row_count = len(patched)
+    elif mode == 'upsert':
+        keys = read_dataset({'storage': pointer}, columns=UPSERT_KEY)
+        row_count = len(apply_delta(keys, delta[UPSERT_KEY], mode)[0])
+    else:
+        row_count = int(pointer.get('row_count') or 0) + len(delta)
+    inserted = row_count - int(pointer.get('row_count') or 0)
+
+    try:
+        storage, superseded = add_delta(pointer, delta, mode, user_id, row_count, current=patched)
+    except Exception as e:
+        return jsonify({'error': 'Failed to store rows', 'details': str(e)}), 500
+    now = datetime.utcnow()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)  # as Mongo stores it, so versions line up
+    if ds:
+        mongo.db.user_datasets.update_one({'_id': ds['_id']}, {
+            '$set': {'storage': storage, 'columns': storage['columns'], 'updated_at': now},
+            '$unset': {'data': '', 'renditions': ''},
+        })
+        for rendition in (ds.get('renditions') or {}).values():
+            delete_blob(rendition)
+        mongo.db.uploads.update_one({'_id': upload_id, 'user_id': user_id},
+                                    {'$set': {'row_count': row_count, 'columns': storage['columns']}})
+    if patches_active:
+        # An active upload is only referenced: bumping updated_at is what moves readers to the new version
+        if ds:
+            active_update = {'$set': {'columns': storage['columns'], 'updated_at': now}, '$unset': {'storage': '', 'data': ''}}
+        else:
+            active_update = {'$set': {'storage': storage, 'columns': storage['columns'], 'updated_at': now}, '$unset': {'data': ''}}
+        mongo.db.active_datasets.update_one({'_id': active['_id']}, active_update)
+    for blob in superseded:
+        delete_blob(blob)
+
+    if patches_active:
+        new_version = dataset_version({'upload_id': active.get('upload_id'), 'updated_at': now})
+        result_cache.invalidate_user(user_id)
+        cube = rollup_cache.get(user_id, old_version)
+        if cube and inserted_rows is None and mode == 'upsert':
+            # Without the cached frame the replaced rows are unknown; rebuild on the next read
+            cube = None
+        elif cube:
+            year_dtype = patched['Year'].dtype if patched is not None and 'Year' in patched.columns else None
+            # Fold in the rows apply_delta actually stored (an upsert keeps one row per key);
+            # an append without the cached frame stores the delta as-is
+            added = delta if inserted_rows is None else inserted_rows
+            cube = cube.apply_delta(added=added, removed=replaced, year_dtype=year_dtype)
+        if cube:
+            rollup_cache.put(user_id, new_version, cube)
+        else:
+            rollup_cache.invalidate(user_id)
+        if patched is not None:
+            dataset_cache.put(user_id, new_version, shared_frames.publish(user_id, new_version, ensure_normalized(patched)))
+        else:
+            dataset_cache.invalidate(user_id)
+
+    updated = len(delta.drop_duplicates(UPSERT_KEY)) - inserted if mode == 'upsert' else 0
+    return jsonify({
+        'message': f'{inserted} rows added, {updated} rows updated',
+        'mode': mode,
+        'inserted': inserted,
+        'updated': updated,
+        'row_count': row_count,
+        'deltas': len(storage.get('deltas') or []),
+        'normalization': report,
+    })
+
+
+@analytics_bp.post('/uploads/<uid>/rows')
+@auth_required
+def patch_upload_rows(uid):
     try:
-        repo_root_from_container = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        repo_root_from_backend = os.path.abspath(os.path.join(repo_root_from_container, '..'))
-        data_dir = os.path.join(repo_root_from_container, 'data') if os.path.isdir(os.path.join(repo_root_from_container, 'data')) else os.path.join(repo_root_from_backend, 'data')
-        os.makedirs(data_dir, exist_ok=True)
-        out_path = os.path.join(data_dir, 'active_dataset.csv')
-        pd.DataFrame(data).to_csv(out_path, index=False)
+        oid = ObjectId(uid)
     except Exception:
-        pass
-    return jsonify({'message': 'Active dataset set'})
+        return jsonify({'error': 'Invalid upload id'}), 400
+    return _patch_dataset(request.user['user_id'], oid)
+
+
+@analytics_bp.post('/active-dataset/rows')
+@auth_required
+def patch_active_rows():
+    return _patch_dataset(request.user['user_id'], None)
 
 
 @analytics_bp.delete('/uploads/<uid>')
 @auth_required
 def delete_upload(uid):
+    from ..services.dataset_store import delete_blob
     user_id = request.user['user_id']
     try:
         oid = ObjectId(uid)
     except Exception:
         return jsonify({'error': 'Invalid upload id'}), 400
     mongo.db.uploads.delete_one({'_id': oid, 'user_id': user_id})
-    mongo.db.user_datasets.delete_one({'upload_id': oid, 'user_id': user_id})
+    ds = mongo.db.user_datasets.find_one_and_delete({'upload_id': oid, 'user_id': user_id}, {'storage': 1, 'renditions': 1})
+    if ds:
+        delete_blob(ds.get('storage'))
+        for pointer in (ds.get('renditions') or {}).values():
+            delete_blob(pointer)
     # If this upload was the active dataset, clear it so UI falls back to empty state
     mongo.db.active_datasets.delete_one({'user_id': user_id, 'upload_id': oid})
+    invalidate_user(user_id)
     return jsonify({'message': 'Upload deleted'})
 
 
 @analytics_bp.get('/uploads/<uid>/download')
 @auth_required
 def download_upload(uid):
+    from ..services.dataset_store import read_dataset, frame_records
     user_id = request.user['user_id']
     fmt = (request.args.get('format') or 'json').lower()
     try:
         oid = ObjectId(uid)
     except Exception:
         return jsonify({'error': 'Invalid upload id'}), 400
-    ds = mongo.db.user_datasets.find_one({'upload_id': oid, 'user_id': user_id})
+    ds = mongo.db.user_datasets.find_one({'upload_id': oid, 'user_id': user_id}, {'data': 0})
     if not ds:
         return jsonify({'error': 'Dataset not found'}), 404
-    data = ds.get('data') or []
+    if (request.args.get('mode') or '').lower() == 'file':
+        return _download_file(ds, fmt)
+    if not ds.get('storage'):
+        ds = mongo.db.user_datasets.find_one({'_id': ds['_id']})
+    columns = request.args.get('columns')
+    df = read_dataset(ds, columns=columns.split(',') if columns else None)
     if fmt == 'csv':
-        if not data:
+        if df.empty:
             return jsonify({'error': 'No data'}), 400
-        df = pd.DataFrame(data)
         csv_text = df.to_csv(index=False)
         return jsonify({'filename': ds.get('filename') or 'dataset.csv', 'content': csv_text})
     else:
-        return jsonify({'data': data, 'columns': ds.get('columns') or []})
+        return jsonify({'data': frame_records(df), 'columns': ds.get('columns') or []})
 
 
-@analytics_bp.post('/upload-dataset')
-@auth_required
-def upload_dataset():
-    user_id = request.user['user_id']
-    body = request.get_json() or {}
-    filename = body.get('filename')
-    data = body.get('data', [])
-    columns = body.get('columns', [])
+# format -> (renditions key, mimetype, file extension)
+DOWNLOAD_FORMATS = {
+    'csv': ('csv', 'text/csv', 'csv'),
+    'csv.gz': ('csv_gz', 'application/gzip', 'csv.gz'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet', 'parquet'),
+}
 
-    if not data or not columns:
-        return jsonify({'error': 'Invalid dataset'}), 400
 
-    # Validate required schema
-    required = [
-        'CompanyName', 'Industry', 'Region', 'Year', 'Revenue',
-        'ESG_Overall', 'ESG_Environmental', 'ESG_Social', 'ESG_Governance'
-    ]
-    missing = [c for c in required if c not in columns]
-    if missing:
-        return jsonify({'error': 'Missing required columns', 'missing': missing}), 400
+def _download_file(ds, fmt):
+    """Send the dataset as a real file, streamed from storage with HTTP Range support.
 
-    # Store upload metadata
+    Parquet is the stored blob itself; csv / csv.gz renditions are rendered once,
+    chunk by chunk, and kept next to it so later (and resumed) downloads are plain
+    byte-range reads.
+    """
+    from ..services.dataset_store import write_frame, write_rendition, read_dataset, iter_dataset, open_blob
+    if fmt == 'json':
+        fmt = 'csv'
+    if fmt not in DOWNLOAD_FORMATS:
+        return jsonify({'error': 'Unsupported format', 'supported': list(DOWNLOAD_FORMATS)}), 400
+    key, mimetype, ext = DOWNLOAD_FORMATS[fmt]
+    # A patched dataset's base blob lacks its deltas, so it gets a compacted rendition instead
+    stored = ds.get('storage') or {}
+    pointer = stored if key == 'parquet' and stored and not stored.get('deltas') else None
+    pointer = pointer or (ds.get('renditions') or {}).get(key)
+    if not pointer:
+        full = ds if ds.get('storage') else mongo.db.user_datasets.find_one({'_id': ds['_id']})
+        if key == 'parquet':
+            pointer = write_frame(read_dataset(full), ds['user_id'])
+        else:
+            pointer = write_rendition(streaming.iter_csv(iter_dataset(full)), ds['user_id'], ext)
+        mongo.db.user_datasets.update_one({'_id': ds['_id']}, {'$set': {f'renditions.{key}': pointer}})
+    base = os.path.splitext(ds.get('filename') or 'dataset.csv')[0]
+    return streaming.blob_response(open_blob(pointer), pointer['size_bytes'], mimetype, f'{base}.{ext}', etag=pointer['ref'].replace('/', '-'))
+
+
+REQUIRED_COLUMNS = [
+    'CompanyName', 'Industry', 'Region', 'Year', 'Revenue',
+    'ESG_Overall', 'ESG_Environmental', 'ESG_Social', 'ESG_Governance'
+]
+UPLOAD_CHUNK_ROWS = int(os.getenv('UPLOAD_CHUNK_ROWS', 50000))
+
+
+def _record_upload(user_id, filename, columns, storage, report):
+    """Insert the upload metadata and its dataset pointer; returns the 201 response."""
     meta = {
         'user_id': user_id,
         'filename': filename,
-        'row_count': len(data),
+        'row_count': storage['row_count'],
         'columns': columns,
+        'normalization': report,
         'created_at': datetime.utcnow(),
     }
     res = mongo.db.uploads.insert_one(meta)
     upload_id = res.inserted_id
-
-    # Persist full dataset for preview/analyze/download
-    try:
-        mongo.db.user_datasets.insert_one({
-            'user_id': user_id,
-            'upload_id': upload_id,
-            'filename': filename,
-            'columns': columns,
-            'data': data,
-            'created_at': datetime.utcnow(),
-        })
-    except Exception:
-        pass
-
+    mongo.db.user_datasets.insert_one({
+        'user_id': user_id,
+        'upload_id': upload_id,
+        'filename': filename,
+        'columns': columns,
+        'storage': storage,
+        'created_at': datetime.utcnow(),
+    })
     return jsonify({
         'message': 'Dataset uploaded successfully',
         'upload': {
             'id': str(upload_id),
             'filename': filename,
-            'row_count': len(data),
+            'row_count': storage['row_count'],
             'columns': columns,
+            'normalization': report,
             'created_at': meta['created_at'].isoformat()
         }
     }), 201
+
+
+@analytics_bp.post('/upload-dataset')
+@auth_required
+def upload_dataset():
+    from ..services.dataset_store import write_frame
+    from ..services.dataset_schema import normalize_frame
+    import pandas as pd
+    user_id = request.user['user_id']
+    body = request.get_json() or {}
+    filename = body.get('filename')
+    data = body.get('data', [])
+    columns = body.get('columns', [])
+
+    if not data or not columns:
+        return jsonify({'error': 'Invalid dataset'}), 400
+
+    # Validate required schema
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        return jsonify({'error': 'Missing required columns', 'missing': missing}), 400
+
+    # Type the dataset once here so analytics never coerce per request
+    df = pd.DataFrame(data)
+    df, report = normalize_frame(df[[c for c in columns if c in df.columns]])
+
+    # Persist full dataset (columnar blob + pointer) for preview/analyze/download
+    try:
+        storage = write_frame(df, user_id)
+    except Exception as e:
+        return jsonify({'error': 'Failed to store dataset', 'details': str(e)}), 500
+    return _record_upload(user_id, filename, columns, storage, report)
+
+
+def _iter_upload_chunks(stream, filename):
+    """Parse an uploaded CSV/XLSX stream into DataFrames of at most UPLOAD_CHUNK_ROWS rows."""
+    import pandas as pd
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext not in ('.xlsx', '.xlsm'):
+        yield from pd.read_csv(stream, chunksize=UPLOAD_CHUNK_ROWS)
+        return
+    from openpyxl import load_workbook
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(h).strip() if h is not None else f'Unnamed: {i}' for i, h in enumerate(header)]
+        batch = []
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            batch.append(row[:len(columns)])
+            if len(batch) >= UPLOAD_CHUNK_ROWS:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        yield pd.DataFrame(batch, columns=columns)
+    finally:
+        wb.close()
+
+
+@analytics_bp.post('/upload-dataset/file')
+@auth_required
+def upload_dataset_file():
+    """Multipart upload of a raw CSV/XLSX file (field 'file').
+
+    The file is parsed server-side in chunks of UPLOAD_CHUNK_ROWS rows; required
+    columns are checked on the first chunk and each normalized chunk is appended
+    straight to the dataset's Parquet blob.
+    """
+    from ..services.dataset_store import DatasetWriter
+    from ..services.dataset_schema import normalize_frame
+    user_id = request.user['user_id']
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'No file provided'}), 400
+    filename = request.form.get('filename') or upload.filename
+
+    writer = DatasetWriter(user_id)
+    columns = None
+    report = {'rows': 0, 'coerced': {}}
+    try:
+        for chunk in _iter_upload_chunks(upload.stream, upload.filename):
+            if columns is None:
+                columns = [str(c) for c in chunk.columns]
+                missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+                if missing:
+                    writer.abort()
+                    return jsonify({'error': 'Missing required columns', 'missing': missing}), 400
+            chunk, chunk_report = normalize_frame(chunk)
+            report['rows'] += chunk_report['rows']
+            for c, n in chunk_report['coerced'].items():
+                report['coerced'][c] = report['coerced'].get(c, 0) + n
+            if len(chunk):
+                writer.write(chunk)
+        if not columns or not writer.rows:
+            writer.abort()
+            return jsonify({'error': 'Invalid dataset'}), 400
+        storage = writer.close()
+        if writer.widened:
+            report['widened'] = writer.widened
+    except Exception as e:
+        writer.abort()
+        return jsonify({'error': 'Failed to parse file', 'details': str(e)}), 400
+    return _record_upload(user_id, filename, columns, storage, report)
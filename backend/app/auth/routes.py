@@ -1,11 +1,14 @@
 import os
 import secrets
 from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from bson import ObjectId
-from ..extensions import mongo, bcrypt
+from ..extensions import mongo
 from pymongo.errors import DuplicateKeyError
 from ..services.tokens import create_token, auth_required
+from ..services.dataset_cache import invalidate_user
+from ..services import avatars, users
+from ..services.passwords import hasher, PasswordHashingBusy
 from ..services.email_service import (
     send_verification_email,
     send_reset_otp_email,
@@ -17,6 +20,13 @@ from ..services.email_service import (
 auth_bp = Blueprint('auth', __name__)
 
 
+@auth_bp.errorhandler(PasswordHashingBusy)
+def password_hashing_busy(_):
+    resp = jsonify({'error': 'Server is busy, please try again shortly'})
+    resp.headers['Retry-After'] = '2'
+    return resp, 503
+
+
 def serialize_user(doc):
     return {
         'id': str(doc.get('_id')),
@@ -26,20 +36,12 @@ def serialize_user(doc):
         'company_name': doc.get('company_name'),
         'is_verified': doc.get('is_verified', False),
         'prefs': doc.get('prefs', {}),
-        'avatar': doc.get('avatar'),
+        'avatar': avatars.url(doc.get('_id'), doc.get('avatar')),
         'created_at': doc.get('created_at'),
         'last_login': doc.get('last_login'),
     }
 
 
-@auth_bp.record_once
-def setup_indexes(state):
-    # Ensure indexes on first registration
-    mongo.db.users.create_index('email', unique=True)
-    mongo.db.predictions.create_index([('user_id', 1), ('created_at', -1)])
-    mongo.db.uploads.create_index([('user_id', 1), ('created_at', -1)])
-
-
 @auth_bp.post('/register')
 def register():
     data = request.get_json() or {}
@@ -54,10 +56,10 @@ def register():
     if len(password) < 8:
         return jsonify({'error': 'Password must be at least 8 characters'}), 400
 
-    if mongo.db.users.find_one({'email': email}):
+    if users.find_by_email(email):
         return jsonify({'error': 'Email already registered'}), 409
 
-    password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+    password_hash = hasher.hash(password)
     # Email verification via OTP (6 digits, 15 minutes)
     verify_otp = ''.join([str(secrets.randbelow(10)) for _ in range(6)])
     verify_otp_expires = datetime.utcnow() + timedelta(minutes=15)
@@ -88,11 +90,12 @@ def register():
         return jsonify({'error': 'Failed to create user', 'message': str(e)}), 500
 
     # Send OTP instead of link
-    email_sent = send_verify_otp_email(email, verify_otp)
+    email_status = send_verify_otp_email(email, verify_otp)
     dev_expose_otp = os.getenv('SEND_MAIL', 'true').lower() != 'true'
     payload = {
         'message': 'Registration successful. Enter the OTP sent to your email to verify your account.',
-        'email_sent': email_sent,
+        'email_sent': email_status == 'queued',
+        'email_status': email_status,
         'user': serialize_user(user_doc)
     }
     if dev_expose_otp:
@@ -107,14 +110,14 @@ def verify_email():
     if not token:
         return jsonify({'error': 'Verification token is required'}), 400
 
-    user = mongo.db.users.find_one({'verification_token': token})
+    user = users.find_one({'verification_token': token}, ('verification_token_expires',))
     if not user:
         return jsonify({'error': 'Invalid or expired verification token'}), 400
 
     if not user.get('verification_token_expires') or user['verification_token_expires'] < datetime.utcnow():
         return jsonify({'error': 'Verification token expired'}), 400
 
-    mongo.db.users.update_one({'_id': user['_id']}, {
+    user = users.update_profile(user['_id'], {
         '$set': {
             'is_verified': True,
             'verification_token': None,
@@ -123,7 +126,6 @@ def verify_email():
     })
 
     send_welcome_email(user['email'], user.get('company_name'))
-    user = mongo.db.users.find_one({'_id': user['_id']})
     return jsonify({'message': 'Email verified successfully! You can now log in.', 'user': serialize_user(user)})
 
 
@@ -134,7 +136,7 @@ def resend_verification():
     if not email:
         return jsonify({'error': 'Email is required'}), 400
 
-    user = mongo.db.users.find_one({'email': email})
+    user = users.find_by_email(email, ('is_verified',))
     if not user:
         return jsonify({'error': 'User not found'}), 404
     if user.get('is_verified'):
@@ -143,12 +145,13 @@ def resend_verification():
     # Generate fresh OTP
     otp = ''.join([str(secrets.randbelow(10)) for _ in range(6)])
     expires = datetime.utcnow() + timedelta(minutes=15)
-    mongo.db.users.update_one({'_id': user['_id']}, {
+    users.update(user['_id'], {
         '$set': {'verify_otp': otp, 'verify_otp_expires': expires}
     })
-    email_sent = send_verify_otp_email(email, otp)
+    email_status = send_verify_otp_email(email, otp)
     dev_expose_otp = os.getenv('SEND_MAIL', 'true').lower() != 'true'
-    payload = {'message': 'Verification OTP sent. Please check your inbox.', 'email_sent': email_sent}
+    payload = {'message': 'Verification OTP sent. Please check your inbox.',
+               'email_sent': email_status == 'queued', 'email_status': email_status}
     if dev_expose_otp:
         payload['otp'] = otp
     return jsonify(payload)
@@ -162,20 +165,19 @@ def verify_email_otp():
     if not email or not otp:
         return jsonify({'error': 'Email and OTP are required'}), 400
 
-    user = mongo.db.users.find_one({'email': email})
+    user = users.find_by_email(email, ('verify_otp', 'verify_otp_expires'))
     if not user:
         return jsonify({'error': 'Invalid email'}), 400
 
     if not user.get('verify_otp') or not user.get('verify_otp_expires') or user['verify_otp_expires'] < datetime.utcnow() or user['verify_otp'] != otp:
         return jsonify({'error': 'Invalid or expired OTP'}), 400
 
-    mongo.db.users.update_one({'_id': user['_id']}, {
+    user = users.update_profile(user['_id'], {
         '$set': {'is_verified': True},
         '$unset': {'verify_otp': '', 'verify_otp_expires': ''}
     })
 
     send_welcome_email(user['email'], user.get('company_name'))
-    user = mongo.db.users.find_one({'_id': user['_id']})
     return jsonify({'message': 'Email verified successfully! You can now log in.', 'user': serialize_user(user)})
 
 
@@ -185,18 +187,29 @@ def login():
     email = (data.get('email') or '').strip().lower()
     password = data.get('password') or ''
 
-    user = mongo.db.users.find_one({'email': email})
-    if not user or not bcrypt.check_password_hash(user['password_hash'], password):
+    user = users.find_by_email(email, ('password_hash', 'is_verified'))
+    if not user or not hasher.check(user.get('password_hash'), password):
         return jsonify({'error': 'Invalid email or password'}), 401
     if not user.get('is_verified'):
         return jsonify({'error': 'Please verify your email before logging in'}), 403
+    if hasher.needs_rehash(user['password_hash']):
+        # Upgrade to the configured cost; the filter skips it if the password changed meanwhile.
+        # Bound now: the callback runs after `user` is rebound to the profile below
+        hasher.rehash(password, lambda new_hash, user_id=user['_id'], old_hash=user['password_hash']: users.update(
+            user_id, {'$set': {'password_hash': new_hash}}, query={'password_hash': old_hash}))
 
-    mongo.db.users.update_one({'_id': user['_id']}, {'$set': {'last_login': datetime.utcnow()}})
+    user = users.update_profile(user['_id'], {'$set': {'last_login': datetime.utcnow()}})
 
     token = create_token({'user_id': str(user['_id']), 'email': user['email']}, timedelta(days=7))
     return jsonify({'message': 'Login successful', 'token': token, 'user': serialize_user(user)})
 
 
+@auth_bp.get('/password-stats')
+@auth_required
+def password_stats():
+    return jsonify(hasher.stats())
+
+
 @auth_bp.post('/forgot-password')
 def forgot_password():
     data = request.get_json() or {}
@@ -204,7 +217,7 @@ def forgot_password():
     if not email:
         return jsonify({'error': 'Email is required'}), 400
 
-    user = mongo.db.users.find_one({'email': email})
+    user = users.find_by_email(email, ('is_verified',))
     if not user:
         # Do not reveal user existence
         return jsonify({'message': 'If the email exists, an OTP has been sent'}), 200
@@ -214,10 +227,11 @@ def forgot_password():
 
     otp = ''.join([str(secrets.randbelow(10)) for _ in range(6)])
     expires = datetime.utcnow() + timedelta(minutes=15)
-    mongo.db.users.update_one({'_id': user['_id']}, {'$set': {'reset_otp': otp, 'reset_otp_expires': expires}})
+    users.update(user['_id'], {'$set': {'reset_otp': otp, 'reset_otp_expires': expires}})
 
-    email_sent = send_reset_otp_email(email, otp)
-    return jsonify({'message': 'OTP sent to your email. Please check your inbox.', 'email_sent': email_sent})
+    email_status = send_reset_otp_email(email, otp)
+    return jsonify({'message': 'OTP sent to your email. Please check your inbox.',
+                    'email_sent': email_status == 'queued', 'email_status': email_status})
 
 
 @auth_bp.post('/verify-otp')
@@ -226,7 +240,7 @@ def verify_otp():
     email = (data.get('email') or '').strip().lower()
     otp = (data.get('otp') or '').strip()
 
-    user = mongo.db.users.find_one({'email': email})
+    user = users.find_by_email(email, ('reset_otp', 'reset_otp_expires'))
     if not user:
         return jsonify({'error': 'Invalid credentials'}), 400
 
@@ -257,8 +271,8 @@ def reset_password():
     except Exception as e:
         return jsonify({'error': 'Invalid or expired reset token'}), 401
 
-    password_hash = bcrypt.generate_password_hash(new_password).decode('utf-8')
-    mongo.db.users.update_one({'_id': ObjectId(user_id)}, {
+    password_hash = hasher.hash(new_password)
+    users.update(user_id, {
         '$set': {'password_hash': password_hash},
         '$unset': {'reset_otp': '', 'reset_otp_expires': ''}
     })
@@ -269,7 +283,7 @@ def reset_password():
 @auth_required
 def me():
     user_id = request.user['user_id']
-    user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
+    user = users.get_profile(user_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     return jsonify({'user': serialize_user(user)})
@@ -288,8 +302,9 @@ def update_me():
         update['prefs'] = data['prefs']
     if not update:
         return jsonify({'error': 'No updatable fields provided'}), 400
-    mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$set': update})
-    user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
+    user = users.update_profile(user_id, {'$set': update})
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
     return jsonify({'message': 'Profile updated', 'user': serialize_user(user)})
 
 
@@ -302,11 +317,11 @@ def change_password():
     new_password = data.get('new_password') or ''
     if len(new_password) < 8:
         return jsonify({'error': 'New password must be at least 8 characters'}), 400
-    user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
-    if not user or not bcrypt.check_password_hash(user['password_hash'], current_password):
+    user = users.get_fields(user_id, ('password_hash',))
+    if not user or not hasher.check(user.get('password_hash'), current_password):
         return jsonify({'error': 'Current password is incorrect'}), 400
-    new_hash = bcrypt.generate_password_hash(new_password).decode('utf-8')
-    mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$set': {'password_hash': new_hash}})
+    new_hash = hasher.hash(new_password)
+    users.update(user_id, {'$set': {'password_hash': new_hash}})
     return jsonify({'message': 'Password changed successfully'})
 
 
@@ -315,13 +330,12 @@ def change_password():
 def upload_avatar():
     user_id = request.user['user_id']
     data = request.get_json() or {}
-    avatar_data = data.get('data') or ''
-    if not avatar_data.startswith('data:image/'):
-        return jsonify({'error': 'Invalid image data'}), 400
-    if len(avatar_data) > 1024 * 1024 * 2:  # ~2MB data URL
-        return jsonify({'error': 'Image too large'}), 400
-    mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$set': {'avatar': avatar_data}})
-    user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
+    try:
+        user = avatars.save(user_id, data.get('data') or '')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
     return jsonify({'message': 'Avatar updated', 'user': serialize_user(user)})
 
 
@@ -329,11 +343,35 @@ def upload_avatar():
 @auth_required
 def delete_avatar():
     user_id = request.user['user_id']
-    mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$unset': {'avatar': ''}})
-    user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
+    user = avatars.remove(user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
     return jsonify({'message': 'Avatar removed', 'user': serialize_user(user)})
 
 
+@auth_bp.get('/avatar/<user_id>/<digest>.<ext>')
+def get_avatar(user_id, digest, ext):
+    # No auth_required: browsers send no bearer token with <img> requests
+    if not ObjectId.is_valid(user_id):
+        return jsonify({'error': 'Not found'}), 404
+    found = avatars.lookup(user_id, digest, request.args.get('size', type=int))
+    if found is None or found[1] != ext:
+        return jsonify({'error': 'Not found'}), 404
+    pointer, fmt = found
+    from ..services.dataset_store import open_blob
+    try:
+        with open_blob(pointer) as fh:
+            body = fh.read()
+    except Exception:
+        return jsonify({'error': 'Not found'}), 404
+    resp = Response(body, mimetype=avatars.MIMETYPES.get(fmt, 'application/octet-stream'))
+    resp.add_etag()
+    resp.cache_control.public = True
+    resp.cache_control.max_age = avatars.CACHE_MAX_AGE
+    resp.cache_control.immutable = True
+    return resp.make_conditional(request)
+
+
 @auth_bp.post('/logout')
 @auth_required
 def logout():
@@ -347,14 +385,22 @@ def delete_account():
     data = request.get_json() or {}
     password = data.get('password') or ''
     
-    user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
-    if not user or not bcrypt.check_password_hash(user['password_hash'], password):
+    user = users.get_fields(user_id, ('password_hash',))
+    if not user or not hasher.check(user.get('password_hash'), password):
         return jsonify({'error': 'Incorrect password'}), 400
     
-    # Delete user data
+    # Delete user data (the dataset services load pandas, so only now)
+    from ..services.dataset_store import delete_user_blobs
+    from ..services.shared_frames import shared_frames
     mongo.db.users.delete_one({'_id': ObjectId(user_id)})
+    users.invalidate(user_id)
     mongo.db.predictions.delete_many({'user_id': user_id})
     mongo.db.uploads.delete_many({'user_id': user_id})
+    mongo.db.user_datasets.delete_many({'user_id': user_id})
+    mongo.db.active_datasets.delete_many({'user_id': user_id})
+    delete_user_blobs(user_id)
+    shared_frames.discard(user_id)
+    invalidate_user(user_id)
     
     return jsonify({'message': 'Account deleted successfully'})
 
@@ -373,8 +419,8 @@ def seed_test_user():
     company_name = 'Test User'
 
     # Upsert user
-    existing = mongo.db.users.find_one({'email': email})
-    password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+    existing = users.find_by_email(email)
+    password_hash = hasher.hash(password)
     user_doc = {
         'email': email,
         'password_hash': password_hash,
@@ -385,7 +431,7 @@ def seed_test_user():
         'prefs': {'email_updates': False},
     }
     if existing:
-        mongo.db.users.update_one({'_id': existing['_id']}, {'$set': user_doc})
+        users.update(existing['_id'], {'$set': user_doc})
         user_id = str(existing['_id'])
     else:
         res = mongo.db.users.insert_one(user_doc)
@@ -393,16 +439,22 @@ def seed_test_user():
 
     # Attach demo dataset as active
     try:
-        # Lazy import to avoid circular dependency
-        from ..analytics.routes import load_data
+        # Lazy imports: avoids the circular dependency and keeps pandas out of create_app
+        from ..analytics.routes import _release_active_blob, _warm_rollup
+        from ..services.datasets import load_data
+        from ..services.dataset_store import write_frame
         df = load_data()
-        data = df.to_dict(orient='records')
+        storage = write_frame(df, user_id)
         columns = list(df.columns)
+        _release_active_blob(user_id)
         mongo.db.active_datasets.update_one(
             {'user_id': user_id},
-            {'$set': {'data': data, 'columns': columns, 'filename': 'demo_esg_dataset.csv', 'updated_at': datetime.utcnow()}},
+            {'$set': {'storage': storage, 'columns': columns, 'filename': 'demo_esg_dataset.csv', 'updated_at': datetime.utcnow()},
+             '$unset': {'data': '', 'upload_id': ''}},
             upsert=True,
         )
+        invalidate_user(user_id)
+        _warm_rollup(user_id)
     except Exception as e:
         return jsonify({'error': 'Failed to set demo dataset', 'details': str(e)}), 500
 
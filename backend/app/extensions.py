@@ -1,7 +1,5 @@
 from flask_mail import Mail
-from flask_bcrypt import Bcrypt
 from flask_pymongo import PyMongo
 
 mail = Mail()
-bcrypt = Bcrypt()
 mongo = PyMongo()
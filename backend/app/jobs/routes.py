@@ -0,0 +1,61 @@
+from flask import Blueprint, request, jsonify
+from bson.objectid import ObjectId
+from ..services.tokens import auth_required
+from ..services import jobs
+from ..extensions import mongo
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+def _job_id(jid):
+    try:
+        return ObjectId(jid)
+    except Exception:
+        return None
+
+
+@jobs_bp.get('')
+@auth_required
+def list_jobs():
+    user_id = request.user['user_id']
+    query = {'user_id': user_id}
+    if request.args.get('status'):
+        query['status'] = request.args['status']
+    cursor = mongo.db.jobs.find(query, {'params': 0}).sort('created_at', -1).limit(50)
+    return jsonify({'items': [jobs.serialize_job(d) for d in cursor]})
+
+
+@jobs_bp.get('/<jid>')
+@auth_required
+def get_job(jid):
+    """Job status, progress and a page of (possibly partial) results."""
+    user_id = request.user['user_id']
+    oid = _job_id(jid)
+    if oid is None:
+        return jsonify({'error': 'Invalid job id'}), 400
+    doc = mongo.db.jobs.find_one({'_id': oid, 'user_id': user_id}, {'params': 0})
+    if not doc:
+        return jsonify({'error': 'Not found'}), 404
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = max(1, min(1000, int(request.args.get('limit', 100))))
+    except Exception:
+        offset, limit = 0, 100
+    payload = jobs.serialize_job(doc)
+    payload['results'] = jobs.job_results(doc, offset, limit)
+    payload['offset'] = offset
+    payload['limit'] = limit
+    return jsonify({'job': payload})
+
+
+@jobs_bp.post('/<jid>/cancel')
+@auth_required
+def cancel_job(jid):
+    user_id = request.user['user_id']
+    oid = _job_id(jid)
+    if oid is None:
+        return jsonify({'error': 'Invalid job id'}), 400
+    doc = jobs.request_cancel(oid, user_id)
+    if not doc:
+        return jsonify({'error': 'Job not found or already finished'}), 404
+    return jsonify({'message': 'Cancellation requested', 'job': jobs.serialize_job(doc)})
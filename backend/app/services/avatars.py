@@ -0,0 +1,183 @@
+"""Avatar thumbnails kept in the blob store.
+
+An uploaded image is decoded once, cropped to a square and downscaled to the fixed
+AVATAR_SIZES (WebP, or PNG when Pillow lacks WebP support). The thumbnails go to the
+dataset blob store (GridFS or the local directory, see dataset_store) and the user
+document only keeps a small ``avatar`` record::
+
+    {'hash': <content hash>, 'format': 'webp', 'sizes': {'64': <pointer>, ...}, 'updated_at': ...}
+
+User payloads carry ``url(user_id, avatar)``, a path that embeds the content hash, so a
+new image always gets a new URL and the thumbnails can be served with an immutable,
+year-long Cache-Control.
+
+Pillow and the blob store (pandas/pyarrow) are imported where they are used, keeping
+them off the import path of create_app.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import os
+from datetime import datetime
+
+from . import users
+
+SIZES = tuple(sorted(int(s) for s in os.getenv('AVATAR_SIZES', '64,128,256').split(',') if s.strip()))
+DEFAULT_SIZE = int(os.getenv('AVATAR_DEFAULT_SIZE', 128))
+MAX_BYTES = int(os.getenv('AVATAR_MAX_BYTES', 2 * 1024 * 1024))
+MAX_PIXELS = int(os.getenv('AVATAR_MAX_PIXELS', 40_000_000))
+QUALITY = int(os.getenv('AVATAR_QUALITY', 85))
+CACHE_MAX_AGE = 365 * 24 * 3600
+MIGRATION_ID = 'avatar_blobs'
+MIMETYPES = {'webp': 'image/webp', 'png': 'image/png'}
+
+
+def decode_data_url(data_url: str) -> bytes:
+    """Raw bytes of a base64 ``data:image/...`` URL; ValueError if it is not one."""
+    header, _, payload = (data_url or '').partition(',')
+    if not header.startswith('data:image/') or not header.endswith(';base64'):
+        raise ValueError('Invalid image data')
+    # base64 grows the payload by a third; reject oversized input before decoding it
+    if len(payload) > MAX_BYTES * 4 // 3 + 4:
+        raise ValueError('Image too large')
+    try:
+        return base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError('Invalid image data')
+
+
+def _output_format():
+    from PIL import features
+
+    return 'webp' if features.check('webp') else 'png'
+
+
+def render(raw: bytes):
+    """Square thumbnails of the image in raw as {size: bytes}, plus their format."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        img = Image.open(io.BytesIO(raw))
+    except (UnidentifiedImageError, OSError):
+        raise ValueError('Unsupported image format')
+    if img.width * img.height > MAX_PIXELS:
+        raise ValueError('Image dimensions too large')
+    # JPEG can decode straight at a reduced scale, which is most of the cost for photos
+    img.draft('RGB', (SIZES[-1] * 2, SIZES[-1] * 2))
+    try:
+        img = ImageOps.exif_transpose(img)
+        has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+    except (OSError, SyntaxError, ValueError):
+        raise ValueError('Invalid image data')
+    fmt = _output_format()
+    out = {}
+    for size in SIZES:
+        thumb = ImageOps.fit(img, (size, size), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        if fmt == 'webp':
+            thumb.save(buf, 'WEBP', quality=QUALITY, method=4)
+        else:
+            thumb.save(buf, 'PNG', optimize=True)
+        out[size] = buf.getvalue()
+    return out, fmt
+
+
+def _store(user_id: str, raw: bytes) -> dict:
+    from .dataset_store import write_blob
+
+    thumbs, fmt = render(raw)
+    digest = hashlib.sha256(raw + repr(SIZES).encode()).hexdigest()[:16]
+    sizes = {}
+    try:
+        for size, data in thumbs.items():
+            sizes[str(size)] = write_blob(data, user_id, fmt)
+    except Exception:
+        _delete({'sizes': sizes})
+        raise
+    return {'hash': digest, 'format': fmt, 'sizes': sizes, 'updated_at': datetime.utcnow()}
+
+
+def _delete(avatar):
+    from .dataset_store import delete_blob
+
+    if isinstance(avatar, dict):
+        for pointer in (avatar.get('sizes') or {}).values():
+            delete_blob(pointer)
+
+
+def save(user_id: str, data_url: str):
+    """Replace the user's avatar with the image in data_url; returns the updated profile.
+
+    ValueError for data that is not a usable image.
+    """
+    avatar = _store(user_id, decode_data_url(data_url))
+    # The old thumbnails go only once the user points at the new ones; the new ones
+    # go if that never happens, so neither a failure nor a missing user leaks blobs
+    try:
+        previous = users.get_fields(user_id, ('avatar',))
+        profile = users.update_profile(user_id, {'$set': {'avatar': avatar}})
+    except Exception:
+        _delete(avatar)
+        raise
+    if profile is None:
+        _delete(avatar)
+        return None
+    _delete((previous or {}).get('avatar'))
+    return profile
+
+
+def remove(user_id: str):
+    previous = users.get_fields(user_id, ('avatar',))
+    profile = users.update_profile(user_id, {'$unset': {'avatar': ''}})
+    _delete((previous or {}).get('avatar'))
+    return profile
+
+
+def url(user_id, avatar, size=None):
+    """Content-hashed path of the user's avatar (None without one)."""
+    if not isinstance(avatar, dict) or not avatar.get('hash'):
+        return None
+    path = f"/api/auth/avatar/{user_id}/{avatar['hash']}.{avatar.get('format', 'webp')}"
+    return path if size is None else f'{path}?size={size}'
+
+
+def _nearest_size(avatar, size):
+    stored = sorted(int(s) for s in avatar['sizes'])
+    fit = [s for s in stored if s >= size]
+    return str(fit[0] if fit else stored[-1])
+
+
+def lookup(user_id: str, digest: str, size=None):
+    """The pointer and format of a stored thumbnail, or None if digest is not current."""
+    avatar = (users.get_profile(user_id) or {}).get('avatar')
+    if not isinstance(avatar, dict) or avatar.get('hash') != digest:
+        # Another worker may have changed it within the profile cache TTL
+        avatar = (users.get_fields(user_id, ('avatar',)) or {}).get('avatar')
+    if not isinstance(avatar, dict) or avatar.get('hash') != digest or not avatar.get('sizes'):
+        return None
+    key = _nearest_size(avatar, size or DEFAULT_SIZE)
+    return avatar['sizes'][key], avatar.get('format', 'webp')
+
+
+def migrate_inline_avatars(db):
+    """Move avatars stored inline as data URLs into the blob store.
+
+    Runs once per database; an inline avatar that cannot be decoded is dropped.
+    """
+    if db.migrations.find_one({'_id': MIGRATION_ID}):
+        return 0
+    done = 0
+    for doc in db.users.find({'avatar': {'$type': 'string'}}, {'avatar': 1}):
+        user_id = str(doc['_id'])
+        try:
+            update = {'$set': {'avatar': _store(user_id, decode_data_url(doc['avatar']))}}
+        except ValueError:
+            update = {'$unset': {'avatar': ''}}
+        db.users.update_one({'_id': doc['_id'], 'avatar': doc['avatar']}, update)
+        users.invalidate(user_id)
+        done += 1
+    db.migrations.update_one({'_id': MIGRATION_ID},
+                             {'$set': {'documents': done, 'finished_at': datetime.utcnow()}}, upsert=True)
+    return done
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .result_cache import result_cache
+
+
+class DatasetCache:
+    """In-process LRU of per-user DataFrames, bounded by their memory footprint.
+
+    Entries are keyed by user id and tagged with the version of the active dataset
+    they were built from. A lookup with a different version is a miss, so a stale
+    frame is never served once the caller has seen the new version.
+    """
+
+    def __init__(self, max_bytes, version_ttl):
+        self.max_bytes = max_bytes
+        # How long (seconds) a cached entry is trusted without re-checking its version
+        self.version_ttl = version_ttl
+        self._entries = OrderedDict()  # user_id -> dict(version, df, nbytes, checked_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_recent(self, user_id):
+        """Return the cached frame if its version was confirmed within version_ttl."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry['checked_at'] > self.version_ttl:
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry['df']
+
+    def recent_version(self, user_id):
+        """Version of the cached frame if it was confirmed within version_ttl, else None."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry['checked_at'] > self.version_ttl:
+                return None
+            return entry['version']
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry['version'] != version:
+                self.misses += 1
+                return None
+            entry['checked_at'] = time.monotonic()
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry['df']
+
+    def put(self, user_id, version, df):
+        try:
+            nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        except Exception:
+            nbytes = 0
+        with self._lock:
+            self._drop(user_id)
+            if nbytes > self.max_bytes:
+                # Larger than the whole budget: serve it uncached
+                return df
+            self._entries[user_id] = {
+                'version': version,
+                'df': df,
+                'nbytes': nbytes,
+                'checked_at': time.monotonic(),
+            }
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+        return df
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._drop(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry['nbytes']
+
+
+dataset_cache = DatasetCache(
+    max_bytes=int(os.getenv('DATASET_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+    version_ttl=float(os.getenv('DATASET_CACHE_VERSION_TTL', 5)),
+)
+
+
+def dataset_version(doc):
+    """Version tag of an active_datasets document ('' when the user has no active dataset)."""
+    if not doc:
+        return ''
+    updated = doc.get('updated_at')
+    return f"{doc.get('upload_id') or ''}:{updated.isoformat() if hasattr(updated, 'isoformat') else updated}"
+
+
+def invalidate_user(user_id):
+    """Drop the user's cached frame and every cached analytics result derived from it."""
+    from .rollup import rollup_cache  # numpy/pandas stay off the import path of create_app
+
+    dataset_cache.invalidate(str(user_id))
+    rollup_cache.invalidate(str(user_id))
+    result_cache.invalidate_user(str(user_id))
@@ -0,0 +1,73 @@
+"""Canonical column types for ESG datasets.
+
+Frames are normalized once when they enter the system (upload, seed, first load
+of a legacy document) so the request path can filter and aggregate them as-is.
+"""
+import numpy as np
+import pandas as pd
+
+NUMERIC_COLUMNS = [
+    'Year', 'Revenue', 'ProfitMargin', 'MarketCap', 'GrowthRate',
+    'ESG_Overall', 'ESG_Environmental', 'ESG_Social', 'ESG_Governance',
+    'CarbonEmissions', 'WaterUsage', 'EnergyConsumption'
+]
+CATEGORICAL_COLUMNS = ['CompanyName', 'Industry', 'Region']
+# Integer columns stored with a narrow dtype when they hold no missing/fractional values
+INTEGER_COLUMNS = {'Year': np.int16, 'CompanyID': np.int32}
+
+
+def is_normalized(df: pd.DataFrame) -> bool:
+    for c in NUMERIC_COLUMNS:
+        if c in df.columns and not pd.api.types.is_numeric_dtype(df[c]):
+            return False
+    for c in CATEGORICAL_COLUMNS:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            return False
+    return True
+
+
+def _narrow_int(s: pd.Series, dtype):
+    valid = s.dropna()
+    if len(valid) != len(s) or not (valid == np.floor(valid)).all():
+        return s
+    info = np.iinfo(dtype)
+    if len(valid) and (valid.min() < info.min or valid.max() > info.max):
+        return s
+    return s.astype(dtype)
+
+
+def normalize_frame(df: pd.DataFrame):
+    """Return (typed_frame, report).
+
+    Numeric columns are coerced once (unparseable values become NaN and are
+    counted in the report), Year/CompanyID are narrowed to int16/int32 when
+    lossless, and the string dimensions become categoricals. Measures stay
+    float64 so aggregates match the values users uploaded.
+    """
+    report = {'rows': int(len(df)), 'coerced': {}}
+    if is_normalized(df):
+        return df, report
+    out = df.copy()
+    for c in NUMERIC_COLUMNS + ['CompanyID']:
+        if c not in out.columns:
+            continue
+        col = out[c]
+        if c == 'CompanyID' and not pd.api.types.is_numeric_dtype(col):
+            continue  # free-form ids are left untouched
+        if not pd.api.types.is_numeric_dtype(col):
+            converted = pd.to_numeric(col, errors='coerce')
+            bad = int((converted.isna() & col.notna()).sum())
+            if bad:
+                report['coerced'][c] = bad
+            col = converted.astype('float64')
+        if c in INTEGER_COLUMNS:
+            col = _narrow_int(col, INTEGER_COLUMNS[c])
+        out[c] = col
+    for c in CATEGORICAL_COLUMNS:
+        if c in out.columns and not isinstance(out[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype('category')
+    return out, report
+
+
+def ensure_normalized(df: pd.DataFrame) -> pd.DataFrame:
+    return normalize_frame(df)[0]
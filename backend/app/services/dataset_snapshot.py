@@ -0,0 +1,64 @@
+"""Binary (Parquet) snapshot of the bundled CSV dataset.
+
+Parsing the CSV and normalizing its dtypes is the slowest part of a cold start, so the
+normalized frame is kept as a Parquet file next to it (DATASET_SNAPSHOT_DIR, default
+``<csv dir>/.snapshots``). The snapshot records the SHA-1 of the CSV it was built from
+and is rebuilt whenever the CSV changes; a missing or unwritable snapshot directory
+just means the CSV is parsed as before.
+"""
+import hashlib
+import os
+import uuid
+
+SOURCE_KEY = b'esg_source_sha1'
+
+
+def source_digest(csv_path):
+    h = hashlib.sha1()
+    with open(csv_path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def snapshot_path(csv_path):
+    directory = os.getenv('DATASET_SNAPSHOT_DIR') or os.path.join(os.path.dirname(csv_path), '.snapshots')
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(directory, f'{name}.parquet')
+
+
+def load(csv_path, digest):
+    """The snapshot frame if it was built from this exact CSV, else None."""
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    path = snapshot_path(csv_path)
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+        if metadata.get(SOURCE_KEY) != digest.encode():
+            return None
+        return pd.read_parquet(path)
+    except Exception:
+        return None
+
+
+def save(csv_path, digest, df):
+    """Write df as the snapshot of csv_path (best effort; returns whether it was written)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = snapshot_path(csv_path)
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), SOURCE_KEY: digest.encode()})
+        pq.write_table(table, tmp, compression='zstd')
+        os.replace(tmp, path)
+        return True
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
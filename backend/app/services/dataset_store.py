@@ -0,0 +1,482 @@
+"""Columnar storage for uploaded and active datasets.
+
+Datasets are written once as Parquet (compressed, split into row groups) to
+GridFS or a local blob directory. Mongo documents in user_datasets only carry
+the small ``storage`` pointer returned by ``write_frame``; readers fetch just the
+columns and row groups they need. An active dataset activated from an upload
+references it by ``upload_id`` and holds no storage of its own.
+
+Later appends/upserts are stored as small Parquet deltas listed in the pointer
+(``storage['deltas']``) and replayed in order on read, until add_delta folds
+them back into a single base blob.
+
+pyarrow is imported where it is used, keeping it off the import path of create_app.
+"""
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime
+
+import gridfs
+import numpy as np
+import pandas as pd
+from bson.objectid import ObjectId
+
+from ..extensions import mongo
+from .dataset_schema import INTEGER_COLUMNS
+
+ROW_GROUP_SIZE = int(os.getenv('DATASET_ROW_GROUP_SIZE', 50000))
+MAX_DELTAS = int(os.getenv('DATASET_MAX_DELTAS', 16))
+UPSERT_KEY = ['CompanyID', 'Year']
+ACTIVE_REFS_MIGRATION_ID = 'active_dataset_refs'
+DELTA_MODES = ('append', 'upsert')
+COMPRESSION = os.getenv('DATASET_COMPRESSION', 'zstd')
+GRIDFS_BUCKET = 'dataset_blobs'
+
+
+def _backend():
+    return os.getenv('DATASET_STORE', 'gridfs').lower()
+
+
+def _local_dir():
+    # backend/var/datasets unless overridden (var/ is git-ignored)
+    default = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'var', 'datasets')
+    return os.getenv('DATASET_STORE_DIR', default)
+
+
+def _fs():
+    return gridfs.GridFS(mongo.db, collection=GRIDFS_BUCKET)
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Stringify object columns that mix types (e.g. numbers and text from a loose CSV)."""
+    out = df
+    for c in df.columns:
+        if df[c].dtype == object:
+            kind = pd.api.types.infer_dtype(df[c], skipna=True)
+            if kind not in ('string', 'empty', 'boolean', 'integer', 'floating', 'decimal', 'date', 'datetime'):
+                if out is df:
+                    out = df.copy()
+                out[c] = df[c].where(df[c].isna(), df[c].astype(str))
+    return out
+
+
+def _put(fh, user_id: str, ext: str):
+    """Copy an open binary file into the configured backend; returns (backend, ref)."""
+    backend = _backend()
+    name = f'{uuid.uuid4().hex}.{ext}'
+    if backend == 'local':
+        user_dir = os.path.join(_local_dir(), str(user_id))
+        os.makedirs(user_dir, exist_ok=True)
+        with open(os.path.join(user_dir, name), 'wb') as out:
+            shutil.copyfileobj(fh, out)
+        return backend, f'{user_id}/{name}'
+    return backend, str(_fs().put(fh, filename=name, metadata={'user_id': str(user_id)}))
+
+
+def write_frame(df: pd.DataFrame, user_id: str) -> dict:
+    """Persist df as Parquet and return the storage pointer to keep in Mongo."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(_arrow_safe(df), preserve_index=False)
+    buf = io.BytesIO()
+    pq.write_table(table, buf, row_group_size=ROW_GROUP_SIZE, compression=COMPRESSION)
+    size = buf.tell()
+    buf.seek(0)
+    backend, ref = _put(buf, user_id, 'parquet')
+    return {
+        'backend': backend,
+        'ref': ref,
+        'format': 'parquet',
+        'row_count': int(table.num_rows),
+        'columns': list(table.column_names),
+        'size_bytes': size,
+    }
+
+
+def write_rendition(text_chunks, user_id: str, fmt: str) -> dict:
+    """Store a text rendition (csv, or gzip'd csv for fmt='csv.gz') written chunk by chunk."""
+    with tempfile.TemporaryFile() as tmp:
+        out = gzip.GzipFile(fileobj=tmp, mode='wb') if fmt.endswith('.gz') else tmp
+        for chunk in text_chunks:
+            out.write(chunk.encode('utf-8'))
+        if out is not tmp:
+            out.close()
+        size = tmp.tell()
+        tmp.seek(0)
+        backend, ref = _put(tmp, user_id, fmt)
+    return {'backend': backend, 'ref': ref, 'format': fmt, 'size_bytes': size}
+
+
+def write_blob(data: bytes, user_id: str, fmt: str) -> dict:
+    """Store a small binary blob (e.g. an avatar thumbnail) and return its pointer."""
+    backend, ref = _put(io.BytesIO(data), user_id, fmt)
+    return {'backend': backend, 'ref': ref, 'format': fmt, 'size_bytes': len(data)}
+
+
+def _column_kind(col: pd.Series) -> str:
+    """Storage kind of a chunk column: null, bool, int, float or string."""
+    if not col.notna().any():
+        return 'null'
+    if isinstance(col.dtype, pd.CategoricalDtype) or col.dtype == object:
+        return 'string'
+    if pd.api.types.is_bool_dtype(col):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(col):
+        return 'int'
+    if pd.api.types.is_float_dtype(col):
+        # Integer columns with gaps arrive as float; keep them integers (CompanyID 1, not 1.0)
+        valid = col.dropna()
+        return 'int' if col.name in INTEGER_COLUMNS and (valid == np.floor(valid)).all() else 'float'
+    return 'string'
+
+
+def _join_kinds(a: str, b: str) -> str:
+    if a == b or b == 'null':
+        return a
+    if a == 'null':
+        return b
+    if {a, b} == {'int', 'float'}:
+        return 'float'
+    return 'string'
+
+
+def _as_text(col: pd.Series) -> pd.Series:
+    if pd.api.types.is_float_dtype(col):
+        valid = col.dropna()
+        if (valid == np.floor(valid)).all():
+            col = col.astype('Int64')  # 7, not 7.0
+    col = col.astype(object)
+    return col.where(col.isna(), col.astype(str)).where(col.notna(), None)
+
+
+class DatasetWriter:
+    """Incremental Parquet writer for datasets parsed in chunks.
+
+    Each column's type is inferred from the first chunk and widened when a later
+    chunk does not fit it (int -> float -> string; an all-empty column takes the
+    type of the first values seen). Widening rewrites the rows written so far
+    once, so no value is ever coerced away; ``widened`` lists the columns that
+    turned to text this way.
+    Integer columns stay integers, and readers narrow the known columns again
+    through normalize_frame.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.rows = 0
+        self.widened = {}
+        self._tmp = tempfile.TemporaryFile()
+        self._kinds = None  # column -> kind, in first-chunk order
+        self._writer = None
+
+    def _schema(self):
+        import pyarrow as pa
+
+        types = {'null': pa.null(), 'bool': pa.bool_(), 'int': pa.int64(), 'float': pa.float64(), 'string': pa.string()}
+        return pa.schema([pa.field(c, types[k]) for c, k in self._kinds.items()])
+
+    def _table(self, df: pd.DataFrame):
+        import pyarrow as pa
+
+        arrays = []
+        for field in self._schema():
+            col = df[field.name] if field.name in df.columns else pd.Series([None] * len(df), dtype=object)
+            kind = self._kinds[field.name]
+            if kind == 'null':
+                arrays.append(pa.nulls(len(df)))
+                continue
+            if kind == 'string':
+                col = _as_text(col)
+            elif kind == 'bool':
+                col = col.astype(object).where(col.notna(), None)
+            else:
+                if not pd.api.types.is_numeric_dtype(col):
+                    col = pd.to_numeric(col.astype(object))
+                col = col.astype('Int64' if kind == 'int' else 'float64')
+            arrays.append(pa.array(col, type=field.type, from_pandas=True))
+        return pa.Table.from_arrays(arrays, schema=self._schema())
+
+    def _widen(self, kinds):
+        """Switch to the wider column kinds, rewriting what was written so far."""
+        import pyarrow.parquet as pq
+
+        previous = None
+        if self._writer is not None:
+            self._writer.close()
+            self._tmp.seek(0)
+            previous = pq.read_table(self._tmp).to_pandas()
+            self._tmp.close()
+            self._tmp = tempfile.TemporaryFile()
+            self._writer = None
+        for c, k in kinds.items():
+            if k == 'string' and self._kinds[c] != 'null':
+                self.widened[c] = k
+        self._kinds.update(kinds)
+        if previous is not None:
+            self._append(previous)
+
+    def _append(self, df: pd.DataFrame):
+        import pyarrow.parquet as pq
+
+        table = self._table(df)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._tmp, self._schema(), compression=COMPRESSION)
+        self._writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+
+    def write(self, df: pd.DataFrame):
+        if self._kinds is None:
+            self._kinds = {str(c): 'null' for c in df.columns}
+        wider = {}
+        for c, current in self._kinds.items():
+            if c in df.columns:
+                kind = _join_kinds(current, _column_kind(df[c]))
+                if kind != current:
+                    wider[c] = kind
+        if wider:
+            self._widen(wider)
+        self._append(df.rename(columns=str))
+        self.rows += len(df)
+
+    def close(self) -> dict:
+        """Finish the file, move it to the backend and return its storage pointer."""
+        try:
+            if self._writer is None:
+                raise ValueError('No rows written')
+            self._writer.close()
+            size = self._tmp.seek(0, io.SEEK_END)
+            self._tmp.seek(0)
+            backend, ref = _put(self._tmp, self.user_id, 'parquet')
+        finally:
+            self._tmp.close()
+        return {
+            'backend': backend,
+            'ref': ref,
+            'format': 'parquet',
+            'row_count': self.rows,
+            'columns': list(self._kinds),
+            'size_bytes': size,
+        }
+
+    def abort(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+        self._tmp.close()
+
+
+def _open(pointer: dict):
+    if pointer.get('backend') == 'local':
+        return open(os.path.join(_local_dir(), pointer['ref']), 'rb')
+    return _fs().get(ObjectId(pointer['ref']))
+
+
+def open_blob(pointer: dict):
+    """Raw file object over the stored blob (caller closes it)."""
+    return _open(pointer)
+
+
+def read_frame(pointer: dict, columns=None, rows=None) -> pd.DataFrame:
+    """Load a stored dataset.
+
+    columns: optional list of column names to read.
+    rows: optional (start, stop) range; only the row groups covering it are read.
+    A pointer with deltas is replayed in full first (only the requested columns plus
+    the upsert key are read).
+    """
+    import pyarrow.parquet as pq
+
+    if pointer.get('deltas'):
+        return _read_patched(pointer, columns, rows)
+    with _open(pointer) as fh:
+        pf = pq.ParquetFile(fh)
+        if columns is not None:
+            columns = [c for c in columns if c in pf.schema_arrow.names]
+        if rows is None:
+            return pf.read(columns=columns).to_pandas()
+        start, stop = max(0, rows[0]), min(rows[1], pf.metadata.num_rows)
+        if start >= stop:
+            return pf.schema_arrow.empty_table().select(columns or pf.schema_arrow.names).to_pandas()
+        groups, offset, first = [], 0, None
+        for i in range(pf.metadata.num_row_groups):
+            n = pf.metadata.row_group(i).num_rows
+            if offset + n > start and offset < stop:
+                groups.append(i)
+                if first is None:
+                    first = offset
+            offset += n
+        table = pf.read_row_groups(groups, columns=columns)
+        return table.slice(start - first, stop - start).to_pandas()
+
+
+def _read_patched(pointer, columns=None, rows=None):
+    needed = None if columns is None else list(dict.fromkeys(list(columns) + UPSERT_KEY))
+    base = dict(pointer, deltas=[])
+    df = read_frame(base, columns=needed)
+    for part in pointer['deltas']:
+        delta = read_frame(part, columns=needed)
+        df = apply_delta(df, delta, part.get('mode', 'append'))[0]
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    if rows is not None:
+        df = df.iloc[max(0, rows[0]):rows[1]].reset_index(drop=True)
+    return df
+
+
+def iter_frames(pointer: dict, columns=None, batch_size=None):
+    """Yield the stored dataset as DataFrames of at most batch_size rows."""
+    import pyarrow.parquet as pq
+
+    if pointer.get('deltas'):
+        df = _read_patched(pointer, columns)
+        step = batch_size or ROW_GROUP_SIZE
+        for start in range(0, max(len(df), 1), step):
+            yield df.iloc[start:start + step]
+        return
+    with _open(pointer) as fh:
+        pf = pq.ParquetFile(fh)
+        if columns is not None:
+            columns = [c for c in columns if c in pf.schema_arrow.names]
+        for batch in pf.iter_batches(batch_size=batch_size or ROW_GROUP_SIZE, columns=columns):
+            yield batch.to_pandas()
+
+
+def iter_dataset(doc: dict, columns=None, batch_size=None):
+    """Chunked counterpart of read_dataset."""
+    if doc.get('storage'):
+        yield from iter_frames(doc['storage'], columns=columns, batch_size=batch_size)
+        return
+    df = read_dataset(doc, columns=columns)
+    step = batch_size or ROW_GROUP_SIZE
+    for start in range(0, max(len(df), 1), step):
+        yield df.iloc[start:start + step]
+
+
+def apply_delta(df: pd.DataFrame, delta: pd.DataFrame, mode: str):
+    """Return (patched, replaced, inserted).
+
+    append adds the delta rows at the end. upsert overwrites, in place, every row whose
+    (CompanyID, Year) appears in the delta (the last delta row per key wins) and appends
+    the rest. ``replaced`` holds the previous version of the overwritten rows and
+    ``inserted`` the rows that took their place or were appended, so patched equals df
+    minus replaced plus inserted (as multisets).
+    """
+    if mode == 'upsert':
+        delta = delta.drop_duplicates(UPSERT_KEY, keep='last')
+    if mode == 'upsert' and len(df):
+        keys, base_keys = _upsert_keys(delta), _upsert_keys(df)
+        pos = pd.MultiIndex.from_frame(keys).get_indexer(pd.MultiIndex.from_frame(base_keys))
+        matched = pos >= 0
+        fresh = np.ones(len(delta), dtype=bool)
+        fresh[pos[matched]] = False
+    else:
+        pos = np.full(len(df), -1)
+        matched = np.zeros(len(df), dtype=bool)
+        fresh = np.ones(len(delta), dtype=bool)
+    if not matched.any():
+        inserted = delta[fresh]
+        patched = pd.concat([df, inserted], ignore_index=True) if len(df) else inserted.reset_index(drop=True)
+        return patched, df.iloc[0:0], inserted
+    # Stitch kept rows, overwritten rows and new rows back together in their final order
+    order = np.concatenate([np.flatnonzero(~matched), np.flatnonzero(matched), len(df) + np.arange(int(fresh.sum()))])
+    inserted = pd.concat([delta.iloc[pos[matched]], delta[fresh]], ignore_index=True)
+    parts = pd.concat([df[~matched], inserted], ignore_index=True)
+    patched = parts.iloc[np.argsort(order, kind='stable')].reset_index(drop=True)
+    return patched, df[matched], inserted
+
+
+def _upsert_keys(df):
+    """Key columns in a comparable form: numeric as float64 (2020 == 2020.0), anything else as text."""
+    out = {}
+    for c in UPSERT_KEY:
+        col = df[c]
+        out[c] = col.astype('float64') if pd.api.types.is_numeric_dtype(col) else col.astype(str)
+    return pd.DataFrame(out)
+
+
+def add_delta(pointer: dict, delta: pd.DataFrame, mode: str, user_id: str, row_count: int, current=None):
+    """Store delta as a new segment of the dataset; returns (pointer, superseded_blobs).
+
+    Only the delta is written, unless the pointer now has more than MAX_DELTAS segments:
+    then ``current`` (or the replayed dataset) is written as the new base and the old
+    blobs are returned for the caller to delete once no document references them.
+    """
+    part = write_frame(delta, user_id)
+    columns = list(pointer.get('columns') or [])
+    columns += [c for c in part['columns'] if c not in columns]
+    deltas = list(pointer.get('deltas') or []) + [dict(part, mode=mode)]
+    updated = dict(pointer, deltas=deltas, columns=columns, row_count=int(row_count))
+    if len(deltas) <= MAX_DELTAS:
+        return updated, []
+    full = current if current is not None else read_frame(updated)
+    return write_frame(full, user_id), [dict(pointer, deltas=[])] + deltas
+
+
+def delete_blob(pointer: dict):
+    if not pointer:
+        return
+    for part in pointer.get('deltas') or []:
+        delete_blob(part)
+    try:
+        if pointer.get('backend') == 'local':
+            os.remove(os.path.join(_local_dir(), pointer['ref']))
+        else:
+            _fs().delete(ObjectId(pointer['ref']))
+    except Exception:
+        pass
+
+
+def delete_user_blobs(user_id: str):
+    if _backend() == 'local':
+        shutil.rmtree(os.path.join(_local_dir(), str(user_id)), ignore_errors=True)
+        return
+    fs = _fs()
+    for f in fs.find({'metadata.user_id': str(user_id)}):
+        fs.delete(f._id)
+
+
+def drop_copied_active_data(db):
+    """Strip the rows/pointers copied into active_datasets before activation became a reference.
+
+    Runs once per database. Blobs are left alone: they belong to the referenced upload.
+    """
+    if db.migrations.find_one({'_id': ACTIVE_REFS_MIGRATION_ID}):
+        return 0
+    done = 0
+    query = {'upload_id': {'$type': 'objectId'}, '$or': [{'storage': {'$exists': True}}, {'data': {'$exists': True}}]}
+    for doc in db.active_datasets.find(query, {'user_id': 1, 'upload_id': 1}):
+        if db.user_datasets.find_one({'upload_id': doc['upload_id'], 'user_id': doc['user_id']}, {'_id': 1}):
+            db.active_datasets.update_one({'_id': doc['_id']}, {'$unset': {'storage': '', 'data': ''}})
+            done += 1
+    db.migrations.update_one({'_id': ACTIVE_REFS_MIGRATION_ID},
+                             {'$set': {'documents': done, 'finished_at': datetime.utcnow()}}, upsert=True)
+    return done
+
+
+def read_dataset(doc: dict, columns=None, rows=None) -> pd.DataFrame:
+    """Load the dataset referenced by a user_datasets/active_datasets document.
+
+    Handles both the storage pointer and legacy documents holding a ``data`` row array.
+    """
+    if not doc:
+        return pd.DataFrame()
+    if doc.get('storage'):
+        return read_frame(doc['storage'], columns=columns, rows=rows)
+    data = doc.get('data') or []
+    if rows is not None:
+        data = data[rows[0]:rows[1]]
+    df = pd.DataFrame(data)
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+
+def frame_records(df: pd.DataFrame) -> list:
+    """Row dicts with missing values as None so they serialize as JSON null."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
@@ -1,7 +1,7 @@
 from flask_mail import Message
 from flask import current_app
 import os
-from ..extensions import mail
+from . import mail_outbox
 
 
 def _branding_context():
@@ -11,6 +11,20 @@ def _branding_context():
     }
 
 
+def _queue(msg, kind):
+    """Hand the message to the outbox; returns 'queued', or 'failed' if it could not be stored.
+
+    Routes report this as ``email_status``, next to the ``email_sent`` bool clients already
+    read (true once the message is queued).
+    """
+    try:
+        mail_outbox.enqueue(msg, kind)
+        return 'queued'
+    except Exception as e:
+        current_app.logger.error(f"Email queue error: {e}")
+        return 'failed'
+
+
 def send_verification_email(user_email, token):
     frontend = os.getenv('FRONTEND_URL', 'http://localhost:5173')
     verification_url = f"{frontend}/verify-email?token={token}"
@@ -51,12 +65,7 @@ def send_verification_email(user_email, token):
       </div>
     """
 
-    try:
-        mail.send(msg)
-        return True
-    except Exception as e:
-        current_app.logger.error(f"Email send error: {e}")
-        return False
+    return _queue(msg, 'verification')
 
 
 def send_reset_otp_email(user_email, otp):
@@ -78,12 +87,7 @@ def send_reset_otp_email(user_email, otp):
       </div>
     """
 
-    try:
-        mail.send(msg)
-        return True
-    except Exception as e:
-        current_app.logger.error(f"Email send error: {e}")
-        return False
+    return _queue(msg, 'reset_otp')
 
 
 def send_verify_otp_email(user_email, otp):
@@ -105,12 +109,7 @@ def send_verify_otp_email(user_email, otp):
       </div>
     """
 
-    try:
-        mail.send(msg)
-        return True
-    except Exception as e:
-        current_app.logger.error(f"Email send error: {e}")
-        return False
+    return _queue(msg, 'verify_otp')
 
 
 def send_welcome_email(user_email, company_name=None):
@@ -135,9 +134,4 @@ def send_welcome_email(user_email, company_name=None):
       </div>
     """
 
-    try:
-        mail.send(msg)
-        return True
-    except Exception as e:
-        current_app.logger.error(f"Email send error: {e}")
-        return False
+    return _queue(msg, 'welcome')
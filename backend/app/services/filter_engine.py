@@ -0,0 +1,174 @@
+"""Indexed evaluation of the analytics filter payload.
+
+A FilterIndex is built lazily for each cached dataset frame (so once per
+dataset version) and keeps:
+  - a stable argsort per range column, searched with np.searchsorted;
+  - per-category row bitmaps for Industry and Region.
+Predicates are ordered by their exact match counts (known from the indexes
+before touching any rows), the smallest one seeds the candidate row set and
+the rest only test those candidates. Rows are materialized once, with take().
+"""
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# payload key -> (column, bound) where bound is 'min', 'max' or 'range'
+RANGE_FILTERS = {
+    'yearRange': ('Year', 'range'),
+    'minESGScore': ('ESG_Overall', 'min'),
+    'minRevenue': ('Revenue', 'min'),
+    'maxCarbonEmissions': ('CarbonEmissions', 'max'),
+    'maxEnergyConsumption': ('EnergyConsumption', 'max'),
+    'minGrowthRate': ('GrowthRate', 'min'),
+}
+CATEGORY_FILTERS = {
+    'industries': 'Industry',
+    'regions': 'Region',
+}
+
+
+class _RangeIndex:
+    def __init__(self, values: np.ndarray):
+        self.values = values
+        order = np.argsort(values, kind='stable')
+        # NaNs sort last and never satisfy a bound, so they are left out
+        valid = int((~np.isnan(values)).sum())
+        self.order = order[:valid]
+        self.sorted = values[order[:valid]]
+
+    def bounds(self, lo, hi):
+        left = 0 if lo is None else int(np.searchsorted(self.sorted, lo, side='left'))
+        right = len(self.sorted) if hi is None else int(np.searchsorted(self.sorted, hi, side='right'))
+        return left, max(left, right)
+
+
+class _CategoryIndex:
+    def __init__(self, series: pd.Series):
+        cat = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+        self.categories = cat.cat.categories
+        self.codes = cat.cat.codes.to_numpy()
+        self.bitmaps = [self.codes == i for i in range(len(self.categories))]
+        self.counts = np.array([int(b.sum()) for b in self.bitmaps], dtype=np.int64)
+
+    def selected(self, values):
+        idx = self.categories.get_indexer(pd.Index(list(values)))
+        return np.unique(idx[idx >= 0])
+
+
+class FilterIndex:
+    def __init__(self, df: pd.DataFrame):
+        self._frame = weakref.ref(df)
+        self.size = len(df)
+        self._ranges = {}
+        self._categories = {}
+        self._lock = threading.Lock()
+
+    def frame(self):
+        return self._frame()
+
+    def range_index(self, column):
+        idx = self._ranges.get(column)
+        if idx is None:
+            values = self.frame()[column].to_numpy(dtype='float64', na_value=np.nan)
+            with self._lock:
+                idx = self._ranges.setdefault(column, _RangeIndex(values))
+        return idx
+
+    def category_index(self, column):
+        idx = self._categories.get(column)
+        if idx is None:
+            series = self.frame()[column]
+            with self._lock:
+                idx = self._categories.setdefault(column, _CategoryIndex(series))
+        return idx
+
+    def _predicates(self, filters):
+        preds = []
+        for key, (column, bound) in RANGE_FILTERS.items():
+            if key not in filters:
+                continue
+            value = filters[key]
+            if bound == 'range':
+                lo, hi = float(value[0]), float(value[1])
+            elif bound == 'min':
+                lo, hi = float(value), None
+            else:
+                lo, hi = None, float(value)
+            ridx = self.range_index(column)
+            left, right = ridx.bounds(lo, hi)
+            preds.append((right - left, 'range', (ridx, lo, hi, left, right)))
+        for key, column in CATEGORY_FILTERS.items():
+            if not filters.get(key):
+                continue
+            cidx = self.category_index(column)
+            sel = cidx.selected(filters[key])
+            preds.append((int(cidx.counts[sel].sum()), 'category', (cidx, sel)))
+        preds.sort(key=lambda p: p[0])
+        return preds
+
+    def matching_rows(self, filters):
+        """Sorted positional row ids matching filters, or None when nothing filters."""
+        preds = self._predicates(filters)
+        if not preds:
+            return None
+        count, kind, payload = preds[0]
+        if count == 0:
+            return np.empty(0, dtype=np.int64)
+        if kind == 'range':
+            ridx, _, _, left, right = payload
+            rows = np.sort(ridx.order[left:right])
+        else:
+            cidx, sel = payload
+            mask = np.zeros(self.size, dtype=bool)
+            for i in sel:
+                mask |= cidx.bitmaps[i]
+            rows = np.flatnonzero(mask)
+        for _, kind, payload in preds[1:]:
+            if kind == 'range':
+                ridx, lo, hi = payload[:3]
+                vals = ridx.values[rows]
+                keep = ~np.isnan(vals)
+                if lo is not None:
+                    keep &= vals >= lo
+                if hi is not None:
+                    keep &= vals <= hi
+            else:
+                cidx, sel = payload
+                lookup = np.zeros(len(cidx.categories) + 1, dtype=bool)
+                lookup[sel] = True
+                # codes are -1 for missing values, which maps to the trailing False slot
+                keep = lookup[cidx.codes[rows]]
+            rows = rows[keep]
+            if not len(rows):
+                break
+        return rows
+
+
+_indexes = {}
+_registry_lock = threading.Lock()
+
+
+def index_for(df: pd.DataFrame) -> FilterIndex:
+    """FilterIndex for this frame object, built on first use and dropped with the frame."""
+    key = id(df)
+    idx = _indexes.get(key)
+    if idx is not None and idx.frame() is df:
+        return idx
+    with _registry_lock:
+        idx = _indexes.get(key)
+        if idx is None or idx.frame() is not df:
+            idx = FilterIndex(df)
+            _indexes[key] = idx
+            weakref.finalize(df, _indexes.pop, key, None)
+    return idx
+
+
+def filter_frame(df: pd.DataFrame, filters: dict) -> pd.DataFrame:
+    if df is None or df.empty:
+        return df
+    rows = index_for(df).matching_rows(filters)
+    if rows is None:
+        return df
+    return df.take(rows)
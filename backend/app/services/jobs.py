@@ -0,0 +1,309 @@
+"""Mongo-backed background jobs.
+
+Jobs live in the ``jobs`` collection. Every process runs a few worker threads
+(JOB_WORKER_THREADS, started on first use) that claim queued jobs atomically
+with find_one_and_update, so several gunicorn workers can share one queue.
+A running job holds a lease that a heartbeat thread renews every
+JOB_HEARTBEAT_SECONDS; a job whose worker died is picked up again once the
+lease expires. Writes of a worker that lost its lease are ignored, and its
+handler sees ctx.cancelled() and stops.
+
+Large inputs are not kept in the job document (Mongo caps documents at 16 MB):
+``submit(..., inputs=rows)`` stores them in ``job_inputs`` in chunks of
+JOB_INPUT_CHUNK_ROWS rows, and the handler reads them back with
+``iter_inputs(job)``. Row errors are capped at JOB_MAX_ERRORS per job (the rest
+are only counted), and finished jobs expire after JOB_RETENTION_DAYS.
+
+Handlers are registered per job kind, optionally with a function that pages
+through the job's results for GET /api/jobs/<id>:
+
+    @register_job('predict_batch', results=lambda job, offset, limit: [...])
+    def run(job, ctx):
+        ...
+        ctx.report(done, total)
+        if ctx.cancelled():
+            return
+"""
+import os
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from ..extensions import mongo
+
+WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 2))
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 120))
+HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', LEASE_SECONDS / 4))
+INPUT_CHUNK_ROWS = int(os.getenv('JOB_INPUT_CHUNK_ROWS', 1000))
+MAX_ERRORS = int(os.getenv('JOB_MAX_ERRORS', 1000))
+RETENTION = timedelta(days=int(os.getenv('JOB_RETENTION_DAYS', 7)))
+
+TERMINAL_STATES = ('succeeded', 'failed', 'cancelled')
+
+_handlers = {}
+_result_readers = {}
+_app = None
+_started_pid = None
+_start_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def register_job(kind, results=None):
+    def decorator(fn):
+        _handlers[kind] = fn
+        if results is not None:
+            _result_readers[kind] = results
+        return fn
+    return decorator
+
+
+def job_results(job, offset=0, limit=100):
+    reader = _result_readers.get(job.get('kind'))
+    return reader(job, offset, limit) if reader else []
+
+
+class JobContext:
+    def __init__(self, job_id, worker=None):
+        self.job_id = job_id
+        self.worker = worker
+        self.lease_lost = False
+
+    def _owned(self):
+        # Matches only while this worker holds the job
+        return {'_id': self.job_id} if self.worker is None else {'_id': self.job_id, 'worker': self.worker}
+
+    def _write(self, update):
+        if mongo.db.jobs.update_one(self._owned(), update).matched_count == 0:
+            self.lease_lost = True
+
+    def report(self, done, total=None, **fields):
+        """Record progress (and any extra fields) and renew the lease."""
+        update = {'progress.done': done, 'lease_until': _lease(), 'updated_at': datetime.utcnow()}
+        if total is not None:
+            update['progress.total'] = total
+        update.update(fields)
+        self._write({'$set': update})
+
+    def push_errors(self, errors):
+        """Keep the first MAX_ERRORS row errors; later ones only add to error_count."""
+        if errors:
+            self._write({
+                '$push': {'errors': {'$each': errors, '$slice': MAX_ERRORS}},
+                '$inc': {'error_count': len(errors)},
+            })
+
+    def renew(self):
+        """Extend the lease; False once another worker has taken the job over."""
+        self._write({'$set': {'lease_until': _lease()}})
+        return not self.lease_lost
+
+    def cancelled(self):
+        """True if cancellation was requested or this worker no longer holds the job."""
+        if self.lease_lost:
+            return True
+        doc = mongo.db.jobs.find_one(self._owned(), {'cancel_requested': 1})
+        if doc is None:
+            self.lease_lost = True
+            return True
+        return bool(doc.get('cancel_requested'))
+
+
+def _lease():
+    return datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)
+
+
+def create_indexes(db):
+    db.jobs.create_index([('status', 1), ('created_at', 1)])
+    db.jobs.create_index([('user_id', 1), ('created_at', -1)])
+    db.jobs.create_index('expires_at', expireAfterSeconds=0)
+    db.job_inputs.create_index([('job_id', 1), ('seq', 1)])
+    # Backstop for inputs whose job never finished (finished jobs drop theirs at once)
+    db.job_inputs.create_index('created_at', expireAfterSeconds=int(RETENTION.total_seconds()) * 2)
+
+
+def init_app(app):
+    global _app
+    _app = app
+    app.before_request(ensure_started)
+
+
+def submit(kind, user_id, params, total=None, inputs=None):
+    """Queue a job and return its id; a local worker is woken up immediately.
+
+    inputs: optional list of rows, stored outside the job document (see iter_inputs).
+    """
+    if kind not in _handlers:
+        raise ValueError(f'Unknown job kind: {kind}')
+    now = datetime.utcnow()
+    job_id = ObjectId()
+    if inputs is not None:
+        # Written before the job exists, so a worker never claims a job with missing inputs
+        mongo.db.job_inputs.insert_many([
+            {'job_id': job_id, 'seq': i, 'rows': inputs[start:start + INPUT_CHUNK_ROWS], 'created_at': now}
+            for i, start in enumerate(range(0, len(inputs), INPUT_CHUNK_ROWS))
+        ] or [{'job_id': job_id, 'seq': 0, 'rows': [], 'created_at': now}])
+        params = dict(params, inputs={'rows': len(inputs), 'chunk_rows': INPUT_CHUNK_ROWS})
+    res = mongo.db.jobs.insert_one({
+        '_id': job_id,
+        'kind': kind,
+        'user_id': user_id,
+        'params': params,
+        'status': 'queued',
+        'progress': {'done': 0, 'total': total},
+        'errors': [],
+        'cancel_requested': False,
+        'created_at': now,
+        'updated_at': now,
+    })
+    ensure_started()
+    _wakeup.set()
+    return res.inserted_id
+
+
+def input_count(job):
+    params = job.get('params') or {}
+    if 'data' in params:
+        return len(params['data'])
+    return (params.get('inputs') or {}).get('rows', 0)
+
+
+def iter_inputs(job, start=0):
+    """Yield the job's input rows from position start on, one stored chunk at a time."""
+    params = job.get('params') or {}
+    if 'data' in params:
+        # Jobs queued before inputs moved out of the job document
+        yield from params['data'][start:]
+        return
+    chunk_rows = (params.get('inputs') or {}).get('chunk_rows') or INPUT_CHUNK_ROWS
+    first = start // chunk_rows
+    cursor = mongo.db.job_inputs.find({'job_id': job['_id'], 'seq': {'$gte': first}}, {'rows': 1}).sort('seq', 1)
+    skip = start - first * chunk_rows
+    for doc in cursor:
+        rows = doc['rows']
+        yield from rows[skip:]
+        skip = 0
+
+
+def _finish_update(now):
+    return {'finished_at': now, 'expires_at': now + RETENTION, 'updated_at': now}
+
+
+def request_cancel(job_id, user_id):
+    """Flag a job for cancellation; queued jobs are cancelled on the spot."""
+    now = datetime.utcnow()
+    doc = mongo.db.jobs.find_one_and_update(
+        {'_id': job_id, 'user_id': user_id, 'status': 'queued'},
+        {'$set': {'status': 'cancelled', 'cancel_requested': True, **_finish_update(now)}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc:
+        mongo.db.job_inputs.delete_many({'job_id': job_id})
+        return doc
+    return mongo.db.jobs.find_one_and_update(
+        {'_id': job_id, 'user_id': user_id, 'status': {'$nin': list(TERMINAL_STATES)}},
+        {'$set': {'cancel_requested': True, 'updated_at': now}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _claim():
+    now = datetime.utcnow()
+    return mongo.db.jobs.find_one_and_update(
+        {'kind': {'$in': list(_handlers)}, '$or': [
+            {'status': 'queued'},
+            {'status': 'running', 'lease_until': {'$lt': now}},
+        ]},
+        {'$set': {'status': 'running', 'started_at': now, 'lease_until': _lease(),
+                  'worker': f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'}},
+        sort=[('created_at', 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _heartbeat(ctx, stop):
+    # Renews the lease while a handler blocks, e.g. on a slow remote model call
+    while not stop.wait(HEARTBEAT_SECONDS):
+        try:
+            if not ctx.renew():
+                return
+        except Exception as e:
+            if _app is not None:
+                _app.logger.warning(f'Job {ctx.job_id} heartbeat failed: {e}')
+
+
+def _run(job):
+    ctx = JobContext(job['_id'], job['worker'])
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(ctx, stop), name=f"job-heartbeat-{job['_id']}", daemon=True).start()
+    try:
+        _handlers[job['kind']](job, ctx)
+        status = 'cancelled' if ctx.cancelled() else 'succeeded'
+        error = None
+    except Exception as e:
+        status, error = 'failed', str(e)
+        if _app is not None:
+            _app.logger.error(f"Job {job['_id']} failed: {traceback.format_exc()}")
+    finally:
+        stop.set()
+    if ctx.lease_lost:
+        # Another worker reclaimed the job; its run records the outcome
+        if _app is not None:
+            _app.logger.warning(f"Job {job['_id']} lost its lease to another worker")
+        return
+    update = {'status': status, **_finish_update(datetime.utcnow())}
+    if error:
+        update['error'] = error
+    res = mongo.db.jobs.update_one({'_id': job['_id'], 'worker': job['worker']},
+                                   {'$set': update, '$unset': {'lease_until': ''}})
+    if res.matched_count:
+        mongo.db.job_inputs.delete_many({'job_id': job['_id']})
+
+
+def _worker_loop():
+    while True:
+        try:
+            with _app.app_context():
+                job = _claim()
+                if job is not None:
+                    _run(job)
+                    continue
+        except Exception as e:
+            _app.logger.error(f'Job worker error: {e}')
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def ensure_started():
+    """Start this process's worker threads (once per pid, so it is safe after a fork)."""
+    global _started_pid
+    if _started_pid == os.getpid() or _app is None or WORKER_THREADS <= 0:
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        for i in range(WORKER_THREADS):
+            threading.Thread(target=_worker_loop, name=f'job-worker-{i}', daemon=True).start()
+        _started_pid = os.getpid()
+
+
+def serialize_job(doc):
+    def iso(v):
+        return v.isoformat() if isinstance(v, datetime) else v
+    return {
+        'id': str(doc['_id']),
+        'kind': doc.get('kind'),
+        'status': doc.get('status'),
+        'progress': doc.get('progress') or {},
+        'cancel_requested': doc.get('cancel_requested', False),
+        'error': doc.get('error'),
+        'errors': doc.get('errors') or [],
+        'error_count': doc.get('error_count', len(doc.get('errors') or [])),
+        'created_at': iso(doc.get('created_at')),
+        'started_at': iso(doc.get('started_at')),
+        'finished_at': iso(doc.get('finished_at')),
+    }
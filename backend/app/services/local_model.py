@@ -0,0 +1,145 @@
+"""In-process ESG scoring engine.
+
+A ridge regression of ESG_Overall on the financial and environmental columns,
+fitted in closed form with NumPy. Heavy-tailed magnitudes (revenue, market cap,
+emissions, water, energy) enter as log1p; missing or unparseable features are
+imputed with the training medians. Scoring a batch is one matrix product.
+
+The default model is fitted once per process from data/esg_financial_dataset.csv
+(via load_data). With LOCAL_MODEL_SOURCE=active, a model is fitted from each
+user's active dataset instead and cached per dataset version.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .datasets import current_dataset_version, get_user_dataframe, load_data
+
+FEATURES = [
+    'Revenue', 'ProfitMargin', 'MarketCap', 'GrowthRate',
+    'CarbonEmissions', 'WaterUsage', 'EnergyConsumption',
+]
+LOG_FEATURES = {'Revenue', 'MarketCap', 'CarbonEmissions', 'WaterUsage', 'EnergyConsumption'}
+TARGET = 'ESG_Overall'
+RIDGE_ALPHA = float(os.getenv('LOCAL_MODEL_ALPHA', 1.0))
+MIN_TRAINING_ROWS = 20
+
+
+class LocalModel:
+    def __init__(self, name, coef, intercept, medians, means, scales, trained_rows, r2, fit_seconds):
+        self.name = name
+        self.coef = coef
+        self.intercept = intercept
+        self.medians = medians
+        self.means = means
+        self.scales = scales
+        self.trained_rows = trained_rows
+        self.r2 = r2
+        self.fit_seconds = fit_seconds
+
+    @classmethod
+    def fit(cls, df, name):
+        started = time.perf_counter()
+        data = df[df[TARGET].notna()] if TARGET in df.columns else df.iloc[0:0]
+        if len(data) < MIN_TRAINING_ROWS:
+            raise ValueError(f'At least {MIN_TRAINING_ROWS} rows with {TARGET} are required to train')
+        raw = _raw_matrix(data)
+        medians = np.nanmedian(raw, axis=0)
+        medians = np.where(np.isnan(medians), 0.0, medians)
+        X = _impute(raw, medians)
+        means = X.mean(axis=0)
+        scales = X.std(axis=0)
+        scales[scales == 0] = 1.0
+        Z = (X - means) / scales
+        y = pd.to_numeric(data[TARGET], errors='coerce').to_numpy(dtype='float64')
+        intercept = float(y.mean())
+        coef = np.linalg.solve(Z.T @ Z + RIDGE_ALPHA * np.eye(Z.shape[1]), Z.T @ (y - intercept))
+        residual = y - (Z @ coef + intercept)
+        total = ((y - intercept) ** 2).sum()
+        r2 = float(1 - (residual ** 2).sum() / total) if total else 0.0
+        return cls(name, coef, intercept, medians, means, scales, len(data), r2, time.perf_counter() - started)
+
+    def predict_matrix(self, raw):
+        Z = (_impute(raw, self.medians) - self.means) / self.scales
+        return Z @ self.coef + self.intercept
+
+    def predict_records(self, rows):
+        """Score a list of feature dicts in one pass; returns a float array."""
+        if not rows:
+            return np.empty(0)
+        return self.predict_matrix(_raw_matrix(pd.DataFrame.from_records(rows)))
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'features': FEATURES,
+            'target': TARGET,
+            'trained_rows': self.trained_rows,
+            'r2': round(self.r2, 4),
+            'fit_seconds': round(self.fit_seconds, 4),
+        }
+
+
+def _raw_matrix(df):
+    cols = []
+    for c in FEATURES:
+        values = pd.to_numeric(df[c], errors='coerce').to_numpy(dtype='float64') if c in df.columns else np.full(len(df), np.nan)
+        if c in LOG_FEATURES:
+            values = np.log1p(np.clip(values, 0, None))
+        cols.append(values)
+    return np.column_stack(cols) if cols else np.empty((len(df), 0))
+
+
+def _impute(raw, medians):
+    return np.where(np.isnan(raw), medians, raw)
+
+
+_default = None
+_default_lock = threading.Lock()
+_user_models = OrderedDict()  # (user_id, dataset version) -> LocalModel
+_USER_MODELS_MAX = 32
+
+
+def model_name():
+    return os.getenv('LOCAL_MODEL_NAME', 'Local ESG Ridge')
+
+
+def default_model():
+    """Model fitted on the bundled dataset, built once per process."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = LocalModel.fit(load_data(), model_name())
+    return _default
+
+
+def model_for_user(user_id):
+    if os.getenv('LOCAL_MODEL_SOURCE', 'default').lower() != 'active':
+        return default_model()
+    key = (user_id, current_dataset_version(user_id))
+    model = _user_models.get(key)
+    if model is None:
+        try:
+            model = LocalModel.fit(get_user_dataframe(user_id), f'{model_name()} (active dataset)')
+        except ValueError:
+            return default_model()
+        _user_models[key] = model
+        while len(_user_models) > _USER_MODELS_MAX:
+            _user_models.popitem(last=False)
+    return model
+
+
+def score_rows(model, rows):
+    """Batch counterpart of a remote call: [(result, error, cached)] in input order."""
+    valid = [i for i, row in enumerate(rows) if isinstance(row, dict)]
+    preds = model.predict_records([rows[i] for i in valid])
+    out = [(None, 'Row must be an object of feature values', False)] * len(rows)
+    for i, value in zip(valid, preds):
+        value = round(float(value), 4)
+        out[i] = ({'prediction': value, 'engine': 'local', 'model': model.name}, None, False)
+    return out
@@ -0,0 +1,176 @@
+"""Mongo-backed outbox for transactional email.
+
+The send_* helpers in email_service only insert a message into ``mail_outbox`` and
+return; the request never waits on the mail server. Each process runs sender threads
+(MAIL_SENDER_THREADS, started on first use like the job workers) that claim due
+messages with find_one_and_update and deliver them over one SMTP connection per
+thread, kept open across messages and closed after MAIL_IDLE_SECONDS without traffic.
+
+A failed delivery is retried with exponential backoff (MAIL_RETRY_BACKOFF * 2**n
+seconds) up to MAIL_MAX_ATTEMPTS; permanent rejections (5xx, invalid message) fail
+at once. A message claimed by a worker that died is picked up again once its lease
+expires. Sent and failed messages expire after MAIL_OUTBOX_RETENTION_DAYS.
+
+Any SMTP server works for local testing, e.g. ``python -m aiosmtpd -n -l localhost:8025``
+with MAIL_SERVER=localhost, MAIL_PORT=8025, MAIL_USE_TLS=False.
+"""
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask_mail import BadHeaderError, Message
+from pymongo import ReturnDocument
+
+from ..extensions import mail, mongo
+
+SENDER_THREADS = int(os.getenv('MAIL_SENDER_THREADS', 1))
+POLL_INTERVAL = float(os.getenv('MAIL_POLL_INTERVAL', 2.0))
+LEASE_SECONDS = int(os.getenv('MAIL_LEASE_SECONDS', 120))
+MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+RETRY_BACKOFF = float(os.getenv('MAIL_RETRY_BACKOFF', 10))
+IDLE_SECONDS = float(os.getenv('MAIL_IDLE_SECONDS', 30))
+RETENTION = timedelta(days=int(os.getenv('MAIL_OUTBOX_RETENTION_DAYS', 7)))
+
+_app = None
+_started_pid = None
+_start_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def enqueue(msg: Message, kind: str):
+    """Queue a composed message for background delivery and return its outbox id."""
+    now = datetime.utcnow()
+    res = mongo.db.mail_outbox.insert_one({
+        'kind': kind,
+        'subject': msg.subject,
+        'sender': msg.sender,
+        'recipients': list(msg.recipients),
+        'body': msg.body,
+        'html': msg.html,
+        'status': 'queued',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+        'updated_at': now,
+    })
+    ensure_started()
+    _wakeup.set()
+    return res.inserted_id
+
+
+def create_indexes(db):
+    db.mail_outbox.create_index([('status', 1), ('next_attempt_at', 1)])
+    db.mail_outbox.create_index('expires_at', expireAfterSeconds=0)
+
+
+class PooledConnection:
+    """One reusable flask-mail SMTP connection, reopened after errors or idling."""
+
+    def __init__(self):
+        self._conn = None
+        self._last_used = 0.0
+        self.opened = 0
+
+    def send(self, msg):
+        if self._conn is not None and time.monotonic() - self._last_used > IDLE_SECONDS:
+            self.close()
+        if self._conn is None:
+            self._conn = mail.connect().__enter__()
+            self.opened += 1
+        try:
+            self._conn.send(msg)
+        except Exception:
+            # The session state is unknown after a failure; start clean next time
+            self.close()
+            raise
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._conn is not None and time.monotonic() - self._last_used > IDLE_SECONDS:
+            self.close()
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.__exit__(None, None, None)
+            except Exception:
+                pass
+
+
+def _permanent(error):
+    if isinstance(error, (AssertionError, BadHeaderError, smtplib.SMTPRecipientsRefused)):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _claim():
+    now = datetime.utcnow()
+    return mongo.db.mail_outbox.find_one_and_update(
+        {'$or': [
+            {'status': 'queued', 'next_attempt_at': {'$lte': now}},
+            {'status': 'sending', 'lease_until': {'$lt': now}},
+        ]},
+        {'$set': {'status': 'sending', 'lease_until': now + timedelta(seconds=LEASE_SECONDS), 'updated_at': now},
+         '$inc': {'attempts': 1}},
+        sort=[('next_attempt_at', 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _deliver(conn, doc):
+    msg = Message(subject=doc.get('subject'), sender=doc.get('sender'), recipients=doc.get('recipients') or [],
+                  body=doc.get('body'), html=doc.get('html'))
+    now = datetime.utcnow()
+    try:
+        conn.send(msg)
+        update = {'status': 'sent', 'sent_at': now, 'expires_at': now + RETENTION}
+    except Exception as e:
+        attempts = doc.get('attempts', 1)
+        if _permanent(e) or attempts >= MAX_ATTEMPTS:
+            update = {'status': 'failed', 'expires_at': now + RETENTION}
+            _app.logger.error(f"Email {doc['_id']} ({doc.get('kind')}) failed after {attempts} attempt(s): {e}")
+        else:
+            delay = RETRY_BACKOFF * (2 ** (attempts - 1))
+            update = {'status': 'queued', 'next_attempt_at': now + timedelta(seconds=delay)}
+        update['last_error'] = str(e)
+    update['updated_at'] = now
+    mongo.db.mail_outbox.update_one({'_id': doc['_id']}, {'$set': update, '$unset': {'lease_until': ''}})
+
+
+def _sender_loop():
+    conn = PooledConnection()
+    while True:
+        try:
+            with _app.app_context():
+                doc = _claim()
+                if doc is not None:
+                    _deliver(conn, doc)
+                    continue
+                conn.close_if_idle()
+        except Exception as e:
+            conn.close()
+            _app.logger.error(f'Mail sender error: {e}')
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def ensure_started():
+    """Start this process's sender threads (once per pid, so it is safe after a fork)."""
+    global _started_pid
+    if _started_pid == os.getpid() or _app is None or SENDER_THREADS <= 0:
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        for i in range(SENDER_THREADS):
+            threading.Thread(target=_sender_loop, name=f'mail-sender-{i}', daemon=True).start()
+        _started_pid = os.getpid()
+
+
+def init_app(app):
+    global _app
+    _app = app
+    app.before_request(ensure_started)
@@ -0,0 +1,132 @@
+"""Database indexes and one-time data migrations.
+
+None of this runs inside create_app. Run it as a release step::
+
+    flask --app app migrate
+
+or leave MIGRATE_ON_START=true (default): the first request of each process starts a
+background thread that runs it. Either way a lease in the ``migrations`` collection
+(``_id: 'lock'``) lets only one process work at a time, and once a run has finished the
+``schema`` marker records SCHEMA_VERSION, so later starts cost a single find_one.
+Bump SCHEMA_VERSION when adding an index or a migration below.
+
+The individual migrations keep their own markers (see prediction_search.backfill,
+dataset_store.drop_copied_active_data, avatars.migrate_inline_avatars), so a run that
+dies half-way repeats only what is left.
+"""
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+import click
+from pymongo.errors import DuplicateKeyError
+
+from ..extensions import mongo
+from . import avatars, jobs, mail_outbox, prediction_search
+
+SCHEMA_VERSION = 1
+ON_START = os.getenv('MIGRATE_ON_START', 'true').lower() == 'true'
+LEASE_SECONDS = int(os.getenv('MIGRATE_LEASE_SECONDS', 600))
+LOCK_ID = 'lock'
+SCHEMA_ID = 'schema'
+
+_app = None
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def create_indexes(db):
+    db.users.create_index('email', unique=True)
+    # _id breaks created_at ties so keyset pagination is served straight from the index
+    db.predictions.create_index([('user_id', 1), ('created_at', -1), ('_id', -1)])
+    db.uploads.create_index([('user_id', 1), ('created_at', -1), ('_id', -1)])
+    db.predictions.create_index([('job_id', 1), ('row', 1)], sparse=True)
+    db.prediction_cache.create_index('expires_at', expireAfterSeconds=0)
+    prediction_search.create_indexes(db.predictions)
+    jobs.create_indexes(db)
+    mail_outbox.create_indexes(db)
+
+
+def migrate_data(db):
+    from .dataset_store import drop_copied_active_data
+
+    prediction_search.backfill(db)
+    drop_copied_active_data(db)
+    avatars.migrate_inline_avatars(db)
+
+
+def is_current(db):
+    marker = db.migrations.find_one({'_id': SCHEMA_ID}, {'version': 1})
+    return bool(marker) and marker.get('version', 0) >= SCHEMA_VERSION
+
+
+def _acquire(db, owner):
+    now = datetime.utcnow()
+    lease = {'owner': owner, 'expires_at': now + timedelta(seconds=LEASE_SECONDS)}
+    try:
+        db.migrations.insert_one(dict(lease, _id=LOCK_ID))
+        return True
+    except DuplicateKeyError:
+        # Take over the lease of a process that died while holding it
+        return db.migrations.find_one_and_update(
+            {'_id': LOCK_ID, 'expires_at': {'$lt': now}}, {'$set': lease}) is not None
+
+
+def run(db):
+    """Create indexes and run pending migrations unless another process is doing so.
+
+    Returns True if the schema is current afterwards, False if the lock was held.
+    """
+    if is_current(db):
+        return True
+    owner = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    if not _acquire(db, owner):
+        return False
+    try:
+        create_indexes(db)
+        migrate_data(db)
+        db.migrations.update_one({'_id': SCHEMA_ID},
+                                 {'$set': {'version': SCHEMA_VERSION, 'finished_at': datetime.utcnow()}},
+                                 upsert=True)
+    finally:
+        db.migrations.delete_one({'_id': LOCK_ID, 'owner': owner})
+    return True
+
+
+def _run_in_background():
+    with _app.app_context():
+        try:
+            if not run(mongo.db):
+                _app.logger.info('Migrations are running in another process')
+        except Exception:
+            _app.logger.exception('Migrations failed')
+
+
+def ensure_started():
+    """Start this process's migration thread (once per pid, so it is safe after a fork)."""
+    global _started_pid
+    if _started_pid == os.getpid() or _app is None:
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        threading.Thread(target=_run_in_background, name='migrations', daemon=True).start()
+        _started_pid = os.getpid()
+
+
+@click.command('migrate')
+def migrate_command():
+    """Create indexes and run pending data migrations."""
+    if run(mongo.db):
+        click.echo(f'Schema is at version {SCHEMA_VERSION}')
+    else:
+        raise click.ClickException('Another process holds the migration lock, try again later')
+
+
+def init_app(app):
+    global _app
+    _app = app
+    app.cli.add_command(migrate_command)
+    if ON_START:
+        app.before_request(ensure_started)
@@ -0,0 +1,77 @@
+"""HTTP client for the remote prediction model (WATSONX_MODEL_URL).
+
+One pooled keep-alive session is shared by the process; each call retries
+transient failures (connection errors, timeouts, 429 and 5xx) with exponential
+backoff. predict_many fans a batch out over a bounded thread pool and returns
+per-row outcomes in input order.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MODEL_TIMEOUT = float(os.getenv('MODEL_TIMEOUT', 30))
+MODEL_RETRIES = int(os.getenv('MODEL_RETRIES', 2))
+MODEL_BACKOFF = float(os.getenv('MODEL_BACKOFF', 0.5))
+BATCH_WORKERS = int(os.getenv('PREDICT_BATCH_WORKERS', 8))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # requests is only imported once a remote model is actually used
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(BATCH_WORKERS, 10))
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({'Content-Type': 'application/json'})
+                _session = session
+    return _session
+
+
+def predict_one(model_url, inputs):
+    """POST one feature set to the model and return its JSON response."""
+    import requests
+
+    attempt = 0
+    while True:
+        try:
+            response = get_session().post(model_url, json={'inputs': inputs}, timeout=MODEL_TIMEOUT)
+            if response.status_code in RETRY_STATUS and attempt < MODEL_RETRIES:
+                raise requests.exceptions.RetryError(f'{response.status_code} from model')
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.RetryError):
+            if attempt >= MODEL_RETRIES:
+                raise
+        time.sleep(MODEL_BACKOFF * (2 ** attempt))
+        attempt += 1
+
+
+def predict_many(model_url, rows, workers=None):
+    """Score rows concurrently; returns [(result, None) | (None, error_message)] in input order."""
+    def run(row):
+        try:
+            return predict_one(model_url, row), None
+        except Exception as e:
+            return None, str(e)
+
+    workers = max(1, min(workers or BATCH_WORKERS, len(rows) or 1))
+    if workers == 1:
+        return [run(row) for row in rows]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='predict') as pool:
+        return list(pool.map(run, rows))
+
+
+def prediction_value(result):
+    return result.get('prediction', result.get('output', None))
@@ -0,0 +1,53 @@
+"""Per-request count of Mongo commands.
+
+A pymongo CommandListener counts the commands each request issues on its own thread
+(background job and mail threads are not attributed to any request). With
+MONGO_OP_HEADER=true, or when the app is in testing mode, the count is returned in
+the X-Mongo-Ops response header so tests can assert how many round-trips an
+endpoint costs.
+"""
+import os
+import threading
+
+from pymongo import monitoring
+
+_local = threading.local()
+
+
+class RequestCommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.total = 0
+
+    def started(self, event):
+        self.total += 1
+        if getattr(_local, 'active', False):
+            _local.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+listener = RequestCommandCounter()
+
+
+def current_count():
+    return getattr(_local, 'count', 0)
+
+
+def init_app(app):
+    enabled = os.getenv('MONGO_OP_HEADER', 'false').lower() == 'true'
+
+    @app.before_request
+    def _start_counting():
+        _local.active = True
+        _local.count = 0
+
+    @app.after_request
+    def _report_count(resp):
+        if enabled or app.testing:
+            resp.headers['X-Mongo-Ops'] = str(current_count())
+        _local.active = False
+        return resp
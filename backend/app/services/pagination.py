@@ -0,0 +1,113 @@
+"""Listing pagination for per-user collections sorted newest first.
+
+Two modes share one entry point, ``paginate``:
+
+* page mode (``?page=&limit=``): skip/limit with an exact total, as before;
+* keyset mode (``?cursor=``, empty for the first page): seeks past the last
+  (created_at, _id) seen, so every page costs the same, and returns an opaque
+  ``next_cursor``. The total is only computed on request (``?total=exact`` or
+  ``?total=cached``).
+
+``?total=cached`` (either mode) serves the count from a short-lived in-process
+cache instead of running count_documents on every call.
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+SORT = [('created_at', -1), ('_id', -1)]
+COUNT_TTL = float(os.getenv('LISTING_COUNT_TTL', 30))
+
+_counts = {}
+_counts_lock = threading.Lock()
+
+
+def encode_cursor(doc):
+    created = doc.get('created_at')
+    payload = {
+        't': created.isoformat() if isinstance(created, datetime) else None,
+        'i': str(doc['_id']),
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns (created_at, _id); raises ValueError on anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        created = datetime.fromisoformat(payload['t']) if payload.get('t') else None
+        return created, ObjectId(payload['i'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def _after(cursor):
+    created, oid = decode_cursor(cursor)
+    if created is None:
+        # Documents without created_at sort last; continue among them by _id
+        return {'created_at': None, '_id': {'$lt': oid}}
+    return {'$or': [
+        {'created_at': {'$lt': created}},
+        {'created_at': created, '_id': {'$lt': oid}},
+        {'created_at': None},
+    ]}
+
+
+def count(collection, query, cached=False):
+    if not cached or COUNT_TTL <= 0:
+        return collection.count_documents(query)
+    key = (collection.name, hashlib.sha256(json.dumps(query, sort_keys=True, default=str).encode('utf-8')).hexdigest())
+    now = time.monotonic()
+    with _counts_lock:
+        hit = _counts.get(key)
+        if hit and hit[1] > now:
+            return hit[0]
+    n = collection.count_documents(query)
+    with _counts_lock:
+        if len(_counts) > 10000:
+            _counts.clear()
+        _counts[key] = (n, now + COUNT_TTL)
+    return n
+
+
+def paginate(collection, query, args, projection=None):
+    """Returns (docs, meta) where meta holds the pagination fields for the response.
+
+    Raises ValueError for an invalid cursor.
+    """
+    try:
+        limit = max(1, min(100, int(args.get('limit', 10))))
+    except Exception:
+        limit = 10
+    total_mode = args.get('total')
+
+    if 'cursor' in args:
+        cursor = args.get('cursor') or ''
+        q = {'$and': [query, _after(cursor)]} if cursor else query
+        docs = list(collection.find(q, projection).sort(SORT).limit(limit + 1))
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+        meta = {
+            'limit': limit,
+            'next_cursor': encode_cursor(docs[-1]) if has_more else None,
+            'has_more': has_more,
+        }
+        if total_mode in ('exact', 'cached'):
+            meta['total'] = count(collection, query, cached=total_mode == 'cached')
+        return docs, meta
+
+    try:
+        page = max(1, int(args.get('page', 1)))
+    except Exception:
+        page = 1
+    total = count(collection, query, cached=total_mode == 'cached')
+    docs = list(collection.find(query, projection).sort(SORT).skip((page - 1) * limit).limit(limit))
+    return docs, {'total': total, 'page': page, 'limit': limit, 'pages': (total + limit - 1) // limit}
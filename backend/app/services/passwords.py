@@ -0,0 +1,191 @@
+"""Password hashing on a bounded process pool.
+
+bcrypt is deliberately CPU-heavy; run on the request thread, a burst of logins
+saturates the web worker and starves every other endpoint. Hashes and checks are
+sent to a small process pool instead (PASSWORD_HASH_WORKERS, 0 = inline), and at
+most PASSWORD_HASH_QUEUE_LIMIT operations may be in flight per web worker: beyond
+that, or when a result takes longer than PASSWORD_HASH_TIMEOUT, PasswordHashingBusy
+is raised and the endpoint answers 503 instead of queueing without bound.
+
+BCRYPT_ROUNDS sets the cost of new hashes. A stored hash with a different cost is
+replaced after the next successful login (see rehash); latencies are reported by
+stats() at GET /api/auth/password-stats.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', min(2, os.cpu_count() or 1)))
+QUEUE_LIMIT = int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT', max(WORKERS, 1) * 8))
+TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+# The pool is created lazily inside a web worker that already runs threads (gthread,
+# job and mail senders); a plain fork could copy a lock held by one of them into the
+# child. forkserver forks the children from a clean single-threaded server instead.
+# Either way the children re-import the __main__ module, which create_app keeps cheap.
+# PASSWORD_HASH_START_METHOD=fork restores the old behaviour explicitly.
+START_METHOD = os.getenv('PASSWORD_HASH_START_METHOD') or (
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+LATENCY_WINDOW = 1000
+
+
+class PasswordHashingBusy(Exception):
+    """The hashing pool is at its queue limit or did not answer in time."""
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password: bytes, password_hash: bytes) -> bool:
+    try:
+        return bcrypt.checkpw(password, password_hash)
+    except ValueError:
+        # Not a bcrypt hash
+        return False
+
+
+def hash_cost(password_hash: str):
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class _Latency:
+    def __init__(self):
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.count = 0
+
+    def add(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+
+    def summary(self):
+        values = sorted(self.samples)
+        if not values:
+            return {'count': self.count}
+        return {
+            'count': self.count,
+            'avg_ms': round(sum(values) / len(values), 1),
+            'p50_ms': round(values[len(values) // 2], 1),
+            'p95_ms': round(values[min(len(values) - 1, int(len(values) * 0.95))], 1),
+            'max_ms': round(values[-1], 1),
+        }
+
+
+class PasswordHasher:
+    def __init__(self, workers, queue_limit, timeout, rounds):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.rounds = rounds
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.rehashed = 0
+        self.latency = {'hash': _Latency(), 'check': _Latency()}
+
+    def _executor(self):
+        # One pool per web worker process (a pool inherited through a fork is not usable)
+        if self._pool is None or self._pool_pid != os.getpid():
+            context = multiprocessing.get_context(START_METHOD)
+            if START_METHOD == 'forkserver':
+                # Children fork from a server that has bcrypt loaded already
+                context.set_forkserver_preload([__name__])
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected += 1
+                raise PasswordHashingBusy()
+            self.in_flight += 1
+            try:
+                future = self._executor().submit(fn, *args)
+            except Exception:
+                self.in_flight -= 1
+                raise
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, _):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _run(self, op, fn, *args):
+        t0 = time.perf_counter()
+        if self.workers <= 0:
+            result = fn(*args)
+        else:
+            try:
+                result = self._submit(fn, *args).result(timeout=self.timeout)
+            except FutureTimeout:
+                with self._lock:
+                    self.timeouts += 1
+                raise PasswordHashingBusy()
+        ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self.latency[op].add(ms)
+        return result
+
+    def hash(self, password: str) -> str:
+        return self._run('hash', _hash, password.encode('utf-8'), self.rounds).decode('utf-8')
+
+    def check(self, password_hash: str, password: str) -> bool:
+        if not password_hash:
+            return False
+        return self._run('check', _check, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        cost = hash_cost(password_hash)
+        return cost is not None and cost != self.rounds
+
+    def rehash(self, password: str, store):
+        """Hash password at the configured cost and pass the result to store(new_hash).
+
+        Runs in the background when a pool is configured; a busy pool just skips it,
+        so the upgrade is retried on the next login.
+        """
+        def done(future):
+            try:
+                store(future.result().decode('utf-8'))
+                with self._lock:
+                    self.rehashed += 1
+            except Exception:
+                pass
+        try:
+            future = self._submit(_hash, password.encode('utf-8'), self.rounds) if self.workers > 0 else None
+        except PasswordHashingBusy:
+            return
+        if future is None:
+            future = Future()
+            future.set_result(_hash(password.encode('utf-8'), self.rounds))
+        future.add_done_callback(done)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'queue_limit': self.queue_limit,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'rehashed': self.rehashed,
+                'hash': self.latency['hash'].summary(),
+                'check': self.latency['check'].summary(),
+            }
+
+
+hasher = PasswordHasher(WORKERS, QUEUE_LIMIT, TIMEOUT, ROUNDS)
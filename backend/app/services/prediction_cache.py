@@ -0,0 +1,156 @@
+"""Content-addressed cache of model responses.
+
+The key is a SHA-256 of the canonicalized inputs plus the model name and
+version (WATSONX_MODEL_NAME / WATSONX_MODEL_VERSION), so identical feature
+sets never reach the model twice. Lookups go through an in-process LRU first,
+then the ``prediction_cache`` collection, whose ``expires_at`` TTL index lets
+Mongo expire entries after PREDICTION_CACHE_TTL seconds. Memory entries expire
+with the Mongo document they mirror, so no tier outlives the TTL.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from ..extensions import mongo
+from . import model_client
+
+CACHE_TTL = int(os.getenv('PREDICTION_CACHE_TTL', 7 * 24 * 3600))
+MEMORY_ENTRIES = int(os.getenv('PREDICTION_CACHE_SIZE', 10000))
+
+
+def model_identity():
+    return (
+        os.getenv('WATSONX_MODEL_NAME', 'WatsonX ESG Predictor'),
+        os.getenv('WATSONX_MODEL_VERSION', ''),
+    )
+
+
+def cache_key(inputs, model=None):
+    name, version = model or model_identity()
+    canonical = json.dumps({'m': name, 'v': version, 'i': inputs}, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class PredictionCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (result, expires_at on the monotonic clock)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """Return {key: result} for every key found in memory or Mongo."""
+        if self.ttl <= 0:
+            return {}
+        found, remote = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None and entry[1] > now:
+                    self._memory.move_to_end(key)
+                    found[key] = entry[0]
+                else:
+                    self._memory.pop(key, None)
+                    remote.append(key)
+        if remote:
+            try:
+                utcnow = datetime.utcnow()
+                cursor = mongo.db.prediction_cache.find(
+                    {'_id': {'$in': remote}, 'expires_at': {'$gt': utcnow}},
+                    {'result': 1, 'expires_at': 1},
+                )
+                for doc in cursor:
+                    found[doc['_id']] = doc['result']
+                    self._remember(doc['_id'], doc['result'], (doc['expires_at'] - utcnow).total_seconds())
+            except Exception:
+                pass
+        self.hits += len(found)
+        self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, entries):
+        if self.ttl <= 0 or not entries:
+            return
+        for key, result in entries.items():
+            self._remember(key, result, self.ttl)
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=self.ttl)
+        name, version = model_identity()
+        ops = [
+            UpdateOne({'_id': key}, {'$set': {
+                'result': result, 'model': name, 'model_version': version,
+                'created_at': now, 'expires_at': expires,
+            }}, upsert=True)
+            for key, result in entries.items()
+        ]
+        try:
+            mongo.db.prediction_cache.bulk_write(ops, ordered=False)
+        except Exception:
+            pass
+
+    def _remember(self, key, result, ttl):
+        with self._lock:
+            self._memory[key] = (result, time.monotonic() + min(ttl, self.ttl))
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'memory_entries': len(self._memory),
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+prediction_cache = PredictionCache(MEMORY_ENTRIES, CACHE_TTL)
+
+
+def predict_one_cached(model_url, inputs):
+    """Returns (result, cached)."""
+    key = cache_key(inputs)
+    hit = prediction_cache.get_many([key]).get(key)
+    if hit is not None:
+        return hit, True
+    result = model_client.predict_one(model_url, inputs)
+    prediction_cache.put_many({key: result})
+    return result, False
+
+
+def predict_many_cached(model_url, rows):
+    """Like model_client.predict_many, but only cache misses (deduplicated) reach the model.
+
+    Returns [(result, error, cached)] in input order.
+    """
+    keys = [cache_key(row) for row in rows]
+    hits = prediction_cache.get_many(keys)
+    pending = {}
+    for key, row in zip(keys, rows):
+        if key not in hits and key not in pending:
+            pending[key] = row
+    fresh = {}
+    if pending:
+        outcomes = model_client.predict_many(model_url, list(pending.values()))
+        for key, (result, error) in zip(pending, outcomes):
+            fresh[key] = (result, error)
+        prediction_cache.put_many({k: r for k, (r, e) in fresh.items() if e is None})
+    out = []
+    for key in keys:
+        if key in hits:
+            out.append((hits[key], None, True))
+        else:
+            result, error = fresh[key]
+            out.append((result, error, False))
+    return out
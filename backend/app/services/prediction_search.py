@@ -0,0 +1,103 @@
+"""Normalized, index-backed search fields for prediction history.
+
+Every prediction document carries lowercased copies of its model and tags plus
+``search_terms``: those values and the words inside them (``random_forest_v1``
+also yields ``random``, ``forest``, ``v1``). Searches are then anchored prefix
+matches or equality on indexed fields instead of unanchored case-insensitive
+regexes, so their cost follows the number of matches, not the history size.
+
+Search modes for GET /predictions?search=...&mode=:
+
+    prefix    (default) any term starts with the search string
+    text      whole-word Mongo text search over model and tags
+    contains  the old substring regex; unindexed, kept for compatibility
+
+``?model=`` keeps its substring semantics (``forest`` finds ``random_forest_v1``)
+but runs on ``model_norm``, so it needs no case-insensitive option, and the
+value is matched literally rather than as a regex.
+"""
+import re
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+SEARCH_MODES = ('prefix', 'text', 'contains')
+_WORD = re.compile(r'[a-z0-9]+')
+MIGRATION_ID = 'prediction_search_fields'
+
+
+def normalize(value):
+    return str(value).strip().lower() if value is not None else None
+
+
+def normalize_tags(tags):
+    if isinstance(tags, str):
+        tags = [tags]
+    out = []
+    for t in tags or []:
+        t = normalize(t)
+        if t and t not in out:
+            out.append(t)
+    return out
+
+
+def search_fields(model, tags):
+    """The normalized fields to $set on a prediction document."""
+    model_norm = normalize(model) or None
+    tags_norm = normalize_tags(tags)
+    terms = []
+    for value in ([model_norm] if model_norm else []) + tags_norm:
+        for term in [value] + _WORD.findall(value):
+            if term not in terms:
+                terms.append(term)
+    return {'model_norm': model_norm, 'tags_norm': tags_norm, 'search_terms': terms}
+
+
+def _prefix(value):
+    return {'$regex': '^' + re.escape(normalize(value))}
+
+
+def search_query(search, mode='prefix'):
+    if mode == 'text':
+        return {'$text': {'$search': search}}
+    if mode == 'contains':
+        return {'$or': [
+            {'model': {'$regex': search, '$options': 'i'}},
+            {'tags': {'$elemMatch': {'$regex': search, '$options': 'i'}}},
+        ]}
+    return {'search_terms': _prefix(search)}
+
+
+def tag_query(tag):
+    return {'tags_norm': normalize(tag)}
+
+
+def model_query(model):
+    return {'model_norm': {'$regex': re.escape(normalize(model))}}
+
+
+def create_indexes(collection):
+    collection.create_index([('user_id', 1), ('tags_norm', 1), ('created_at', -1)])
+    collection.create_index([('user_id', 1), ('model_norm', 1), ('created_at', -1)])
+    collection.create_index([('user_id', 1), ('search_terms', 1), ('created_at', -1)])
+    collection.create_index([('user_id', 1), ('model_norm', 'text'), ('tags_norm', 'text')],
+                            name='prediction_search_text', default_language='none')
+
+
+def backfill(db, batch_size=500):
+    """Add search fields to documents written before they existed (runs once per database)."""
+    if db.migrations.find_one({'_id': MIGRATION_ID}):
+        return 0
+    done, ops = 0, []
+    for doc in db.predictions.find({'search_terms': {'$exists': False}}, {'model': 1, 'tags': 1}):
+        ops.append(UpdateOne({'_id': doc['_id']}, {'$set': search_fields(doc.get('model'), doc.get('tags'))}))
+        if len(ops) >= batch_size:
+            db.predictions.bulk_write(ops, ordered=False)
+            done += len(ops)
+            ops = []
+    if ops:
+        db.predictions.bulk_write(ops, ordered=False)
+        done += len(ops)
+    db.migrations.update_one({'_id': MIGRATION_ID},
+                             {'$set': {'documents': done, 'finished_at': datetime.utcnow()}}, upsert=True)
+    return done
@@ -0,0 +1,159 @@
+"""Cache of serialized analytics responses.
+
+Analytics results are pure functions of (endpoint, user, dataset version,
+filter payload), so the cache key is a hash of exactly that. The key doubles as
+the response ETag.
+
+The dataset version comes from the active_datasets document in Mongo, and every
+write path moves it (a new updated_at, or the document is removed), so a change
+made through one gunicorn worker changes the keys in all of them once their
+version check expires (DATASET_CACHE_VERSION_TTL). The Redis backend also keeps a
+shared per-user generation number that explicit invalidation bumps; the memory
+backend has none, since a per-process counter would not reach the other workers.
+
+Backends: an in-process LRU (default) or Redis when RESULT_CACHE_REDIS_URL is
+set and the redis package is installed (e.g. a local redis-server sidecar
+shared by all gunicorn workers).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def generation(self, user_id):
+        return 0
+
+    def bump_generation(self, user_id):
+        # Nothing to do: the new dataset version already moves the user's keys
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def size(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    def __init__(self, url, prefix='esg:results:'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self._redis.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self._redis.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    def generation(self, user_id):
+        return int(self._redis.get(f'{self.prefix}gen:{user_id}') or 0)
+
+    def bump_generation(self, user_id):
+        self._redis.incr(f'{self.prefix}gen:{user_id}')
+
+    def clear(self):
+        for k in self._redis.scan_iter(self.prefix + '*'):
+            self._redis.delete(k)
+
+    def size(self):
+        return None
+
+
+class ResultCache:
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = ttl > 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def make_key(self, endpoint, user_id, version, payload):
+        canonical = json.dumps(
+            {
+                'e': endpoint,
+                'u': user_id,
+                'v': version,
+                'g': self.backend.generation(user_id),
+                'p': payload,
+            },
+            sort_keys=True, separators=(',', ':'), default=str,
+        )
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception:
+            pass
+
+    def invalidate_user(self, user_id):
+        try:
+            self.backend.bump_generation(user_id)
+        except Exception:
+            pass
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': self.backend.size(),
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _make_backend():
+    url = os.getenv('RESULT_CACHE_REDIS_URL', '').strip()
+    if url:
+        try:
+            return RedisBackend(url)
+        except ImportError:
+            pass
+    return MemoryBackend(int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 2048)))
+
+
+result_cache = ResultCache(_make_backend(), ttl=float(os.getenv('RESULT_CACHE_TTL', 300)))
@@ -0,0 +1,335 @@
+"""Industry x Region x Year rollup cube.
+
+For every observed (Industry, Region, Year) cell the cube keeps the row count,
+the distinct companies and, per metric, the non-missing count, sum and sum of
+squares. Industry, regional and trends answers are combinations of cells, so
+filters on yearRange/industries/regions select cells instead of rows.
+
+Sums are exact: each metric column is scaled by a power of two to integers,
+split into chunks small enough for float64 bincount to add without rounding and
+reassembled as Python ints, so combining cells (or patching them) loses nothing.
+
+Responses must equal pandas' ``groupby().mean().round(2)`` on the rows. pandas adds
+each group with compensated (Kahan) summation, which lands on the correctly
+rounded sum or within an ulp of it, and then divides by the count. The cube
+divides the correctly rounded sum the same way, and serves a rounded mean only
+when every sum within two ulps of it rounds to the same two decimals; otherwise
+(typically an exact tie like 74.575) ``Selection`` returns None and the caller
+computes that payload from the rows. Overview means are unrounded and come from
+numpy's pairwise summation, which no cell combination reproduces bit for bit, so
+they are always computed from the rows.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DIMENSIONS = ['Industry', 'Region', 'Year']
+METRICS = [
+    'ESG_Overall', 'ESG_Environmental', 'ESG_Social', 'ESG_Governance',
+    'Revenue', 'GrowthRate', 'CarbonEmissions',
+]
+# Filters a cube can answer; any other RANGE_FILTERS key needs the rows
+CUBE_FILTERS = {'yearRange', 'industries', 'regions'}
+
+DIMENSION_COLUMNS = ['ESG_Overall', 'ESG_Environmental', 'ESG_Social', 'ESG_Governance', 'Revenue', 'CarbonEmissions']
+TREND_COLUMNS = DIMENSION_COLUMNS + ['GrowthRate']
+
+
+class ExactSums:
+    """Per-group exact sums of a float column, as Python ints scaled by 2**exp."""
+
+    def __init__(self, ints, exp):
+        self.ints = ints  # object array of Python ints, one per group
+        self.exp = exp
+
+    @classmethod
+    def of(cls, values, groups, n):
+        """Exact sums of values (NaNs skipped) per group code in [0, n); None if not representable."""
+        finite = np.isfinite(values)
+        if (~finite & ~np.isnan(values)).any():
+            return None  # +/-inf
+        values = np.where(finite, values, 0.0)
+        nonzero = values[values != 0]
+        if not len(nonzero):
+            return cls(np.array([0] * n, dtype=object), 0)
+        _, exps = np.frexp(nonzero)
+        exp = int(exps.min()) - 53
+        if int(exps.max()) - exp > 1000:
+            return None
+        scaled = np.ldexp(values, -exp)  # integer-valued and exact
+        bits = max(8, 52 - (len(values) + 1).bit_length())
+        base = float(2 ** bits)
+        total = [0] * n
+        for sign, part in ((1, np.maximum(scaled, 0)), (-1, np.maximum(-scaled, 0))):
+            shift = 0
+            while part.any():
+                high = np.floor(part / base)
+                chunk = np.bincount(groups, weights=part - high * base, minlength=n)
+                for g in np.flatnonzero(chunk):
+                    total[g] += sign * (int(chunk[g]) << shift)
+                part, shift = high, shift + bits
+        return cls(np.array(total, dtype=object), exp)
+
+    def total(self, mask=None):
+        return int((self.ints if mask is None else self.ints[mask]).sum())
+
+    def to_float(self, total):
+        """Correctly rounded total * 2**exp."""
+        if self.exp < 0:
+            return total / (1 << -self.exp)
+        return float(total << self.exp)
+
+
+class Rollup:
+    def __init__(self, cells, rows, counts, sums, sumsq, companies, company_rows, categories, year_dtype):
+        self.cells = cells            # DataFrame of dimension codes: Industry, Region (category codes, -1 missing), Year
+        self.rows = rows              # int64 rows per cell
+        self.counts = counts          # metric -> int64 non-missing values per cell
+        self.sums = sums              # metric -> ExactSums
+        self.sumsq = sumsq            # metric -> ExactSums of squared values (for variance panels)
+        self.companies = companies    # per cell: sorted unique company codes
+        self.company_rows = company_rows  # per cell: rows per company (so rows can be taken out again)
+        self.categories = categories  # Industry / Region / CompanyName -> category Index
+        self.year_dtype = year_dtype
+
+    @classmethod
+    def build(cls, df):
+        """Cube for a normalized frame, or None when it lacks a column or holds non-finite measures."""
+        if any(c not in df.columns for c in DIMENSIONS + METRICS + ['CompanyName']):
+            return None
+        industry = _categorical(df['Industry'])
+        region = _categorical(df['Region'])
+        company = _categorical(df['CompanyName'])
+        year = df['Year'].to_numpy(dtype='float64', na_value=np.nan)
+        year_codes, years = pd.factorize(year, sort=True)  # NaN -> -1
+        keys = np.stack([
+            industry.cat.codes.to_numpy().astype(np.int64),
+            region.cat.codes.to_numpy().astype(np.int64),
+            year_codes.astype(np.int64),
+        ])
+        if keys.shape[1]:
+            cell_keys, cell_of = np.unique(keys, axis=1, return_inverse=True)
+            cell_of = cell_of.reshape(-1)
+        else:
+            cell_keys, cell_of = keys, np.empty(0, dtype=np.int64)
+        cells = pd.DataFrame({
+            'Industry': cell_keys[0],
+            'Region': cell_keys[1],
+            'Year': np.where(cell_keys[2] >= 0, np.append(years, np.nan)[cell_keys[2]], np.nan),
+        })
+        n = len(cells)
+        rows = np.bincount(cell_of, minlength=n)
+        counts, sums, sumsq = {}, {}, {}
+        for m in METRICS:
+            values = df[m].to_numpy(dtype='float64', na_value=np.nan)
+            counts[m] = np.bincount(cell_of, weights=~np.isnan(values), minlength=n).astype(np.int64)
+            sums[m] = ExactSums.of(values, cell_of, n)
+            sumsq[m] = ExactSums.of(values * values, cell_of, n)
+            if sums[m] is None or sumsq[m] is None:
+                return None
+        codes = company.cat.codes.to_numpy()
+        pairs, pair_rows = np.unique(np.stack([cell_of, codes]).astype(np.int64)[:, codes >= 0], axis=1, return_counts=True)
+        bounds = np.searchsorted(pairs[0], np.arange(n + 1))
+        companies = [pairs[1, bounds[i]:bounds[i + 1]] for i in range(n)]
+        company_rows = [pair_rows[bounds[i]:bounds[i + 1]] for i in range(n)]
+        categories = {
+            'Industry': industry.cat.categories,
+            'Region': region.cat.categories,
+            'CompanyName': company.cat.categories,
+        }
+        return cls(cells, rows, counts, sums, sumsq, companies, company_rows, categories, df['Year'].dtype)
+
+    def apply_delta(self, added=None, removed=None, year_dtype=None):
+        """New cube with the rows of frame `added` folded in and those of `removed` taken out.
+
+        Exact sums make this identical to rebuilding from the patched rows. Returns None when
+        either frame can't be represented (the caller then rebuilds from scratch).
+        """
+        parts = [(self, 1)]
+        for frame, sign in ((added, 1), (removed, -1)):
+            if frame is not None and len(frame):
+                cube = Rollup.build(frame)
+                if cube is None:
+                    return None
+                parts.append((cube, sign))
+        return Rollup._combine(parts, year_dtype or self.year_dtype)
+
+    @classmethod
+    def _combine(cls, parts, year_dtype):
+        categories = {}
+        for dim in ('Industry', 'Region', 'CompanyName'):
+            merged = parts[0][0].categories[dim]
+            for cube, _ in parts[1:]:
+                merged = merged.union(cube.categories[dim])
+            categories[dim] = merged
+        exps = {m: min(c.sums[m].exp for c, _ in parts) for m in METRICS}
+        sq_exps = {m: min(c.sumsq[m].exp for c, _ in parts) for m in METRICS}
+
+        acc = OrderedDict()  # (industry, region, year) -> per-cell accumulator
+        for cube, sign in parts:
+            ind_map = categories['Industry'].get_indexer(cube.categories['Industry'])
+            reg_map = categories['Region'].get_indexer(cube.categories['Region'])
+            comp_map = categories['CompanyName'].get_indexer(cube.categories['CompanyName'])
+            for i, (ind, reg, year) in enumerate(cube.cells.itertuples(index=False)):
+                key = (int(ind_map[ind]) if ind >= 0 else -1, int(reg_map[reg]) if reg >= 0 else -1,
+                       None if np.isnan(year) else float(year))
+                cell = acc.get(key)
+                if cell is None:
+                    cell = acc[key] = {'rows': 0, 'companies': {}, 'counts': dict.fromkeys(METRICS, 0),
+                                       'sums': dict.fromkeys(METRICS, 0), 'sumsq': dict.fromkeys(METRICS, 0)}
+                cell['rows'] += sign * int(cube.rows[i])
+                for m in METRICS:
+                    cell['counts'][m] += sign * int(cube.counts[m][i])
+                    cell['sums'][m] += sign * (cube.sums[m].ints[i] << (cube.sums[m].exp - exps[m]))
+                    cell['sumsq'][m] += sign * (cube.sumsq[m].ints[i] << (cube.sumsq[m].exp - sq_exps[m]))
+                for code, rows in zip(comp_map[cube.companies[i]], cube.company_rows[i]):
+                    cell['companies'][int(code)] = cell['companies'].get(int(code), 0) + sign * int(rows)
+
+        kept = [(k, c) for k, c in acc.items() if c['rows'] > 0]
+        cells = pd.DataFrame({
+            'Industry': np.array([k[0] for k, _ in kept], dtype=np.int64),
+            'Region': np.array([k[1] for k, _ in kept], dtype=np.int64),
+            'Year': np.array([np.nan if k[2] is None else k[2] for k, _ in kept], dtype='float64'),
+        })
+        companies, company_rows = [], []
+        for _, c in kept:
+            live = sorted((code, n) for code, n in c['companies'].items() if n > 0)
+            companies.append(np.array([code for code, _ in live], dtype=np.int64))
+            company_rows.append(np.array([n for _, n in live], dtype=np.int64))
+        return cls(
+            cells,
+            np.array([c['rows'] for _, c in kept], dtype=np.int64),
+            {m: np.array([c['counts'][m] for _, c in kept], dtype=np.int64) for m in METRICS},
+            {m: ExactSums(np.array([c['sums'][m] for _, c in kept] or [], dtype=object), exps[m]) for m in METRICS},
+            {m: ExactSums(np.array([c['sumsq'][m] for _, c in kept] or [], dtype=object), sq_exps[m]) for m in METRICS},
+            companies,
+            company_rows,
+            categories,
+            year_dtype,
+        )
+
+    def select(self, filters=None, rows=None):
+        """Cells matching the yearRange / industries / regions filters.
+
+        rows: callable returning the filtered frame, for answers the cube can't give exactly.
+        """
+        filters = filters or {}
+        mask = np.ones(len(self.cells), dtype=bool)
+        if 'yearRange' in filters:
+            lo, hi = float(filters['yearRange'][0]), float(filters['yearRange'][1])
+            years = self.cells['Year'].to_numpy()
+            mask &= (years >= lo) & (years <= hi)  # NaN years never match
+        for key, column in (('industries', 'Industry'), ('regions', 'Region')):
+            if filters.get(key):
+                idx = self.categories[column].get_indexer(pd.Index(list(filters[key])))
+                mask &= np.isin(self.cells[column].to_numpy(), idx[idx >= 0])
+        return Selection(self, mask, rows)
+
+
+class Selection:
+    def __init__(self, cube, mask, rows=None):
+        self.cube = cube
+        self.mask = mask
+        self.rows = rows
+
+    def _rounded_mean(self, metric, mask):
+        """round(sum / count, 2) as pandas computes it, or None when the result is not certain."""
+        count = int(self.cube.counts[metric][mask].sum())
+        if not count:
+            return float('nan')
+        sums = self.cube.sums[metric]
+        low = high = np.float64(sums.to_float(sums.total(mask)))
+        rounded = float(np.round(low / count, 2))
+        for _ in range(2):
+            low, high = np.nextafter(low, -np.inf), np.nextafter(high, np.inf)
+            if float(np.round(low / count, 2)) != rounded or float(np.round(high / count, 2)) != rounded:
+                return None
+        return rounded
+
+    def _companies(self, mask):
+        picked = [c for c, keep in zip(self.cube.companies, mask) if keep]
+        return len(np.unique(np.concatenate(picked))) if picked else 0
+
+    def row_count(self):
+        return int(self.cube.rows[self.mask].sum())
+
+    def _groups(self, dimension):
+        codes = self.cube.cells[dimension].to_numpy()
+        observed = codes[self.mask & (self.cube.rows > 0)]
+        if dimension == 'Year':
+            keys = np.unique(observed[~np.isnan(observed)])
+            labels = [np.array(k).astype(self.cube.year_dtype).item() for k in keys]
+        else:
+            keys = np.unique(observed[observed >= 0])
+            labels = [self.cube.categories[dimension][k] for k in keys]
+        return [(label, self.mask & (codes == k)) for label, k in zip(labels, keys)]
+
+    def _grouped(self, dimension, columns, with_companies):
+        """Records as the row path builds them, or None if any mean is not certain."""
+        out = []
+        for label, mask in self._groups(dimension):
+            record = {dimension: label}
+            for c in columns:
+                record[c] = self._rounded_mean(c, mask)
+                if record[c] is None:
+                    return None
+            if with_companies:
+                record['CompanyCount'] = self._companies(mask)
+            out.append(record)
+        return out
+
+    def by_dimension(self, dimension):
+        return self._grouped(dimension, DIMENSION_COLUMNS, True)
+
+    def trends(self):
+        return self._grouped('Year', TREND_COLUMNS, False)
+
+
+def _categorical(series):
+    return series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+
+
+def cube_answers(filters):
+    """True when the filter payload only touches Year / Industry / Region."""
+    from .filter_engine import RANGE_FILTERS
+    return not any(k in filters for k in RANGE_FILTERS if k not in CUBE_FILTERS)
+
+
+class RollupCache:
+    """Cubes per (user, dataset version); small, so many more fit than frames."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, version, cube):
+        with self._lock:
+            self.builds += 1
+            self._entries[user_id] = (version, cube)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cube
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'builds': self.builds}
+
+
+rollup_cache = RollupCache(int(os.getenv('ROLLUP_CACHE_ENTRIES', 256)))
@@ -0,0 +1,73 @@
+"""Prediction engine selection.
+
+MODEL_ENGINE picks who scores /predict and /predict-batch:
+
+    remote  the external model at WATSONX_MODEL_URL (responses cached by content);
+            without a URL the endpoints answer 503 (default)
+    local   the in-process ridge model from local_model
+    auto    remote when WATSONX_MODEL_URL is set, local otherwise
+
+Falling back to the local model is opt-in (local or auto), so a deployment that
+never set MODEL_ENGINE keeps the remote-only behaviour. local_model (numpy/pandas)
+is imported only when the local engine is used.
+"""
+import os
+
+from . import model_client
+from .prediction_cache import predict_one_cached, predict_many_cached
+from .startup import register_warmup
+
+ENGINES = ('remote', 'local', 'auto')
+
+
+def remote_url():
+    return os.getenv('WATSONX_MODEL_URL', '').strip()
+
+
+def active_engine():
+    """'remote' or 'local', or None when remote is required but not configured."""
+    engine = os.getenv('MODEL_ENGINE', 'remote').strip().lower()
+    if engine not in ENGINES:
+        engine = 'remote'
+    if engine == 'auto':
+        return 'remote' if remote_url() else 'local'
+    if engine == 'remote' and not remote_url():
+        return None
+    return engine
+
+
+def engine_model_name(engine):
+    if engine == 'local':
+        from . import local_model
+        return local_model.model_name()
+    return os.getenv('WATSONX_MODEL_NAME', 'WatsonX ESG Predictor')
+
+
+def score_one(engine, user_id, inputs):
+    """Returns (result, cached)."""
+    if engine == 'local':
+        from . import local_model
+        result, error, _ = local_model.score_rows(local_model.model_for_user(user_id), [inputs])[0]
+        if error:
+            raise ValueError(error)
+        return result, False
+    return predict_one_cached(remote_url(), inputs)
+
+
+def score_many(engine, user_id, rows):
+    """Returns [(result, error, cached)] in input order."""
+    if engine == 'local':
+        from . import local_model
+        return local_model.score_rows(local_model.model_for_user(user_id), rows)
+    return predict_many_cached(remote_url(), rows)
+
+
+@register_warmup('scoring_model')
+def warm():
+    """Prepare whichever engine will serve: fit the default local model, or open the remote session."""
+    engine = active_engine()
+    if engine == 'local':
+        from . import local_model
+        local_model.default_model()
+    elif engine == 'remote':
+        model_client.get_session()
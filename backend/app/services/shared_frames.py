@@ -0,0 +1,218 @@
+"""Read-only dataset frames shared by every worker process through memory-mapped files.
+
+Each published frame is a directory of one ``.npy`` file per column (category codes
+for categorical and text columns) plus a ``manifest.json`` holding names, dtypes and
+the category labels. Workers load the column files with ``np.load(mmap_mode='r')``
+and wrap them in a DataFrame without copying, so all workers map the same page-cache
+pages and a dataset's memory no longer grows with the number of gunicorn workers.
+
+Layout under SHARED_DATASET_DIR::
+
+    <key>/VERSION             dataset version currently published for this key
+    <key>/<digest(version)>/  manifest.json + c0.npy, c1.npy, ...
+
+A key is a user id (or ``_default`` for the bundled dataset). Directories are written
+under a temporary name and renamed into place, then VERSION is replaced atomically;
+older version directories are removed afterwards. Workers that still map a removed
+file keep reading it until they drop the frame.
+
+Frames that cannot be represented this way (extension dtypes, non-default index,
+mixed-type text) are simply not shared; callers keep their private copy.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+SHARED_DATASETS = os.getenv('SHARED_DATASETS', 'true').lower() == 'true'
+SHARED_DATASET_DIR = os.getenv('SHARED_DATASET_DIR') or os.path.join(tempfile.gettempdir(), 'esg-shared-datasets')
+MANIFEST = 'manifest.json'
+FORMAT = 1
+
+
+def _digest(version):
+    return hashlib.sha1(str(version).encode('utf-8')).hexdigest()[:20]
+
+
+def _safe_key(key):
+    return ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in str(key))
+
+
+def _encode_labels(values):
+    """Labels as JSON-safe python scalars, or None when they would not round-trip."""
+    labels = values.tolist()
+    kinds = {type(v) for v in labels}
+    if not kinds <= {str, int, float, bool}:
+        return None
+    if str in kinds and len(kinds) > 1:
+        return None
+    return labels
+
+
+def _encode(df):
+    """Column arrays and manifest entries for df, or None if it cannot be shared."""
+    if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        return None
+    names = list(df.columns)
+    if not all(isinstance(c, str) for c in names) or len(set(names)) != len(names):
+        return None
+    arrays, columns = [], []
+    for name in names:
+        col = df[name]
+        dtype = col.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            labels = _encode_labels(dtype.categories)
+            if labels is None:
+                return None
+            arrays.append(col.cat.codes.to_numpy())
+            columns.append({'name': name, 'kind': 'category', 'labels': labels,
+                            'labels_dtype': str(dtype.categories.dtype), 'ordered': bool(dtype.ordered)})
+        elif dtype == object:
+            codes, uniques = pd.factorize(col, use_na_sentinel=True)
+            labels = _encode_labels(np.asarray(uniques, dtype=object))
+            if labels is None:
+                return None
+            arrays.append(codes.astype(np.int32))
+            columns.append({'name': name, 'kind': 'object', 'labels': labels})
+        elif isinstance(dtype, np.dtype) and dtype.kind in 'biufmM':
+            arrays.append(col.to_numpy())
+            columns.append({'name': name, 'kind': 'array'})
+        else:
+            return None
+    return arrays, columns
+
+
+def _decode(path, manifest):
+    if not manifest['columns']:
+        return pd.DataFrame(index=pd.RangeIndex(manifest['rows']))
+    data = {}
+    for i, spec in enumerate(manifest['columns']):
+        values = np.load(os.path.join(path, f'c{i}.npy'), mmap_mode='r')
+        kind = spec['kind']
+        if kind == 'category':
+            categories = pd.Index(spec['labels'], dtype=spec['labels_dtype'])
+            data[spec['name']] = pd.Categorical.from_codes(values, categories=categories, ordered=spec['ordered'])
+        elif kind == 'object':
+            # Free text is rebuilt privately; only the codes live in the shared file
+            labels = np.empty(len(spec['labels']) + 1, dtype=object)
+            labels[:-1] = spec['labels']
+            labels[-1] = None
+            data[spec['name']] = labels[np.where(values < 0, len(labels) - 1, values)]
+        else:
+            data[spec['name']] = values
+    # copy=False keeps one block per mapped column instead of consolidating into fresh memory
+    return pd.DataFrame(data, columns=[c['name'] for c in manifest['columns']], copy=False)
+
+
+class SharedFrameStore:
+    """Publishes frames to, and maps them from, the shared dataset directory."""
+
+    def __init__(self, root, enabled=True):
+        self.root = root
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.maps = 0
+        self.publishes = 0
+        self.unshareable = 0
+        self.errors = 0
+
+    def _key_dir(self, key):
+        return os.path.join(self.root, _safe_key(key))
+
+    def published_version(self, key):
+        try:
+            with open(os.path.join(self._key_dir(key), 'VERSION'), encoding='utf-8') as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def get(self, key, version):
+        """The shared frame for (key, version), or None if that version is not published."""
+        if not self.enabled or self.published_version(key) != str(version):
+            return None
+        path = os.path.join(self._key_dir(key), _digest(version))
+        try:
+            with open(os.path.join(path, MANIFEST), encoding='utf-8') as fh:
+                manifest = json.load(fh)
+            if manifest.get('format') != FORMAT or manifest.get('version') != str(version):
+                return None
+            df = _decode(path, manifest)
+        except (OSError, ValueError, KeyError, TypeError):
+            # Removed by a newer publish between the VERSION check and the load
+            return None
+        with self._lock:
+            self.maps += 1
+        return df
+
+    def publish(self, key, version, df):
+        """Write df as the shared copy of (key, version) and return the mapped frame.
+
+        Returns df itself when sharing is disabled or the frame cannot be shared.
+        """
+        if not self.enabled or df is None:
+            return df
+        encoded = _encode(df)
+        if encoded is None:
+            with self._lock:
+                self.unshareable += 1
+            return df
+        arrays, columns = encoded
+        key_dir = self._key_dir(key)
+        final = os.path.join(key_dir, _digest(version))
+        try:
+            os.makedirs(key_dir, exist_ok=True)
+            if not os.path.isdir(final):
+                tmp = os.path.join(key_dir, f'.tmp-{uuid.uuid4().hex}')
+                os.makedirs(tmp)
+                for i, values in enumerate(arrays):
+                    np.save(os.path.join(tmp, f'c{i}.npy'), np.ascontiguousarray(values), allow_pickle=False)
+                with open(os.path.join(tmp, MANIFEST), 'w', encoding='utf-8') as fh:
+                    json.dump({'format': FORMAT, 'version': str(version), 'rows': len(df), 'columns': columns}, fh)
+                try:
+                    os.rename(tmp, final)
+                except OSError:
+                    # Another worker published the same version first
+                    shutil.rmtree(tmp, ignore_errors=True)
+            version_tmp = os.path.join(key_dir, f'.VERSION-{uuid.uuid4().hex}')
+            with open(version_tmp, 'w', encoding='utf-8') as fh:
+                fh.write(str(version))
+            os.replace(version_tmp, os.path.join(key_dir, 'VERSION'))
+            self._prune(key_dir, keep=os.path.basename(final))
+        except OSError:
+            with self._lock:
+                self.errors += 1
+            return df
+        with self._lock:
+            self.publishes += 1
+        mapped = self.get(key, version)
+        return df if mapped is None else mapped
+
+    def _prune(self, key_dir, keep):
+        for name in os.listdir(key_dir):
+            if name in (keep, 'VERSION') or name.startswith('.'):
+                continue
+            shutil.rmtree(os.path.join(key_dir, name), ignore_errors=True)
+
+    def discard(self, key):
+        """Remove everything published for key (e.g. when the account is deleted)."""
+        shutil.rmtree(self._key_dir(key), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'dir': self.root,
+                'maps': self.maps,
+                'publishes': self.publishes,
+                'unshareable': self.unshareable,
+                'errors': self.errors,
+            }
+
+
+shared_frames = SharedFrameStore(SHARED_DATASET_DIR, enabled=SHARED_DATASETS)
@@ -0,0 +1,107 @@
+"""Startup timing report and warm-up hooks.
+
+create_app times its phases with ``report.phase(name)``. Modules register warm-up hooks
+(``@register_warmup(name)``) that prime their caches: the bundled dataset, the local
+scoring model, the Parquet reader. With STARTUP_WARMUP=true the hooks run at the end of
+create_app, so the first request of a worker no longer pays for them. It defaults to
+PRELOAD_APP: under gunicorn with PRELOAD_APP=true (see gunicorn.conf.py) warm-up happens
+once in the master and forked workers inherit the loaded data. Without preloading,
+create_app leaves pandas, numpy and pyarrow unimported; the routes import the dataset
+services on first use.
+
+GET /api/health/startup returns the report, including time-to-first-request for the
+current worker process.
+"""
+import importlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+WARMUP = os.getenv('STARTUP_WARMUP', os.getenv('PRELOAD_APP', 'false')).lower() == 'true'
+# Imported by warm_up so their hooks are registered; create_app itself does not load them
+WARMUP_MODULES = ('.datasets', '.scoring')
+
+_hooks = []  # (priority, name, fn)
+
+
+def register_warmup(name, priority=50):
+    """Register fn as a warm-up hook; lower priorities run first."""
+    def decorator(fn):
+        _hooks.append((priority, name, fn))
+        return fn
+    return decorator
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+class StartupReport:
+    """Phase and warm-up timings of this process, plus its time to first request.
+
+    Times are measured from the first import of the app package; in a worker forked
+    from a preloaded master, time-to-first-request is measured from the fork.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.pid = os.getpid()
+        self.forked_at = None
+        self.phases = {}
+        self.warmup = {}
+        self.ready_ms = None
+        self.first_request_ms = None
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        self.forked_at = time.perf_counter()
+        self.first_request_ms = None
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = _ms(time.perf_counter() - t0)
+
+    def mark_ready(self):
+        self.ready_ms = _ms(time.perf_counter() - self.started)
+
+    def mark_request(self):
+        if self.first_request_ms is not None:
+            return
+        with self._lock:
+            if self.first_request_ms is None:
+                origin = self.forked_at if self.forked_at is not None else self.started
+                self.first_request_ms = _ms(time.perf_counter() - origin)
+
+    def as_dict(self):
+        return {
+            'pid': os.getpid(),
+            'preloaded': self.forked_at is not None,
+            'phases_ms': dict(self.phases),
+            'warmup_ms': dict(self.warmup),
+            'ready_ms': self.ready_ms,
+            'first_request_ms': self.first_request_ms,
+        }
+
+
+report = StartupReport()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=report.after_fork)
+
+
+def warm_up(app):
+    """Run every registered warm-up hook, timing each; a failing hook is reported, not raised."""
+    for name in WARMUP_MODULES:
+        importlib.import_module(name, __package__)
+    with app.app_context():
+        for _, name, fn in sorted(_hooks, key=lambda h: h[0]):
+            t0 = time.perf_counter()
+            try:
+                fn()
+                report.warmup[name] = _ms(time.perf_counter() - t0)
+            except Exception as e:
+                report.warmup[name] = f'failed: {e}'
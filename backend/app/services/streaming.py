@@ -0,0 +1,117 @@
+"""Chunked response encoders for DataFrames.
+
+Each encoder takes an iterable of DataFrame chunks and yields encoded text, so
+only one chunk is ever rendered at a time and the first bytes go out as soon as
+the first chunk is ready.
+"""
+import json
+import unicodedata
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.datastructures import ContentRange
+
+
+CHUNK_ROWS = 5000
+BLOB_CHUNK_BYTES = 256 * 1024
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def frame_chunks(df, chunk_rows=CHUNK_ROWS):
+    if not len(df):
+        yield df  # keeps the CSV header for empty results
+        return
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def iter_csv(chunks):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header)
+        header = False
+
+
+def iter_ndjson(chunks):
+    from .dataset_store import frame_records
+
+    for chunk in chunks:
+        yield ''.join(json.dumps(row, default=str) + '\n' for row in frame_records(chunk))
+
+
+def iter_json(chunks, count):
+    """Same document as jsonify({'data': [...], 'count': count}), emitted incrementally."""
+    from .dataset_store import frame_records
+
+    yield '{"data":['
+    first = True
+    for chunk in chunks:
+        rows = frame_records(chunk)
+        if not rows:
+            continue
+        yield ('' if first else ',') + ','.join(json.dumps(row, default=str) for row in rows)
+        first = False
+    yield '],"count":%d}' % count
+
+
+def encode(fmt, chunks, count):
+    if fmt == 'csv':
+        return iter_csv(chunks)
+    if fmt == 'ndjson':
+        return iter_ndjson(chunks)
+    return iter_json(chunks, count)
+
+
+def _read_range(fh, start, stop):
+    try:
+        fh.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            data = fh.read(min(BLOB_CHUNK_BYTES, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        fh.close()
+
+
+def _disposition_params(download_name):
+    """filename (and RFC 5987 filename*) parameters, built the way werkzeug's send_file does."""
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': "UTF-8''" + quote(download_name, safe="!#$&+-.^_`|~")}
+    return {'filename': download_name}
+
+
+def blob_response(fh, length, mimetype, download_name, etag=None):
+    """Stream an open, seekable blob as a file download, honouring a single HTTP Range."""
+    start, stop, status = 0, length, 200
+    rng = request.range
+    # Multi-range requests are not supported; RFC 9110 lets us ignore them and send the whole body
+    if (rng is not None and len(rng.ranges) == 1
+            and (not etag or request.headers.get('If-Range', etag).strip('"') == etag)):
+        bounds = rng.range_for_length(length)
+        if bounds is None:
+            fh.close()
+            resp = Response(status=416)
+            resp.headers['Content-Range'] = f'bytes */{length}'
+            return resp
+        start, stop = bounds
+        status = 206
+    resp = Response(_read_range(fh, start, stop), status=status, mimetype=mimetype, direct_passthrough=True)
+    resp.content_length = stop - start
+    if status == 206:
+        resp.content_range = ContentRange('bytes', start, stop, length)
+    resp.accept_ranges = 'bytes'
+    resp.headers.set('Content-Disposition', 'attachment', **_disposition_params(download_name))
+    if etag:
+        resp.set_etag(etag)
+    return resp
@@ -0,0 +1,117 @@
+"""Data access for the users collection.
+
+Reads name the fields they need: profile reads (PROFILE_FIELDS) never fetch the
+password hash or OTP/token fields, and credential checks fetch only those. Writes that
+return the profile use find_one_and_update(return_document=AFTER) instead of an
+update followed by a re-read.
+
+Profiles are kept in a small in-process cache for USER_PROFILE_TTL seconds. Every
+write through this module refreshes or drops the entry; other workers may serve the
+previous profile until the TTL runs out.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from ..extensions import mongo
+
+PROFILE_FIELDS = ('email', 'full_name', 'phone', 'company_name', 'is_verified', 'prefs', 'avatar',
+                  'created_at', 'last_login')
+PROFILE_PROJECTION = dict.fromkeys(PROFILE_FIELDS, 1)
+
+
+class ProfileCache:
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (profile, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user_id, profile):
+        if self.ttl <= 0 or profile is None:
+            return profile
+        with self._lock:
+            self._entries[user_id] = (profile, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return profile
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+profile_cache = ProfileCache(
+    ttl=float(os.getenv('USER_PROFILE_TTL', 5)),
+    max_entries=int(os.getenv('USER_PROFILE_CACHE_ENTRIES', 1024)),
+)
+
+
+def _oid(user_id):
+    return user_id if isinstance(user_id, ObjectId) else ObjectId(user_id)
+
+
+def get_profile(user_id):
+    """The user's profile fields (cached), or None if the user does not exist."""
+    key = str(user_id)
+    profile = profile_cache.get(key)
+    if profile is None:
+        profile = profile_cache.put(key, mongo.db.users.find_one({'_id': _oid(user_id)}, PROFILE_PROJECTION))
+    return profile
+
+
+def find_by_email(email, fields=()):
+    """Look a user up by email, fetching only the given fields (and _id)."""
+    return mongo.db.users.find_one({'email': email}, dict.fromkeys(fields, 1) or {'_id': 1})
+
+
+def find_one(query, fields=()):
+    return mongo.db.users.find_one(query, dict.fromkeys(fields, 1) or {'_id': 1})
+
+
+def get_fields(user_id, fields):
+    return mongo.db.users.find_one({'_id': _oid(user_id)}, dict.fromkeys(fields, 1))
+
+
+def update_profile(user_id, update, query=None):
+    """Apply update and return the resulting profile in the same round-trip (None if no match)."""
+    profile = mongo.db.users.find_one_and_update(
+        {'_id': _oid(user_id), **(query or {})}, update,
+        projection=PROFILE_PROJECTION, return_document=ReturnDocument.AFTER,
+    )
+    if profile is None:
+        profile_cache.invalidate(str(user_id))
+        return None
+    return profile_cache.put(str(user_id), profile)
+
+
+def update(user_id, update, query=None):
+    """Write fields outside the profile (credentials, OTPs); returns whether a user matched."""
+    res = mongo.db.users.update_one({'_id': _oid(user_id), **(query or {})}, update)
+    profile_cache.invalidate(str(user_id))
+    return res.matched_count > 0
+
+
+def invalidate(user_id):
+    profile_cache.invalidate(str(user_id))
@@ -0,0 +1,7 @@
+# Picked up automatically by gunicorn from the working directory.
+import os
+
+# PRELOAD_APP=true builds the app (and runs its warm-up hooks) once in the master before
+# forking, so workers start with the bundled dataset and model already loaded.
+# PyMongo resets its connection pools in each forked child.
+preload_app = os.getenv('PRELOAD_APP', 'false').lower() == 'true'
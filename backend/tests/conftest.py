@@ -0,0 +1,113 @@
+import os
+import threading
+
+import pytest
+
+# No background threads or warm-up in tests; the app fixture runs the migrations itself
+for name, value in (('MIGRATE_ON_START', 'false'), ('JOB_WORKER_THREADS', '0'), ('MAIL_SENDER_THREADS', '0'),
+                    ('STARTUP_WARMUP', 'false'), ('SEND_MAIL', 'false'), ('SHARED_DATASETS', 'false')):
+    os.environ.setdefault(name, value)
+
+# Collection methods that each cost one command on a real server
+COMMANDS = ('find', 'find_one', 'find_one_and_update', 'insert_one', 'insert_many', 'update_one', 'update_many',
+            'replace_one', 'delete_one', 'delete_many', 'count_documents', 'aggregate', 'bulk_write', 'create_index')
+
+
+def _count_commands(monkeypatch, listener):
+    """Report every mongomock call to listener, which pymongo would do via command events.
+
+    Calls made from inside another mongomock method are internal and not counted.
+    """
+    import mongomock.collection
+
+    nested = threading.local()
+
+    def counted(method):
+        def wrapper(self, *args, **kwargs):
+            depth = getattr(nested, 'depth', 0)
+            if depth == 0:
+                listener.started(None)
+            nested.depth = depth + 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                nested.depth = depth
+        return wrapper
+
+    for name in COMMANDS:
+        monkeypatch.setattr(mongomock.collection.Collection, name,
+                            counted(getattr(mongomock.collection.Collection, name)))
+
+
+def _accept_sort(monkeypatch):
+    # pymongo >= 4.9 passes sort= with UpdateOne/ReplaceOne bulk operations; mongomock 4.3 rejects it
+    from mongomock.collection import BulkOperationBuilder
+
+    for name in ('add_update', 'add_replace'):
+        def without_sort(self, *args, _method=getattr(BulkOperationBuilder, name), sort=None, **kwargs):
+            return _method(self, *args, **kwargs)
+        monkeypatch.setattr(BulkOperationBuilder, name, without_sort)
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    mongomock = pytest.importorskip('mongomock')
+    from app import create_app
+    from app.extensions import mongo
+    from app.services import migrations, mongo_ops
+
+    client = mongomock.MongoClient()
+
+    def init_app(self, app, *args, **kwargs):
+        self.cx = client
+        self.db = client['esg_analytics_test']
+
+    monkeypatch.setattr(type(mongo), 'init_app', init_app)
+    monkeypatch.setenv('DATASET_STORE', 'local')
+    monkeypatch.setenv('DATASET_STORE_DIR', str(tmp_path / 'blobs'))
+    _accept_sort(monkeypatch)
+    _count_commands(monkeypatch, mongo_ops.listener)
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        migrations.run(mongo.db)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(app):
+    """(user_id, headers) of a fresh user with a valid bearer token."""
+    from datetime import timedelta
+
+    from bson import ObjectId
+
+    from app.services.tokens import create_token
+
+    user_id = str(ObjectId())
+    with app.app_context():
+        token = create_token({'user_id': user_id, 'email': f'{user_id}@esg.local'}, timedelta(hours=1))
+    return user_id, {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def active_dataset(client, auth):
+    """Upload the first 400 rows of the bundled dataset and make them the user's active dataset."""
+    import json
+
+    import pandas as pd
+
+    path = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'esg_financial_dataset.csv')
+    frame = pd.read_csv(path, nrows=400)
+    _, headers = auth
+    resp = client.post('/api/upload-dataset', headers=headers, json={
+        'filename': 'esg.csv', 'columns': list(frame.columns), 'data': json.loads(frame.to_json(orient='records')),
+    })
+    assert resp.status_code == 201
+    upload_id = resp.json['upload']['id']
+    assert client.post(f'/api/uploads/{upload_id}/analyze', headers=headers).status_code == 200
+    return frame
@@ -0,0 +1,74 @@
+import base64
+import io
+import os
+
+import pytest
+from bson import ObjectId
+
+from app.extensions import mongo
+from app.services import avatars, users
+
+
+@pytest.fixture
+def user(client, auth):
+    user_id, headers = auth
+    with client.application.app_context():
+        mongo.db.users.insert_one({'_id': ObjectId(user_id), 'email': f'{user_id}@esg.local', 'name': 'Avatar'})
+    return user_id, headers
+
+
+def _data_url(color):
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new('RGB', (300, 200), color).save(buf, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+
+def _stored_refs():
+    root = os.environ['DATASET_STORE_DIR']
+    return {os.path.relpath(os.path.join(d, f), root) for d, _, files in os.walk(root) for f in files}
+
+
+def _refs(avatar):
+    return {p['ref'] for p in avatar['sizes'].values()}
+
+
+def _upload(client, headers, color):
+    resp = client.post('/api/auth/avatar', json={'data': _data_url(color)}, headers=headers)
+    assert resp.status_code == 200
+    return resp.get_json()['user']
+
+
+def test_replacing_an_avatar_keeps_only_the_new_thumbnails(client, user):
+    user_id, headers = user
+    first = _upload(client, headers, 'red')
+    second = _upload(client, headers, 'blue')
+    assert second['avatar'] != first['avatar']
+
+    with client.application.app_context():
+        avatar = users.get_fields(user_id, ('avatar',))['avatar']
+    assert _stored_refs() == _refs(avatar)
+    assert client.get(second['avatar']).status_code == 200
+    assert client.get(first['avatar']).status_code == 404
+
+
+def test_failed_update_keeps_the_old_avatar_and_drops_the_new_blobs(client, user, monkeypatch):
+    user_id, headers = user
+    _upload(client, headers, 'red')
+    with client.application.app_context():
+        before = users.get_fields(user_id, ('avatar',))['avatar']
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('primary stepped down')
+
+    monkeypatch.setattr(avatars.users, 'update_profile', fail)
+    with pytest.raises(RuntimeError):
+        client.post('/api/auth/avatar', json={'data': _data_url('blue')}, headers=headers)
+    assert _stored_refs() == _refs(before)
+
+
+def test_avatar_for_a_missing_user_leaves_no_blobs(app):
+    with app.app_context():
+        assert avatars.save('0' * 24, _data_url('green')) is None
+    assert _stored_refs() == set()
@@ -0,0 +1,42 @@
+import io
+
+import pandas as pd
+from bson import ObjectId
+
+from app.analytics import routes
+from app.extensions import mongo
+from app.services.dataset_store import read_dataset
+
+BASE = {'CompanyName': 'Acme', 'Industry': 'Energy', 'Region': 'Europe', 'Year': 2020, 'Revenue': 10.5,
+        'ESG_Overall': 50.0, 'ESG_Environmental': 50.0, 'ESG_Social': 50.0, 'ESG_Governance': 50.0}
+
+
+def _upload(client, headers, frame):
+    data = {'file': (io.BytesIO(frame.to_csv(index=False).encode('utf-8')), 'widening.csv')}
+    return client.post('/api/upload-dataset/file', data=data, headers=headers, content_type='multipart/form-data')
+
+
+def test_later_chunks_widen_the_column_types_without_losing_values(client, auth, monkeypatch):
+    monkeypatch.setattr(routes, 'UPLOAD_CHUNK_ROWS', 4)
+    _, headers = auth
+    rows = []
+    for i in range(12):
+        rows.append({**BASE, 'CompanyID': i + 1,
+                     'Score': 7 if i < 4 else 7.25,                  # int, then float
+                     'Code': 100 + i if i < 8 else f'X{i}',          # int, then text
+                     'Note': None if i < 6 else f'n{i}'})            # empty, then text
+    frame = pd.DataFrame(rows)
+
+    resp = _upload(client, headers, frame)
+    assert resp.status_code == 201, resp.json
+    upload = resp.json['upload']
+    assert upload['row_count'] == 12
+    assert upload['normalization']['widened'] == {'Code': 'string'}
+
+    with client.application.app_context():
+        ds = mongo.db.user_datasets.find_one({'upload_id': ObjectId(upload['id'])})
+        stored = read_dataset(ds)
+    assert stored['Score'].tolist() == [7.0] * 4 + [7.25] * 8
+    assert stored['Code'].tolist() == [str(100 + i) for i in range(8)] + [f'X{i}' for i in range(8, 12)]
+    assert stored['Note'].isna().sum() == 6 and stored['Note'].iloc[6:].tolist() == [f'n{i}' for i in range(6, 12)]
+    assert stored['CompanyID'].tolist() == list(range(1, 13))
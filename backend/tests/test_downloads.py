@@ -0,0 +1,58 @@
+import io
+import json
+import os
+
+import pandas as pd
+import pytest
+
+DATASET = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'esg_financial_dataset.csv')
+
+
+@pytest.fixture
+def upload(client, auth):
+    _, headers = auth
+    frame = pd.read_csv(DATASET, nrows=300)
+    resp = client.post('/api/upload-dataset', headers=headers, json={
+        'filename': 'Résultats ESG.csv', 'columns': list(frame.columns),
+        'data': json.loads(frame.to_json(orient='records')),
+    })
+    assert resp.status_code == 201
+    return f"/api/uploads/{resp.json['upload']['id']}/download?mode=file&format=csv", headers, frame
+
+
+def test_full_download_is_the_csv_with_a_disposition(client, upload):
+    url, headers, frame = upload
+    resp = client.get(url, headers=headers)
+    assert resp.status_code == 200 and resp.headers['Accept-Ranges'] == 'bytes'
+    assert int(resp.headers['Content-Length']) == len(resp.data)
+    disposition = resp.headers['Content-Disposition']
+    assert disposition.startswith('attachment') and "filename*=UTF-8''R%C3%A9sultats%20ESG.csv" in disposition
+    assert len(pd.read_csv(io.BytesIO(resp.data))) == len(frame)
+
+
+def test_ranges_resume_the_same_bytes(client, upload):
+    url, headers, _ = upload
+    full = client.get(url, headers=headers)
+    body, etag = full.data, full.headers['ETag']
+
+    part = client.get(url, headers={**headers, 'Range': 'bytes=100-'})
+    assert part.status_code == 206
+    assert part.headers['Content-Range'] == f'bytes 100-{len(body) - 1}/{len(body)}'
+    assert part.data == body[100:]
+
+    tail = client.get(url, headers={**headers, 'Range': 'bytes=-50', 'If-Range': etag})
+    assert tail.status_code == 206 and tail.data == body[-50:]
+
+
+def test_unsupported_or_stale_ranges(client, upload):
+    url, headers, _ = upload
+    body = client.get(url, headers=headers).data
+
+    multi = client.get(url, headers={**headers, 'Range': 'bytes=0-9,20-29'})
+    assert multi.status_code == 200 and multi.data == body
+
+    stale = client.get(url, headers={**headers, 'Range': 'bytes=0-9', 'If-Range': '"not-the-etag"'})
+    assert stale.status_code == 200 and stale.data == body
+
+    beyond = client.get(url, headers={**headers, 'Range': f'bytes={len(body)}-'})
+    assert beyond.status_code == 416 and beyond.headers['Content-Range'] == f'bytes */{len(body)}'
@@ -0,0 +1,24 @@
+import csv
+import io
+import json
+
+ORIGIN = 'http://localhost:5173'
+
+
+def test_csv_export_streams_every_row_with_its_count(client, auth, active_dataset):
+    _, headers = auth
+    resp = client.post('/api/export?format=csv', json={}, headers={**headers, 'Origin': ORIGIN})
+    assert resp.status_code == 200 and resp.is_streamed
+    rows = list(csv.DictReader(io.StringIO(resp.get_data(as_text=True))))
+    assert len(rows) == len(active_dataset) == int(resp.headers['X-Row-Count'])
+    exposed = {h.strip().lower() for h in resp.headers['Access-Control-Expose-Headers'].split(',')}
+    assert {'x-row-count', 'etag', 'content-range'} <= exposed
+
+
+def test_json_export_matches_the_filtered_rows(client, auth, active_dataset):
+    _, headers = auth
+    industry = active_dataset['Industry'].iloc[0]
+    resp = client.post('/api/export', json={'industries': [industry]}, headers=headers)
+    body = json.loads(resp.get_data(as_text=True))
+    expected = int((active_dataset['Industry'] == industry).sum())
+    assert body['count'] == len(body['data']) == expected == int(resp.headers['X-Row-Count'])
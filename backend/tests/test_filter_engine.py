@@ -0,0 +1,72 @@
+import os
+import random
+
+import pandas as pd
+import pytest
+
+from app.services.dataset_schema import ensure_normalized
+from app.services.filter_engine import CATEGORY_FILTERS, RANGE_FILTERS, filter_frame
+
+DATASET = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'esg_financial_dataset.csv')
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return ensure_normalized(pd.read_csv(DATASET))
+
+
+def _pandas_filter(df, filters):
+    """The boolean-mask evaluation apply_filters used before the indexes."""
+    mask = pd.Series(True, index=df.index)
+    for key, (column, bound) in RANGE_FILTERS.items():
+        if key not in filters:
+            continue
+        value = filters[key]
+        if bound == 'range':
+            mask &= (df[column] >= value[0]) & (df[column] <= value[1])
+        elif bound == 'min':
+            mask &= df[column] >= value
+        else:
+            mask &= df[column] <= value
+    for key, column in CATEGORY_FILTERS.items():
+        if filters.get(key):
+            mask &= df[column].isin(filters[key])
+    return df[mask]
+
+
+def _random_filters(rng, values):
+    filters = {}
+    for key, (column, bound) in RANGE_FILTERS.items():
+        if rng.random() < 0.5:
+            continue
+        # Thresholds drawn from the data itself land exactly on boundaries
+        a, b = sorted(rng.choice(values[column]) for _ in range(2))
+        filters[key] = [a, b] if bound == 'range' else a
+    for key, column in CATEGORY_FILTERS.items():
+        if rng.random() < 0.5:
+            continue
+        filters[key] = rng.sample(values[column], rng.randint(0, 3)) + (['Atlantis'] if rng.random() < 0.2 else [])
+    return filters
+
+
+def test_matches_the_pandas_masks_on_random_filters(frame):
+    rng = random.Random(20240517)
+    columns = [column for column, _ in RANGE_FILTERS.values()] + list(CATEGORY_FILTERS.values())
+    values = {column: sorted(frame[column].dropna().unique().tolist()) for column in columns}
+    for _ in range(100):
+        filters = _random_filters(rng, values)
+        expected = _pandas_filter(frame, filters)
+        got = filter_frame(frame, filters)
+        assert got.index.tolist() == expected.index.tolist(), filters
+        pd.testing.assert_frame_equal(got, expected)
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'industries': [], 'regions': []},
+    {'minGrowthRate': -1e9},
+    {'yearRange': [2030, 2040]},
+    {'regions': ['Atlantis'], 'minESGScore': 0},
+])
+def test_edge_cases_match_pandas(frame, filters):
+    pd.testing.assert_frame_equal(filter_frame(frame, filters), _pandas_filter(frame, filters))
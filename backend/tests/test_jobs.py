@@ -0,0 +1,87 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import mongo
+from app.services import jobs
+
+runs = []
+
+
+@jobs.register_job('test_echo')
+def _echo(job, ctx):
+    runs.append(job['worker'])
+    ctx.report(1, 1)
+
+
+@jobs.register_job('test_slow')
+def _slow(job, ctx):
+    time.sleep(job['params']['seconds'])
+    ctx.report(1, 1)
+
+
+def _claim_elsewhere():
+    # Worker ids include the thread, so a claim from another thread acts as another worker
+    claimed = []
+    thread = threading.Thread(target=lambda: claimed.append(jobs._claim()))
+    thread.start()
+    thread.join()
+    return claimed[0]
+
+
+@pytest.fixture
+def ctx(app):
+    runs.clear()
+    with app.app_context():
+        mongo.db.jobs.delete_many({})
+        yield
+
+
+def test_expired_lease_is_reclaimed_and_only_the_new_worker_finishes(ctx):
+    job_id = jobs.submit('test_echo', 'u1', {}, inputs=[{'a': 1}])
+    stale = jobs._claim()
+    assert stale['_id'] == job_id
+    assert _claim_elsewhere() is None
+
+    mongo.db.jobs.update_one({'_id': job_id}, {'$set': {'lease_until': datetime.utcnow() - timedelta(seconds=1)}})
+    fresh = _claim_elsewhere()
+    assert fresh['_id'] == job_id and fresh['worker'] != stale['worker']
+
+    jobs._run(fresh)
+    jobs._run(stale)  # the worker that lost its lease finishes late
+    doc = mongo.db.jobs.find_one({'_id': job_id})
+    assert doc['status'] == 'succeeded'
+    assert doc['worker'] == fresh['worker']
+    assert runs == [fresh['worker'], stale['worker']]
+    assert mongo.db.job_inputs.count_documents({'job_id': job_id}) == 0
+
+
+def test_stale_worker_sees_cancellation_and_cannot_report(ctx):
+    job_id = jobs.submit('test_echo', 'u1', {})
+    stale = jobs._claim()
+    mongo.db.jobs.update_one({'_id': job_id}, {'$set': {'lease_until': datetime.utcnow() - timedelta(seconds=1)}})
+    _claim_elsewhere()
+
+    stale_ctx = jobs.JobContext(job_id, stale['worker'])
+    stale_ctx.report(5, 10)
+    assert stale_ctx.lease_lost and stale_ctx.cancelled()
+    assert mongo.db.jobs.find_one({'_id': job_id})['progress']['done'] == 0
+
+
+def test_heartbeat_keeps_a_slow_job_leased(ctx, monkeypatch):
+    monkeypatch.setattr(jobs, 'LEASE_SECONDS', 1)
+    monkeypatch.setattr(jobs, 'HEARTBEAT_SECONDS', 0.2)
+    job_id = jobs.submit('test_slow', 'u1', {'seconds': 2})
+    job = jobs._claim()
+    runner = threading.Thread(target=jobs._run, args=(job,))
+    runner.start()
+    try:
+        deadline = time.monotonic() + 1.6
+        while time.monotonic() < deadline:
+            assert _claim_elsewhere() is None
+            time.sleep(0.2)
+    finally:
+        runner.join()
+    assert mongo.db.jobs.find_one({'_id': job_id})['status'] == 'succeeded'
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import mongo
+from app.services import migrations
+
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        mongo.db.migrations.delete_many({})
+        yield mongo.db
+
+
+def _hold_lock(db, expires_in):
+    db.migrations.insert_one({'_id': migrations.LOCK_ID, 'owner': 'other-worker',
+                              'expires_at': datetime.utcnow() + timedelta(seconds=expires_in)})
+
+
+def test_run_migrates_once_and_records_the_schema_version(db):
+    user_id = db.users.insert_one({'email': 'inline@esg.local', 'avatar': 'data:image/png;base64,broken'}).inserted_id
+    assert not migrations.is_current(db)
+
+    assert migrations.run(db) is True
+    assert migrations.is_current(db)
+    assert 'avatar' not in db.users.find_one({'_id': user_id})
+    assert 'email_1' in db.users.index_information()
+    assert db.migrations.find_one({'_id': migrations.LOCK_ID}) is None
+
+
+def test_run_backs_off_while_another_process_holds_the_lock(db):
+    _hold_lock(db, 60)
+    assert migrations.run(db) is False
+    assert not migrations.is_current(db)
+
+
+def test_expired_lock_is_taken_over(db):
+    _hold_lock(db, -1)
+    assert migrations.run(db) is True
+    assert migrations.is_current(db)
+    assert db.migrations.find_one({'_id': migrations.LOCK_ID}) is None
+
+
+def test_current_schema_costs_a_single_read(db, monkeypatch):
+    migrations.run(db)
+    monkeypatch.setattr(migrations, 'create_indexes', lambda db: pytest.fail('indexes rebuilt'))
+    assert migrations.run(db) is True
+
+
+def test_migrate_command(app, db):
+    _hold_lock(db, 60)
+    result = app.test_cli_runner().invoke(args=['migrate'])
+    assert result.exit_code != 0 and 'migration lock' in result.output
+
+    db.migrations.delete_one({'_id': migrations.LOCK_ID})
+    result = app.test_cli_runner().invoke(args=['migrate'])
+    assert result.exit_code == 0
+    assert migrations.is_current(db)
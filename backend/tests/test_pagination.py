@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import mongo
+
+STAMPS = [datetime(2024, 5, 1) + timedelta(minutes=m) for m in (0, 0, 0, 5, 5, 9, 9, 9, 9, 12)]
+
+
+@pytest.fixture
+def seeded(client, auth):
+    user_id, headers = auth
+    with client.application.app_context():
+        for name in ('predictions', 'uploads'):
+            collection = mongo.db[name]
+            collection.delete_many({})
+            # Ties on created_at, and two legacy documents without one
+            docs = [{'user_id': user_id, 'created_at': STAMPS[i % len(STAMPS)], 'n': i} for i in range(21)]
+            docs += [{'user_id': user_id, 'n': 21}, {'user_id': user_id, 'n': 22}]
+            collection.insert_many(docs)
+            collection.insert_one({'user_id': 'someone-else', 'created_at': STAMPS[0], 'n': -1})
+    return headers
+
+
+def _walk(client, headers, url, limit, cursor=''):
+    ids = []
+    while cursor is not None:
+        body = client.get(url, query_string={'cursor': cursor, 'limit': limit}, headers=headers).get_json()
+        assert len(body['items']) <= limit and body['has_more'] == (body['next_cursor'] is not None)
+        ids += [item['id'] for item in body['items']]
+        cursor = body['next_cursor']
+    return ids
+
+
+@pytest.mark.parametrize('url', ['/api/predictions', '/api/uploads'])
+@pytest.mark.parametrize('limit', [1, 4, 7, 23, 50])
+def test_cursor_pages_have_no_gaps_or_duplicates(client, seeded, url, limit):
+    by_page = client.get(url, query_string={'limit': 100}, headers=seeded).get_json()
+    expected = [item['id'] for item in by_page['items']]
+    assert len(expected) == by_page['total'] == 23
+    assert _walk(client, seeded, url, limit) == expected
+
+
+def test_cursor_total_and_errors(client, seeded):
+    first = client.get('/api/predictions', query_string={'cursor': '', 'limit': 5}, headers=seeded).get_json()
+    assert 'total' not in first
+    counted = client.get('/api/predictions', query_string={'cursor': first['next_cursor'], 'total': 'exact'},
+                         headers=seeded).get_json()
+    assert counted['total'] == 23
+
+    bad = client.get('/api/predictions', query_string={'cursor': 'not-a-cursor'}, headers=seeded)
+    assert bad.status_code == 400 and bad.get_json()['error'] == 'Invalid cursor'
+
+
+def test_rows_inserted_while_paging_do_not_shift_later_pages(client, auth, seeded):
+    user_id, _ = auth
+    first = client.get('/api/uploads', query_string={'cursor': '', 'limit': 5}, headers=seeded).get_json()
+    with client.application.app_context():
+        mongo.db.uploads.insert_one({'user_id': user_id, 'created_at': datetime.utcnow(), 'n': 99})
+    rest = _walk(client, seeded, '/api/uploads', 5, first['next_cursor'])
+    seen = [item['id'] for item in first['items']] + rest
+    assert len(seen) == len(set(seen)) == 23
+
@@ -0,0 +1,38 @@
+import multiprocessing
+import time
+
+import bcrypt
+
+from app.extensions import mongo
+from app.services import passwords
+from app.services.passwords import PasswordHasher
+
+
+def test_pool_does_not_fork_the_threaded_web_worker():
+    assert passwords.START_METHOD != 'fork'
+    assert passwords.START_METHOD in multiprocessing.get_all_start_methods()
+
+
+def test_pool_hashes_and_checks():
+    hasher = PasswordHasher(workers=1, queue_limit=4, timeout=30, rounds=4)
+    hashed = hasher.hash('s3cret')
+    assert hasher.check(hashed, 's3cret')
+    assert not hasher.check(hashed, 'wrong')
+    assert passwords.hash_cost(hashed) == 4
+    assert PasswordHasher(workers=0, queue_limit=4, timeout=30, rounds=5).needs_rehash(hashed)
+
+
+def test_login_upgrades_a_hash_with_another_cost(client, app):
+    with app.app_context():
+        old_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt(4)).decode()
+        mongo.db.users.insert_one({'email': 'rehash@esg.local', 'password_hash': old_hash, 'is_verified': True})
+    resp = client.post('/api/auth/login', json={'email': 'rehash@esg.local', 'password': 'password123'})
+    assert resp.status_code == 200
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        stored = mongo.db.users.find_one({'email': 'rehash@esg.local'})['password_hash']
+        if stored != old_hash:
+            break
+        time.sleep(0.05)
+    assert passwords.hash_cost(stored) == passwords.ROUNDS
+    assert bcrypt.checkpw(b'password123', stored.encode())
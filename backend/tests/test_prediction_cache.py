@@ -0,0 +1,56 @@
+import pytest
+
+from app.extensions import mongo
+from app.services import model_client, prediction_cache as pc
+
+ROWS = [{'Revenue': 100.0, 'Industry': 'Energy'}, {'Revenue': 250.0, 'Industry': 'Retail'}]
+
+
+@pytest.fixture
+def model(app, monkeypatch):
+    """Stand-in for the remote model; records every row it is asked to score."""
+    scored = []
+
+    def predict_many(url, rows):
+        scored.extend(rows)
+        return [({'ESG_Overall': row['Revenue'] / 10}, None) for row in rows]
+
+    monkeypatch.setattr(model_client, 'predict_many', predict_many)
+    monkeypatch.setattr(pc, 'prediction_cache', pc.PredictionCache(100, 3600))
+    with app.app_context():
+        mongo.db.prediction_cache.delete_many({})
+        yield scored
+
+
+def test_misses_reach_the_model_once_and_hits_are_served_from_cache(model):
+    first = pc.predict_many_cached('http://model', ROWS + ROWS[:1])
+    assert model == ROWS  # the repeated row is scored once
+    assert [cached for _, _, cached in first] == [False, False, False]
+
+    second = pc.predict_many_cached('http://model', ROWS)
+    assert model == ROWS
+    assert [(result, cached) for result, _, cached in second] == [(r, True) for r, _, _ in first[:2]]
+    assert mongo.db.prediction_cache.count_documents({}) == 2
+
+
+def test_mongo_tier_serves_other_processes(model, monkeypatch):
+    pc.predict_many_cached('http://model', ROWS)
+    monkeypatch.setattr(pc, 'prediction_cache', pc.PredictionCache(100, 3600))  # a fresh worker
+    assert all(cached for _, _, cached in pc.predict_many_cached('http://model', ROWS))
+    assert model == ROWS
+
+
+def test_model_version_is_part_of_the_key(model, monkeypatch):
+    pc.predict_many_cached('http://model', ROWS)
+    monkeypatch.setenv('WATSONX_MODEL_VERSION', '2')
+    assert not any(cached for _, _, cached in pc.predict_many_cached('http://model', ROWS))
+    assert model == ROWS + ROWS
+
+
+def test_memory_entries_expire_with_the_ttl(model, monkeypatch):
+    pc.predict_many_cached('http://model', ROWS)
+    mongo.db.prediction_cache.delete_many({})  # gone from Mongo (TTL index)
+    clock = pc.time.monotonic() + 3601
+    monkeypatch.setattr(pc.time, 'monotonic', lambda: clock)
+    assert not any(cached for _, _, cached in pc.predict_many_cached('http://model', ROWS))
+    assert model == ROWS + ROWS
@@ -0,0 +1,33 @@
+import pytest
+
+from app.extensions import mongo
+
+
+@pytest.fixture
+def predictions(client, auth):
+    _, headers = auth
+    with client.application.app_context():
+        mongo.db.predictions.delete_many({})
+    for model, tags in (('random_forest_v1', ['Baseline']), ('Gradient_Boost', ['forest-free']), ('linear', [])):
+        resp = client.post('/api/predictions', json={'model': model, 'tags': tags, 'output': 1}, headers=headers)
+        assert resp.status_code == 201
+    return headers
+
+
+def _models(client, headers, **params):
+    resp = client.get('/api/predictions', query_string=params, headers=headers)
+    assert resp.status_code == 200
+    return sorted(p['model'] for p in resp.get_json()['items'])
+
+
+def test_model_filter_matches_a_substring(client, predictions):
+    assert _models(client, predictions, model='forest') == ['random_forest_v1']
+    assert _models(client, predictions, model='BOOST') == ['Gradient_Boost']
+    assert _models(client, predictions, model='.*') == []
+
+
+def test_search_prefix_and_tag_equality(client, predictions):
+    assert _models(client, predictions, search='fore') == ['Gradient_Boost', 'random_forest_v1']
+    assert _models(client, predictions, search='orest') == []
+    assert _models(client, predictions, search='orest', mode='contains') == ['Gradient_Boost', 'random_forest_v1']
+    assert _models(client, predictions, tag='baseline') == ['random_forest_v1']
@@ -0,0 +1,40 @@
+ORIGIN = 'http://localhost:5173'
+
+
+def test_post_revalidates_with_if_none_match(client, auth, active_dataset):
+    _, headers = auth
+    filters = {'yearRange': [2015, 2020]}
+    first = client.post('/api/industry-analysis', json=filters, headers=headers)
+    assert first.status_code == 200 and first.headers['X-Cache'] == 'MISS'
+    etag = first.headers['ETag']
+
+    again = client.post('/api/industry-analysis', json=filters, headers={**headers, 'If-None-Match': etag})
+    assert again.status_code == 304 and again.data == b''
+    other = client.post('/api/industry-analysis', json={'yearRange': [2016, 2020]},
+                        headers={**headers, 'If-None-Match': etag})
+    assert other.status_code == 200 and other.headers['ETag'] != etag
+
+
+def test_get_filters_revalidates_and_cache_hits_repeat_the_body(client, auth, active_dataset):
+    _, headers = auth
+    first = client.get('/api/filters', headers=headers)
+    hit = client.get('/api/filters', headers=headers)
+    assert hit.headers['X-Cache'] == 'HIT' and hit.json == first.json
+    assert client.get('/api/filters', headers={**headers, 'If-None-Match': first.headers['ETag']}).status_code == 304
+
+
+def test_a_new_dataset_version_changes_the_etag(client, auth, active_dataset):
+    _, headers = auth
+    etag = client.post('/api/overview', json={}, headers=headers).headers['ETag']
+    row = active_dataset.head(1).assign(CompanyID=999999).to_dict(orient='records')
+    assert client.post('/api/active-dataset/rows', json={'rows': row}, headers=headers).status_code == 200
+    resp = client.post('/api/overview', json={}, headers={**headers, 'If-None-Match': etag})
+    assert resp.status_code == 200 and resp.headers['ETag'] != etag
+
+
+def test_preflight_allows_if_none_match(client):
+    resp = client.options('/api/overview', headers={
+        'Origin': ORIGIN, 'Access-Control-Request-Method': 'POST',
+        'Access-Control-Request-Headers': 'authorization, content-type, if-none-match',
+    })
+    assert 'if-none-match' in resp.headers['Access-Control-Allow-Headers'].lower()
@@ -0,0 +1,106 @@
+import json
+import os
+import random
+from fractions import Fraction
+
+import pandas as pd
+import pytest
+
+from app.analytics.routes import _dimension_payload, _trends_payload
+from app.services.dataset_schema import ensure_normalized
+from app.services.dataset_store import apply_delta
+from app.services.filter_engine import filter_frame
+from app.services.rollup import METRICS, Rollup
+
+DATASET = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'esg_financial_dataset.csv')
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return ensure_normalized(pd.read_csv(DATASET))
+
+
+def _dump(payload):
+    # repr floats: any difference in the last bit shows up
+    return json.dumps(payload, default=lambda o: o.item() if hasattr(o, 'item') else str(o))
+
+
+def _random_filters(rnd, industries, regions):
+    filters = {}
+    if rnd.random() < 0.7:
+        lo = rnd.randint(2015, 2025)
+        filters['yearRange'] = [lo, rnd.randint(lo, 2025)]
+    if rnd.random() < 0.6:
+        filters['industries'] = rnd.sample(industries, rnd.randint(1, 3))
+    if rnd.random() < 0.6:
+        filters['regions'] = rnd.sample(regions, rnd.randint(1, 3))
+    return filters
+
+
+def test_cube_payloads_match_pandas(frame):
+    cube = Rollup.build(frame)
+    industries = list(frame['Industry'].cat.categories)
+    regions = list(frame['Region'].cat.categories)
+    rnd = random.Random(17)
+    for _ in range(150):
+        filters = _random_filters(rnd, industries, regions)
+        rows = filter_frame(frame, filters)
+        selection = cube.select(filters, rows=lambda: rows)
+        for dimension in ('Industry', 'Region'):
+            assert _dump(_dimension_payload(selection, dimension)) == _dump(_dimension_payload(rows, dimension)), filters
+        assert _dump(_trends_payload(selection)) == _dump(_trends_payload(rows)), filters
+
+
+def _cube_state(cube):
+    """Cell contents keyed by labels, with sums as exact fractions."""
+    state = {}
+    for i, (ind, reg, year) in enumerate(cube.cells.itertuples(index=False)):
+        key = (cube.categories['Industry'][ind] if ind >= 0 else None,
+               cube.categories['Region'][reg] if reg >= 0 else None, year)
+        state[key] = (
+            int(cube.rows[i]),
+            {m: int(cube.counts[m][i]) for m in METRICS},
+            {m: Fraction(int(cube.sums[m].ints[i])) * Fraction(2) ** cube.sums[m].exp for m in METRICS},
+            sorted(cube.categories['CompanyName'][cube.companies[i]]),
+        )
+    return state
+
+
+def _upsert_batch(base):
+    new_key = {'CompanyID': 999999, 'Year': 2024}
+    repeated = [dict(base.iloc[0].to_dict(), **new_key, ESG_Overall=v) for v in (10.0, 20.0, 30.0)]
+    existing = [dict(base.iloc[i].to_dict(), ESG_Overall=99.9) for i in (5, 6, 6)]
+    fresh = [dict(base.iloc[1].to_dict(), CompanyID=999998, Year=2023)]
+    return ensure_normalized(pd.DataFrame(repeated + existing + fresh))
+
+
+@pytest.mark.parametrize('mode', ['upsert', 'append'])
+def test_incremental_cube_matches_rebuild(frame, mode):
+    base = frame.head(3000)
+    patched, replaced, inserted = apply_delta(base, _upsert_batch(base), mode)
+    incremental = Rollup.build(base).apply_delta(added=inserted, removed=replaced, year_dtype=patched['Year'].dtype)
+    rebuilt = Rollup.build(patched)
+    assert int(incremental.rows.sum()) == len(patched)
+    assert _cube_state(incremental) == _cube_state(rebuilt)
+    assert _dump(incremental.select().by_dimension('Industry')) == _dump(rebuilt.select().by_dimension('Industry'))
+
+
+def test_upsert_without_cached_frame_drops_the_cube(client, auth, active_dataset, monkeypatch):
+    from app.services.dataset_cache import dataset_cache
+
+    user_id, headers = auth
+    # Frame too large for the cache (or built by another worker): the replaced rows are unknown
+    monkeypatch.setattr(dataset_cache, 'max_bytes', 0)
+    dataset_cache.invalidate(user_id)
+    assert client.post('/api/industry-analysis', json={}, headers=headers).status_code == 200
+    batch = active_dataset.head(50).assign(ESG_Overall=1.0)
+    batch = pd.concat([batch, batch.tail(1).assign(ESG_Overall=2.0)])
+    resp = client.post('/api/active-dataset/rows', headers=headers, json={
+        'mode': 'upsert', 'rows': json.loads(batch.to_json(orient='records')),
+    })
+    assert resp.status_code == 200 and resp.json['updated'] == 50
+
+    patched = apply_delta(ensure_normalized(active_dataset), ensure_normalized(batch), 'upsert')[0]
+    for path, dimension in (('/api/industry-analysis', 'Industry'), ('/api/regional-insights', 'Region')):
+        served = client.post(path, json={}, headers=headers).json
+        assert served == json.loads(_dump(_dimension_payload(patched, dimension)))
@@ -0,0 +1,13 @@
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.join(os.path.dirname(__file__), '..')
+
+
+def test_create_app_leaves_the_data_stack_unimported():
+    env = dict(os.environ, STARTUP_WARMUP='false', PRELOAD_APP='false')
+    code = ("import sys, app; app.create_app(); "
+            "print(','.join(m for m in ('pandas', 'numpy', 'pyarrow', 'PIL') if m in sys.modules))")
+    out = subprocess.run([sys.executable, '-c', code], cwd=BACKEND, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ''
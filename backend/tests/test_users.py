@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+
+from app.extensions import mongo
+from app.services import users
+from app.services.passwords import hasher
+
+PASSWORD = 'password123'
+
+
+@pytest.fixture
+def user(app):
+    with app.app_context():
+        doc = {'email': 'ops@esg.local', 'password_hash': hasher.hash(PASSWORD), 'full_name': 'Ops',
+               'is_verified': True, 'created_at': datetime.utcnow()}
+        doc['_id'] = mongo.db.users.insert_one(doc).inserted_id
+    yield doc
+    users.invalidate(doc['_id'])
+
+
+def _ops(resp):
+    return int(resp.headers['X-Mongo-Ops'])
+
+
+def _login(client):
+    resp = client.post('/api/auth/login', json={'email': 'ops@esg.local', 'password': PASSWORD})
+    assert resp.status_code == 200
+    return resp, {'Authorization': f"Bearer {resp.json['token']}"}
+
+
+def test_login_reads_credentials_and_writes_last_login(client, user):
+    resp, _ = _login(client)
+    # find_one for the hash, then find_one_and_update returning the profile
+    assert _ops(resp) == 2
+    assert resp.json['user']['full_name'] == 'Ops'
+
+
+def test_me_is_served_from_the_profile_cache(client, user):
+    _, headers = _login(client)
+    users.invalidate(user['_id'])
+
+    miss = client.get('/api/auth/me', headers=headers)
+    assert _ops(miss) == 1
+    hit = client.get('/api/auth/me', headers=headers)
+    assert _ops(hit) == 0
+    assert hit.json == miss.json
+
+
+def test_profile_update_refreshes_the_cache(client, user):
+    _, headers = _login(client)
+
+    resp = client.put('/api/auth/me', json={'full_name': 'Renamed'}, headers=headers)
+    assert _ops(resp) == 1
+    assert resp.json['user']['full_name'] == 'Renamed'
+
+    me = client.get('/api/auth/me', headers=headers)
+    assert _ops(me) == 0
+    assert me.json['user']['full_name'] == 'Renamed'
+
+
+def test_credential_writes_drop_the_cached_profile(client, app, user):
+    _, headers = _login(client)
+    with app.app_context():
+        users.update(user['_id'], {'$set': {'verify_otp': '123456'}})
+
+    me = client.get('/api/auth/me', headers=headers)
+    assert _ops(me) == 1
+    assert 'verify_otp' not in me.json['user']
@@ -4,6 +4,7 @@ import { Menu, X, Infinity } from 'lucide-react'
 import { cn } from '../utils/cn'
 import DevStatus from './DevStatus'
 import { useAuth } from '../auth/AuthContext'
+import { avatarUrl } from '../utils/api'
 
 const Navbar = () => {
   const [mobileMenuOpen, setMobileMenuOpen] = useState(false)
@@ -82,7 +83,7 @@ const Navbar = () => {
                     aria-label="Open profile menu"
                   >
                     {user?.avatar ? (
-                      <img src={user.avatar} alt="avatar" className="w-full h-full object-cover" />
+                      <img src={avatarUrl(user.avatar, 64)} alt="avatar" className="w-full h-full object-cover" />
                     ) : (
                       (user?.full_name?.[0] || user?.email?.[0] || 'U').toUpperCase()
                     )}
@@ -1,6 +1,6 @@
 import { useEffect, useState, useRef } from 'react'
 import { useNavigate } from 'react-router-dom'
-import { api } from '../utils/api'
+import { api, avatarUrl } from '../utils/api'
 import { useAuth } from '../auth/AuthContext'
 import { FiUser, FiMail, FiPhone, FiBriefcase, FiDownload, FiSettings, FiFileText, FiCamera, FiTrash2, FiCheckCircle, FiCalendar } from 'react-icons/fi'
 
@@ -157,7 +157,7 @@ export default function Profile() {
               <div className="flex items-start gap-6">
                 <div className="relative">
                   <div className="w-24 h-24 rounded-full bg-primary-600/80 flex items-center justify-center text-white text-3xl font-bold overflow-hidden">
-                    {me.avatar ? <img src={me.avatar} alt="avatar" className="w-full h-full object-cover" /> : (me.full_name?.[0] || me.email?.[0] || 'U').toUpperCase()}
+                    {me.avatar ? <img src={avatarUrl(me.avatar, 256)} alt="avatar" className="w-full h-full object-cover" /> : (me.full_name?.[0] || me.email?.[0] || 'U').toUpperCase()}
                   </div>
                   <input ref={fileRef} type="file" accept="image/*" onChange={handleAvatarUpload} className="hidden" />
                   <button onClick={() => fileRef.current?.click()} disabled={avatarLoading} className="absolute bottom-0 right-0 p-1.5 bg-primary-600 hover:bg-primary-500 rounded-full text-white disabled:opacity-50"><FiCamera className="h-4 w-4"/></button>
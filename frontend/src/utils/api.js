@@ -34,6 +34,34 @@ apiClient.interceptors.response.use(
   }
 )
 
+// Analytics POSTs answer If-None-Match with 304, but browsers never revalidate POST responses
+// themselves: keep the last ETag and body per endpoint + request body and send it back
+const ETAG_ENTRIES = 50
+const etagCache = new Map()
+
+const cachedPost = async (url, body = {}) => {
+  const key = `${url} ${JSON.stringify(body)}`
+  const hit = etagCache.get(key)
+  const res = await apiClient.post(url, body, {
+    headers: hit ? { 'If-None-Match': hit.etag } : {},
+    validateStatus: (status) => (status >= 200 && status < 300) || (status === 304 && !!hit),
+  })
+  etagCache.delete(key)
+  if (res.status === 304) {
+    etagCache.set(key, hit)
+    return hit.data
+  }
+  const etag = res.headers.etag
+  if (etag) {
+    etagCache.set(key, { etag, data: res.data })
+    if (etagCache.size > ETAG_ENTRIES) etagCache.delete(etagCache.keys().next().value)
+  }
+  return res.data
+}
+
+// Avatar paths from the API are content-hashed; resolve against the API host and pick a thumbnail size
+export const avatarUrl = (path, size) => (path ? `${API_BASE_URL}${path}${size ? `?size=${size}` : ''}` : null)
+
 export const api = {
   // Auth endpoints
   auth: {
@@ -135,6 +163,21 @@ export const api = {
       const res = await apiClient.post('/api/upload-dataset', { filename, data, columns })
       return res.data
     },
+    uploadDatasetFile: async (file) => {
+      const form = new FormData()
+      form.append('file', file)
+      const res = await apiClient.post('/api/upload-dataset/file', form, {
+        headers: { 'Content-Type': 'multipart/form-data' },
+        timeout: 0,
+      })
+      return res.data
+    },
+    // mode: 'append' or 'upsert' (matched on CompanyID + Year); uploadId omitted = active dataset
+    patchDatasetRows: async (rows, mode = 'append', uploadId = null) => {
+      const url = uploadId ? `/api/uploads/${uploadId}/rows` : '/api/active-dataset/rows'
+      const res = await apiClient.post(url, { rows, mode })
+      return res.data
+    },
     listUploads: async (params = {}) => {
       const res = await apiClient.get('/api/uploads', { params })
       return res.data
@@ -201,40 +244,25 @@ export const api = {
   },
 
   // Get overview metrics
-  getOverview: async (filters) => {
-    const response = await apiClient.post('/api/overview', filters)
-    return response.data
-  },
+  getOverview: (filters) => cachedPost('/api/overview', filters),
 
   // Get top performers
-  getTopPerformers: async (filters) => {
-    const response = await apiClient.post('/api/top-performers', filters)
-    return response.data
-  },
+  getTopPerformers: (filters) => cachedPost('/api/top-performers', filters),
 
   // Get industry analysis
-  getIndustryAnalysis: async (filters) => {
-    const response = await apiClient.post('/api/industry-analysis', filters)
-    return response.data
-  },
+  getIndustryAnalysis: (filters) => cachedPost('/api/industry-analysis', filters),
 
   // Get regional insights
-  getRegionalInsights: async (filters) => {
-    const response = await apiClient.post('/api/regional-insights', filters)
-    return response.data
-  },
+  getRegionalInsights: (filters) => cachedPost('/api/regional-insights', filters),
 
   // Get trends over time
-  getTrends: async (filters) => {
-    const response = await apiClient.post('/api/trends', filters)
-    return response.data
-  },
+  getTrends: (filters) => cachedPost('/api/trends', filters),
 
   // Get correlations
-  getCorrelations: async (filters) => {
-    const response = await apiClient.post('/api/correlations', filters)
-    return response.data
-  },
+  getCorrelations: (filters) => cachedPost('/api/correlations', filters),
+
+  // Get several dashboard panels (overview, top-performers, ...) in one filtered pass
+  getDashboard: (filters, panels) => cachedPost('/api/dashboard', { ...filters, panels }),
 
   // Export data
   exportData: async (filters) => {